@@ -45,6 +45,13 @@ def create_app():
     app.config['SQLALCHEMY_DATABASE_URI'] = database_uri
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
     
+    # 報表依此時區換算交易時間 (資料庫中的交易時間為 UTC)
+    app.config['REPORT_TIMEZONE'] = os.getenv('REPORT_TIMEZONE', 'Asia/Taipei')
+    # 查詢區間超過這個天數的報表改由 RQ 背景任務產生
+    app.config['REPORT_JOB_THRESHOLD_DAYS'] = int(os.getenv('REPORT_JOB_THRESHOLD_DAYS', '366'))
+    # 常駐 WeasyPrint 轉檔行程數；設為 0 時在目前的行程中轉檔
+    app.config['PDF_RENDER_WORKERS'] = int(os.getenv('PDF_RENDER_WORKERS', '2'))
+
     app.config['REDIS_URL'] = os.getenv('REDIS_URL', 'redis://')
     app.redis = Redis.from_url(app.config['REDIS_URL'])
     app.task_queue = rq.Queue('cashier-tasks', connection=app.redis)
@@ -71,8 +78,10 @@ def create_app():
     from . import models
     from . import auth_commands
     from . import backup_commands
+    from . import report_commands
     auth_commands.init_app(app)
     backup_commands.init_app(app)
+    report_commands.init_app(app)
 
 
     return app
\ No newline at end of file
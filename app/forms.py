@@ -76,6 +76,7 @@ class ReportQueryForm(FlaskForm):
         ('product_mix', '產品類別銷售分析'),
         ('sales_trend', '銷售趨勢報告'),
         ('peak_hours', '時段銷售分析'),
+        ('weekday_hours', '星期時段熱度分析'),
         ('periodic_performance', '週期性業績分析')
     ], validators=[DataRequired()])
     
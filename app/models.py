@@ -124,6 +124,7 @@ class BusinessDay(db.Model):
     signature_reviewer = db.Column(db.Text, nullable=True)
     signature_cashier = db.Column(db.Text, nullable=True)
     transactions = db.relationship('Transaction', backref='business_day', lazy=True, cascade="all, delete-orphan")
+    category_totals = db.relationship('BusinessDayCategoryTotal', back_populates='business_day', lazy=True, cascade="all, delete-orphan")
     updated_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc), onupdate=lambda: datetime.now(timezone.utc))
     
     next_day_opening_cash = db.Column(db.Float, nullable=True)
@@ -133,6 +134,8 @@ class BusinessDay(db.Model):
 
 class Transaction(db.Model):
     """交易紀錄模型"""
+    # 交易細節報表以 (timestamp, id) 游標分頁
+    __table_args__ = (db.Index('ix_transaction_timestamp_id', 'timestamp', 'id'),)
     id = db.Column(db.Integer, primary_key=True)
     timestamp = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
     amount = db.Column(db.Float, nullable=False)
@@ -143,6 +146,8 @@ class Transaction(db.Model):
     cash_received = db.Column(db.Float, nullable=True)
     change_given = db.Column(db.Float, nullable=True)
     discounts = db.Column(db.Text, nullable=True)
+    # 前端產生的冪等鍵，重送同一筆交易時用來辨識重複
+    idempotency_key = db.Column(db.String(64), unique=True, nullable=True, index=True)
 
     def __repr__(self):
         return f'<Transaction {self.id} - Amount: {self.amount}>'
@@ -159,6 +164,73 @@ class TransactionItem(db.Model):
     def __repr__(self):
         return f'<TransactionItem {self.id} - Price: {self.price}>'
 
+class BusinessDayCategoryTotal(db.Model):
+    """營業日各類別的銷售彙總，由結帳與交易修改時增量維護，供類別相關報表查詢"""
+    __tablename__ = 'business_day_category_totals'
+    business_day_id = db.Column(db.Integer, db.ForeignKey('business_day.id'), primary_key=True)
+    category_id = db.Column(db.Integer, db.ForeignKey('category.id'), primary_key=True, index=True)
+    item_count = db.Column(db.Integer, nullable=False, default=0) # 金額大於 0 的品項數
+    gross = db.Column(db.Float, nullable=False, default=0.0) # 金額大於 0 的品項合計
+    discount = db.Column(db.Float, nullable=False, default=0.0) # 金額小於 0 的品項合計 (以正數儲存)
+    business_day = db.relationship('BusinessDay', back_populates='category_totals')
+    category = db.relationship('Category')
+
+    def __repr__(self):
+        return f'<BusinessDayCategoryTotal {self.business_day_id}/{self.category_id}>'
+
+class TransactionHourlyTotal(db.Model):
+    """各據點每個營業日、每小時 (當地時間) 的交易彙總，由結帳時增量維護，供時段分析報表查詢"""
+    __tablename__ = 'transaction_hourly_totals'
+    location_id = db.Column(db.Integer, db.ForeignKey('location.id'), primary_key=True)
+    business_date = db.Column(db.Date, primary_key=True, index=True)
+    hour = db.Column(db.Integer, primary_key=True) # 當地時間 0-23 時
+    weekday = db.Column(db.Integer, nullable=False) # 營業日的星期，0 為星期一
+    transaction_count = db.Column(db.Integer, nullable=False, default=0)
+    total_sales = db.Column(db.Float, nullable=False, default=0.0)
+
+    def __repr__(self):
+        return f'<TransactionHourlyTotal {self.location_id}/{self.business_date} {self.hour}h>'
+
+class MonthlyLocationTotal(db.Model):
+    """各據點每月已歸檔營業日的彙總，於歸檔與修改報表時重算，供每月數據與雲端同步使用"""
+    __tablename__ = 'monthly_location_totals'
+    location_id = db.Column(db.Integer, db.ForeignKey('location.id'), primary_key=True)
+    year = db.Column(db.Integer, primary_key=True)
+    month = db.Column(db.Integer, primary_key=True)
+    day_count = db.Column(db.Integer, nullable=False, default=0) # 已歸檔的營業日數
+    total_sales = db.Column(db.Float, nullable=False, default=0.0)
+    cash_diff = db.Column(db.Float, nullable=False, default=0.0)
+    total_transactions = db.Column(db.Integer, nullable=False, default=0)
+    total_items = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f'<MonthlyLocationTotal {self.location_id}/{self.year}-{self.month:02d}>'
+
+class SheetSyncState(db.Model):
+    """Google Sheets 各據點、各工作表的同步進度，增量同步時只寫入新增與修改過的資料列"""
+    __tablename__ = 'sheet_sync_state'
+    __table_args__ = (db.UniqueConstraint('location_id', 'year', 'spreadsheet_id', 'sheet_name'),)
+    id = db.Column(db.Integer, primary_key=True)
+    location_id = db.Column(db.Integer, db.ForeignKey('location.id'), nullable=False)
+    year = db.Column(db.Integer, nullable=False) # 同步的營業日年度，每個年度寫入該年度的試算表
+    spreadsheet_id = db.Column(db.String(100), nullable=False)
+    sheet_name = db.Column(db.String(100), nullable=False)
+    last_synced_id = db.Column(db.Integer, nullable=True) # 已同步的最大營業日 id 或交易 id
+    synced_at = db.Column(db.DateTime, nullable=True) # 上次同步開始的時間，之後修改過的營業日需要更新
+    row_count = db.Column(db.Integer, nullable=False, default=0) # 工作表已使用的列數 (含標題列)
+    rows = db.relationship('SheetSyncRow', back_populates='state', lazy=True, cascade="all, delete-orphan")
+
+    def __repr__(self):
+        return f'<SheetSyncState {self.location_id}/{self.year}/{self.sheet_name}>'
+
+class SheetSyncRow(db.Model):
+    """同步到工作表的每一筆資料所在的列號，修改過的資料可以直接更新該列"""
+    __tablename__ = 'sheet_sync_rows'
+    state_id = db.Column(db.Integer, db.ForeignKey('sheet_sync_state.id'), primary_key=True)
+    row_key = db.Column(db.String(50), primary_key=True) # 營業日 id、交易 id 或月份 (YYYY-MM)
+    row_number = db.Column(db.Integer, nullable=False)
+    state = db.relationship('SheetSyncState', back_populates='rows')
+
 class DailySettlement(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     date = db.Column(db.Date, nullable=False, unique=True)
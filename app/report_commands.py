@@ -0,0 +1,75 @@
+# app/report_commands.py
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from .services.category_totals_service import backfill_category_totals
+from .services.hourly_totals_service import backfill_hourly_totals
+from .services.monthly_totals_service import backfill_monthly_totals
+from .services.parquet_export_service import write_monthly_partitions
+from .services.pdf_service import prerender_range
+
+@click.group(name='report', help="報表彙總資料相關指令")
+def report_cli():
+    pass
+
+@report_cli.command("backfill-category-totals")
+@click.option('--batch-size', default=500, show_default=True, help="每次重建並 commit 的營業日數量")
+@with_appcontext
+def backfill_category_totals_command(batch_size):
+    """依歷史交易重建所有營業日的類別銷售彙總"""
+    def progress(done, total):
+        click.echo(f"已處理 {done}/{total} 個營業日...")
+
+    total = backfill_category_totals(batch_size=batch_size, progress=progress)
+    click.echo(f"類別銷售彙總重建完成，共 {total} 個營業日。")
+
+@report_cli.command("backfill-hourly-totals")
+@click.option('--batch-size', default=500, show_default=True, help="每次重建並 commit 的營業日數量")
+@with_appcontext
+def backfill_hourly_totals_command(batch_size):
+    """依歷史交易重建所有營業日的每小時交易彙總"""
+    def progress(done, total):
+        click.echo(f"已處理 {done}/{total} 個營業日...")
+
+    total = backfill_hourly_totals(batch_size=batch_size, progress=progress)
+    click.echo(f"每小時交易彙總重建完成，共 {total} 個營業日。")
+
+@report_cli.command("backfill-monthly-totals")
+@click.option('--batch-size', default=24, show_default=True, help="每次重建並 commit 的 (據點, 月份) 數量")
+@with_appcontext
+def backfill_monthly_totals_command(batch_size):
+    """依歷史營業日重建所有據點的每月彙總"""
+    def progress(done, total):
+        click.echo(f"已處理 {done}/{total} 個月份...")
+
+    total = backfill_monthly_totals(batch_size=batch_size, progress=progress)
+    click.echo(f"每月彙總重建完成，共 {total} 個 (據點, 月份)。")
+
+@report_cli.command("export-parquet")
+@click.argument("output_dir", type=click.Path(file_okay=False))
+@click.option('--start', 'start_date', required=True, type=click.DateTime(formats=['%Y-%m-%d']), help="開始日期 (YYYY-MM-DD)")
+@click.option('--end', 'end_date', required=True, type=click.DateTime(formats=['%Y-%m-%d']), help="結束日期 (YYYY-MM-DD)")
+@click.option('--location-id', default='all', show_default=True, help="只匯出指定據點的資料")
+@with_appcontext
+def export_parquet_command(output_dir, start_date, end_date, location_id):
+    """將交易品項明細依月份分區匯出為 Parquet 檔 (OUTPUT_DIR/month=YYYY-MM/line_items.parquet)"""
+    written = write_monthly_partitions(output_dir, start_date.date(), end_date.date(), location_id)
+    for path, rows in written:
+        click.echo(f"{path}: {rows} 筆")
+    click.echo(f"匯出完成，共 {len(written)} 個月份、{sum(rows for _, rows in written)} 筆交易品項。")
+
+@report_cli.command("render-pdfs")
+@click.option('--start', 'start_date', required=True, type=click.DateTime(formats=['%Y-%m-%d']), help="開始日期 (YYYY-MM-DD)")
+@click.option('--end', 'end_date', required=True, type=click.DateTime(formats=['%Y-%m-%d']), help="結束日期 (YYYY-MM-DD)")
+@with_appcontext
+def render_pdfs_command(start_date, end_date):
+    """預先產生日期區間內已歸檔營業日報表與總結算的 PDF，由轉檔行程池平行處理"""
+    app = current_app._get_current_object()
+    # 模板中的 url_for 需要請求情境
+    with app.test_request_context():
+        total = prerender_range(start_date.date(), end_date.date())
+    click.echo(f"PDF 產生完成，共 {total} 份報表。")
+
+def init_app(app):
+    """在 App 中註冊指令"""
+    app.cli.add_command(report_cli)
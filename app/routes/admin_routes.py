@@ -18,11 +18,17 @@ from .. import db, login_manager, csrf
 from ..forms import LoginForm, StartDayForm, CloseDayForm, ConfirmReportForm, GoogleSettingsForm, LocationForm, UserForm, RoleForm, CategoryForm, ReportQueryForm
 from datetime import date, datetime
 from ..services import google_service
+from ..services.category_service import invalidate_catalog
+from ..services.business_day_service import invalidate_open_days
+from ..services.report_cache_service import invalidate_report_days, invalidate_all_reports
+from ..services.pdf_service import enqueue_pdf_refresh
+from ..services.monthly_totals_service import rebuild_monthly_totals
+from ..services.sheet_sync_service import request_sheet_sync
+from ..services.reference_data_service import location_choices, invalidate_reference_data
 from sqlalchemy.orm import contains_eager
 from sqlalchemy import and_
 from sqlalchemy.exc import IntegrityError # 新增此行
 from ..decorators import admin_required
-from weasyprint import HTML
 from sqlalchemy.sql import func
 from sqlalchemy import case
 
@@ -50,6 +56,7 @@ def add_location():
         new_location = Location(name=form.name.data, slug=form.slug.data)
         db.session.add(new_location)
         db.session.commit()
+        invalidate_reference_data()
         flash('據點已新增', 'success')
         return redirect(url_for('admin.list_locations'))
     return render_template('admin/location_form.html', form=form, form_title='新增據點')
@@ -61,6 +68,9 @@ def edit_location(location_id):
     if form.validate_on_submit():
         form.populate_obj(location)
         db.session.commit()
+        invalidate_open_days()
+        invalidate_reference_data()
+        invalidate_all_reports()
         flash('據點已更新', 'success')
         return redirect(url_for('admin.list_locations'))
     return render_template('admin/location_form.html', form=form, form_title='編輯據點')
@@ -73,6 +83,9 @@ def delete_location(location_id):
         return redirect(url_for('admin.list_locations'))
     db.session.delete(location)
     db.session.commit()
+    invalidate_catalog(location_id)
+    invalidate_open_days()
+    invalidate_reference_data()
     flash('據點已刪除', 'success')
     return redirect(url_for('admin.list_locations'))
 
@@ -146,6 +159,9 @@ def list_categories(location_id):
                     db.session.add(new_category)
             
             db.session.commit()
+            invalidate_catalog(location.id)
+            invalidate_all_reports()
+            invalidate_reference_data()
             flash('所有變更已成功儲存！', 'success')
         except Exception as e:
             db.session.rollback()
@@ -185,6 +201,8 @@ def add_category(location_id):
         get_category_form_data(form, new_category)
         db.session.add(new_category)
         db.session.commit()
+        invalidate_catalog(location.id)
+        invalidate_reference_data()
         flash(f'類別 "{new_category.name}" 已成功新增。', 'success')
         return redirect(url_for('admin.list_categories', location_id=location.id))
     return render_template('admin/category_form.html', form=form, form_title='新增商品類別', location=location)
@@ -198,6 +216,9 @@ def edit_category(category_id):
     if form.validate_on_submit():
         get_category_form_data(form, category)
         db.session.commit()
+        invalidate_catalog(location.id)
+        invalidate_all_reports()
+        invalidate_reference_data()
         flash(f'類別 "{category.name}" 已更新。', 'success')
         return redirect(url_for('admin.list_categories', location_id=location.id))
     
@@ -226,6 +247,9 @@ def delete_category(category_id):
     try:
         db.session.delete(category)
         db.session.commit()
+        invalidate_catalog(location_id)
+        invalidate_reference_data()
+        invalidate_all_reports()
         flash('類別已刪除。', 'success')
     except Exception as e:
         db.session.rollback()
@@ -348,6 +372,8 @@ def force_close_day(business_day_id):
             business_day.cash_breakdown = json.dumps(cash_breakdown)
             business_day.status = "PENDING_REPORT"
             db.session.commit()
+            invalidate_open_days()
+            invalidate_report_days([(business_day.location_id, business_day.date)])
             flash(f"已為據點 {business_day.location.name} 完成日結盤點！請前往審核報表。", "success")
             # 修正點：在重定向時傳遞營業日的日期
             return redirect(url_for('cashier.daily_report', location_slug=business_day.location.slug, date=business_day.date.isoformat()))
@@ -404,7 +430,11 @@ def new_force_close_day():
                 status="CLOSED" # 補登後直接將狀態設為 CLOSED
             )
             db.session.add(new_business_day)
+            rebuild_monthly_totals([(location.id, target_date)])
             db.session.commit()
+            invalidate_report_days([(location.id, target_date)])
+            enqueue_pdf_refresh([(location.id, target_date)])
+            request_sheet_sync([(location.id, target_date)])
             flash(f"已為據點 {location.name} 補登 {target_date.strftime('%Y-%m-%d')} 日結報表並歸檔。", "success")
             return redirect(url_for('cashier.daily_report', location_slug=location.slug, date=target_date.isoformat()))
         except Exception as e:
@@ -422,7 +452,7 @@ def new_force_close_day():
 @bp.route('/force_close_query', methods=['GET'])
 def force_close_query():
     form = ReportQueryForm()
-    form.location_id.choices = [('all', '所有據點')] + [(str(l.id), l.name) for l in Location.query.order_by(Location.id).all()]
+    form.location_id.choices = location_choices()
     
     results = []
     if request.args:
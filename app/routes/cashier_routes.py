@@ -1,6 +1,7 @@
 # app/routes/cashier_routes.py
 import os
 import json
+import math
 from flask import (
     render_template,
     request,
@@ -10,23 +11,38 @@ from flask import (
     Blueprint,
     jsonify,
     current_app,
-    Response
+    Response,
+    send_file,
+    abort
 )
 from flask_login import login_user, logout_user, login_required, current_user
 from ..models import User, BusinessDay, Transaction, Location, SystemSetting, Category, TransactionItem
 from .. import db, login_manager, csrf
 from ..forms import LoginForm, StartDayForm, CloseDayForm, ConfirmReportForm, GoogleSettingsForm
-from datetime import date, datetime
+from datetime import date, datetime, timezone
 from ..services import google_service, backup_service
+from ..services.category_service import get_catalog, SALES_CATEGORY_TYPES
+from ..services.cache_service import remember_response, recall_response
+from ..services.business_day_service import resolve_open_day, invalidate_open_days
+from ..services.report_cache_service import invalidate_report_days, invalidate_calendar_days
+from ..services.pdf_service import daily_report_html, daily_report_pdf, render_pdf, enqueue_pdf_refresh
+from ..services.sheet_sync_service import request_sheet_sync
+from ..services.category_totals_service import add_item_totals
+from ..services.hourly_totals_service import add_hourly_totals
+from ..services.monthly_totals_service import rebuild_monthly_totals
+from ..services.income_service import other_income_breakdown, other_income_for_day
 from sqlalchemy.orm import contains_eager
-from sqlalchemy import and_
+from sqlalchemy import and_, update, select
+from sqlalchemy.exc import IntegrityError
 from ..decorators import admin_required
-from weasyprint import HTML
 from sqlalchemy.sql import func
 from sqlalchemy import case
 
 bp = Blueprint("cashier", __name__, url_prefix="/cashier")
 
+# 重送交易的回應在 Redis 中保留的秒數
+IDEMPOTENCY_TTL_SECONDS = 600
+
 
 @login_manager.user_loader
 def load_user(user_id):
@@ -57,27 +73,14 @@ def dashboard():
         .all()
     )
     locations_status = {}
+    # 修正點：動態計算捐款與其他收入總額 (所有據點一次查詢)
+    income_by_day = other_income_breakdown(bd.id for location in locations for bd in location.business_days)
     for location in locations:
         business_day = next(iter(location.business_days), None)
         status_info = {}
-        # 修正點：動態計算捐款與其他收入總額
-        donation_total = 0
-        other_total = 0
         total_sales_with_income = business_day.total_sales if business_day else 0
         if business_day:
-            other_income_totals = db.session.query(
-                Category.name,
-                func.sum(TransactionItem.price)
-            ).join(TransactionItem.transaction).join(Transaction.business_day).join(TransactionItem.category).filter(
-                BusinessDay.id == business_day.id,
-                Category.category_type == 'other_income'
-            ).group_by(Category.name).all()
-            for name, total in other_income_totals:
-                total_sales_with_income += total
-                if name == '捐款':
-                    donation_total = total
-                else:
-                    other_total += total
+            total_sales_with_income += sum(income_by_day[business_day.id])
 
         if business_day is None:
             status_info = {"business_day_id": None, "status_text": "尚未開帳", "message": "點擊以開始本日營業作業。",
@@ -191,9 +194,9 @@ def rebuild_backup():
     overwrite = request.form.get('overwrite') == 'on'
 
     current_app.task_queue.enqueue(
-        'app.services.google_service.rebuild_backup_task',
+        'app.services.google_service.sync_backup_task',
         args=(overwrite,),
-        job_timeout='30m'
+        job_timeout='30m' if overwrite else '10m'
     )
 
     flash('已成功提交完整備份請求！備份將在背景執行，請稍後至 Google Drive 查閱結果。', 'info')
@@ -229,6 +232,8 @@ def start_day(location_slug):
             date=today, location=location, location_notes=form.location_notes.data, status="OPEN", opening_cash=form.opening_cash.data)
         db.session.add(new_business_day)
         db.session.commit()
+        invalidate_open_days()
+        invalidate_calendar_days([today])
         flash(f'據點 "{location.name}" 開店成功！現在可以開始記錄交易。', "success")
         return redirect(url_for("cashier.pos", location_slug=location.slug))
     return render_template("cashier/start_day_form.html", location=location, today_date=today.strftime("%Y-%m-%d"), form=form)
@@ -237,36 +242,21 @@ def start_day(location_slug):
 @bp.route("/pos/<location_slug>")
 @login_required
 def pos(location_slug):
-    location = Location.query.filter_by(slug=location_slug).first_or_404()
     today = date.today()
-    business_day = BusinessDay.query.filter_by(
-        date=today, location_id=location.id, status="OPEN").first()
-    if not business_day:
+    open_day = resolve_open_day(location_slug, today)
+    business_day = db.session.get(BusinessDay, open_day.business_day_id) if open_day else None
+    if not business_day or business_day.status != "OPEN":
+        if open_day:
+            invalidate_open_days()
+        location = Location.query.filter_by(slug=location_slug).first_or_404()
         flash(f'據點 "{location.name}" 今日尚未開店營業。', "warning")
         return redirect(url_for("cashier.dashboard"))
+    location = open_day.location
 
-    categories = Category.query.filter_by(
-        location_id=location.id).order_by(Category.id).all()
+    categories = list(get_catalog(location.id).values())
 
     # 修正點：從交易紀錄中動態計算其他收入總額
-    from sqlalchemy.sql import func
-    from sqlalchemy import case
-
-    other_income_totals = db.session.query(
-        Category.name,
-        func.sum(TransactionItem.price)
-    ).join(TransactionItem.transaction).join(Transaction.business_day).join(TransactionItem.category).filter(
-        BusinessDay.id == business_day.id,
-        Category.category_type == 'other_income'
-    ).group_by(Category.name).all()
-
-    donation_total = 0
-    other_total = 0
-    for name, total in other_income_totals:
-        if name == '捐款':
-            donation_total = total
-        else:
-            other_total += total
+    donation_total, other_total = other_income_for_day(business_day.id)
 
     return render_template("cashier/pos.html",
                            location=location,
@@ -277,6 +267,132 @@ def pos(location_slug):
                            other_total=other_total)
 
 
+def _parse_client_timestamp(value):
+    """將前端離線佇列帶來的 ISO 時間字串轉為 UTC naive datetime；格式錯誤時回傳 None。"""
+    if not value:
+        return None
+    try:
+        parsed = datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        return None
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+
+def _validate_items(items, catalog):
+    """檢查交易品項：須為非空的清單，每個品項的金額為數字、類別為此據點存在的類別 id。
+
+    通過時將 category_id 統一轉為整數並回傳 None，否則回傳錯誤訊息。
+    """
+    if not isinstance(items, list) or not items:
+        return "交易內容不可為空"
+    for item in items:
+        if not isinstance(item, dict):
+            return "品項格式錯誤"
+        price = item.get('price')
+        if isinstance(price, bool) or not isinstance(price, (int, float)) or not math.isfinite(price):
+            return "品項金額必須為數字"
+        category_id = item.get('category_id')
+        if isinstance(category_id, str) and category_id.isdigit():
+            category_id = int(category_id)
+        if isinstance(category_id, bool) or not isinstance(category_id, int) or category_id not in catalog:
+            return "品項類別不存在"
+        item['category_id'] = category_id
+    return None
+
+
+def _sales_figures(items, catalog):
+    """交易品項計入營收的金額與商品件數。"""
+    # 修正點：分開計算銷售額和項目總數。
+    # total_sales 是指所有 product 的金額總和，discounts 是指所有 discount 的金額總和。
+    # 應為 (總銷售額) = (所有商品金額) - (所有折扣金額)
+    total_sales_amount = 0
+    total_items_count = 0
+    for item in items:
+        category = catalog.get(item['category_id'])
+        if category and category.category_type in SALES_CATEGORY_TYPES:
+            total_sales_amount += item['price']
+        if category and category.category_type == 'product':
+            total_items_count += 1
+    return total_sales_amount, total_items_count
+
+
+def _add_transaction(business_day_id, catalog, payload):
+    """將一筆交易與其品項加入 session (不 commit)，回傳 (交易, 計入營收的金額, 商品件數)。品項須先經 _validate_items 檢查。"""
+    items = payload.get("items", [])
+    total_amount = sum(item['price'] for item in items)
+    total_sales_amount, total_items_count = _sales_figures(items, catalog)
+
+    # 修正點：交易總額直接使用 total_amount，而不是重新計算
+    new_transaction = Transaction(
+        amount=total_amount,
+        item_count=len(items),
+        business_day_id=business_day_id,
+        cash_received=payload.get("cash_received"),
+        change_given=payload.get("change_given"),
+        idempotency_key=payload.get("idempotency_key")
+    )
+    # 先決定交易時間，結帳當下即可據此累加每小時彙總
+    new_transaction.timestamp = _parse_client_timestamp(payload.get("timestamp")) or datetime.now(timezone.utc).replace(tzinfo=None)
+    db.session.add(new_transaction)
+
+    for item in items:
+        transaction_item = TransactionItem(
+            price=item['price'],
+            category_id=item['category_id'],
+            transaction=new_transaction
+        )
+        db.session.add(transaction_item)
+
+    return new_transaction, total_sales_amount, total_items_count
+
+
+def _increment_day_totals(business_day_id, sales_amount, items_count, transactions_count):
+    """以單一 UPDATE 在資料庫端累加營業日的即時業績，回傳更新後的 (total_sales, total_items, total_transactions)。
+
+    不經由 ORM 物件讀改寫，多個收銀台同時結帳也不會互相覆蓋；支援 RETURNING 的資料庫
+    (PostgreSQL、SQLite 3.35+) 會直接由同一個陳述式取回新數值。營業日已非營業中狀態時回傳 None。
+    """
+    totals_columns = (BusinessDay.total_sales, BusinessDay.total_items, BusinessDay.total_transactions)
+    stmt = (
+        update(BusinessDay)
+        .where(BusinessDay.id == business_day_id, BusinessDay.status == "OPEN")
+        .values(
+            total_sales=func.coalesce(BusinessDay.total_sales, 0) + float(sales_amount),
+            total_items=func.coalesce(BusinessDay.total_items, 0) + items_count,
+            total_transactions=func.coalesce(BusinessDay.total_transactions, 0) + transactions_count,
+        )
+        .execution_options(synchronize_session=False)
+    )
+    if db.session.get_bind().dialect.update_returning:
+        return db.session.execute(stmt.returning(*totals_columns)).first()
+    if db.session.execute(stmt).rowcount == 0:
+        return None
+    return db.session.execute(select(*totals_columns).where(BusinessDay.id == business_day_id)).one()
+
+
+def _day_totals_response(business_day_id, totals):
+    donation_total, other_total = other_income_for_day(business_day_id)
+    return {
+        "success": True,
+        "total_sales": totals.total_sales,
+        "total_items": totals.total_items,
+        "total_transactions": totals.total_transactions,
+        "donation_total": donation_total,
+        "other_total": other_total,
+    }
+
+
+def _duplicate_transaction_response(idempotency_key):
+    """若冪等鍵已寫入過，回傳該營業日目前的累計數字；否則回傳 None。"""
+    existing = Transaction.query.filter_by(idempotency_key=idempotency_key).first()
+    if not existing:
+        return None
+    business_day = existing.business_day
+    return dict(_day_totals_response(business_day.id, business_day), duplicate=True)
+
+
 @bp.route("/record_transaction", methods=["POST"])
 @csrf.exempt
 @login_required
@@ -286,100 +402,197 @@ def record_transaction():
     items = data.get("items", [])
     today = date.today()
 
-    cash_received = data.get("cash_received")
-    change_given = data.get("change_given")
-
     if not items:
         return jsonify({"success": False, "error": "交易內容不可為空"}), 400
 
+    idempotency_key = data.get("idempotency_key")
+    if idempotency_key is None:
+        idempotency_key = request.headers.get("Idempotency-Key")
+    if idempotency_key is not None and not isinstance(idempotency_key, str):
+        return jsonify({"success": False, "error": "冪等鍵格式錯誤"}), 400
+    if idempotency_key:
+        if len(idempotency_key) > 64:
+            return jsonify({"success": False, "error": "冪等鍵長度不可超過 64 字元"}), 400
+        data["idempotency_key"] = idempotency_key
+        # 快速路徑：短時間內的重送直接回傳第一次的結果，不碰資料庫
+        cached_response = recall_response(f"transaction:{idempotency_key}")
+        if cached_response:
+            return jsonify(dict(cached_response, duplicate=True))
+
     try:
-        location = Location.query.filter_by(slug=location_slug).first()
-        business_day = BusinessDay.query.filter_by(date=today, location_id=location.id, status="OPEN").first()
-        if not business_day:
+        if idempotency_key:
+            duplicate_response = _duplicate_transaction_response(idempotency_key)
+            if duplicate_response:
+                return jsonify(duplicate_response)
+
+        open_day = resolve_open_day(location_slug, today)
+        if not open_day:
             return jsonify({"success": False, "error": "找不到對應的營業中紀錄"}), 404
 
-        total_amount = sum(item['price'] for item in items)
-        
-        # 修正點：分開計算銷售額和項目總數。
-        # total_sales 是指所有 product 的金額總和，discounts 是指所有 discount 的金額總和。
-        # 應為 (總銷售額) = (所有商品金額) - (所有折扣金額)
-        total_sales_amount = 0
-        total_items_count = 0
-        for item in items:
-            category = Category.query.get(item['category_id'])
-            if category and category.category_type in ['product', 'discount_fixed', 'discount_percent', 'buy_n_get_m', 'buy_x_get_x_minus_1', 'buy_odd_even']:
-                total_sales_amount += item['price']
-            if category and category.category_type == 'product':
-                total_items_count += 1
-        
-        # 修正點：交易總額直接使用 total_amount，而不是重新計算
-        new_transaction = Transaction(
-            amount=total_amount, 
-            item_count=len(items),
-            business_day_id=business_day.id,
-            cash_received=cash_received,
-            change_given=change_given
-        )
-        db.session.add(new_transaction)
-        
-        for item in items:
-            transaction_item = TransactionItem(
-                price=item['price'],
-                category_id=item['category_id'],
-                transaction=new_transaction
-            )
-            db.session.add(transaction_item)
+        catalog = get_catalog(open_day.location.id)
+        error = _validate_items(items, catalog)
+        if error:
+            return jsonify({"success": False, "error": error}), 400
+
+        transaction, total_sales_amount, total_items_count = _add_transaction(open_day.business_day_id, catalog, data)
+        add_item_totals(open_day.business_day_id, data.get("items", []))
+        add_hourly_totals(open_day.location.id, today, [transaction])
 
         # 修正點：使用新的 total_sales_amount 更新 business_day
-        business_day.total_sales = (business_day.total_sales or 0) + total_sales_amount
-        business_day.total_items = (business_day.total_items or 0) + total_items_count
-        business_day.total_transactions = (business_day.total_transactions or 0) + 1
-        
+        totals = _increment_day_totals(open_day.business_day_id, total_sales_amount, total_items_count, 1)
+        if totals is None:
+            # 快取中的營業日已被日結，捨棄這筆交易並讓快取失效
+            db.session.rollback()
+            invalidate_open_days()
+            return jsonify({"success": False, "error": "找不到對應的營業中紀錄"}), 404
         db.session.commit()
-        
-        # 重新查詢當日其他收入總額，以傳回給前端
-        from sqlalchemy.sql import func
-        from sqlalchemy import case
-        other_income_totals = db.session.query(
-            Category.name,
-            func.sum(TransactionItem.price)
-        ).join(TransactionItem.transaction).join(Transaction.business_day).join(TransactionItem.category).filter(
-            BusinessDay.id == business_day.id,
-            Category.category_type == 'other_income'
-        ).group_by(Category.name).all()
-        
-        donation_total = 0
-        other_total = 0
-        for name, total in other_income_totals:
-            if name == '捐款':
-                donation_total = total
-            else:
-                other_total += total
-
-        return jsonify({
-            "success": True,
-            "total_sales": business_day.total_sales,
-            "total_items": business_day.total_items,
-            "total_transactions": business_day.total_transactions,
-            "donation_total": donation_total,
-            "other_total": other_total,
-        })
+
+        response = _day_totals_response(open_day.business_day_id, totals)
+        if idempotency_key:
+            remember_response(f"transaction:{idempotency_key}", response, IDEMPOTENCY_TTL_SECONDS)
+        return jsonify(response)
+    except IntegrityError:
+        # 同一冪等鍵的兩個請求同時寫入，由唯一索引擋下較晚的那一筆
+        db.session.rollback()
+        duplicate_response = _duplicate_transaction_response(idempotency_key) if idempotency_key else None
+        if duplicate_response:
+            return jsonify(duplicate_response)
+        current_app.logger.error("記錄交易時發生資料完整性錯誤", exc_info=True)
+        return jsonify({"success": False, "error": "伺服器內部錯誤"}), 500
     except Exception as e:
         db.session.rollback()
         current_app.logger.error(f"記錄交易時發生錯誤: {e}", exc_info=True)
         return jsonify({"success": False, "error": "伺服器內部錯誤"}), 500
 
 
+def _client_business_date(payload, default):
+    """交易所屬的營業日期：依前端結帳時間換算為伺服器當地日期 (與開帳時的 date.today() 一致)，未提供時間時使用 default。"""
+    timestamp = _parse_client_timestamp(payload.get("timestamp"))
+    if timestamp is None:
+        return default
+    return timestamp.replace(tzinfo=timezone.utc).astimezone().date()
+
+
+@bp.route("/record_transactions_batch", methods=["POST"])
+@csrf.exempt
+@login_required
+def record_transactions_batch():
+    """接收前端離線佇列一次送來的多筆交易，於單一資料庫交易中寫入並只 commit 一次。
+
+    每筆交易的 client_id 即為其冪等鍵，已寫入過的交易會直接視為成功而不重複入帳。
+    交易依結帳時間歸入當天的營業日；該營業日已不在營業中 (跨日或已由其他收銀台日結) 時，
+    該筆交易以 needs_manual_entry 狀態列入 rejected，由前端提示人工補登。
+    """
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({"success": False, "error": "請求格式錯誤"}), 400
+    location_slug = data.get("location_slug")
+    queued_transactions = data.get("transactions", [])
+    today = date.today()
+
+    if not isinstance(queued_transactions, list) or not queued_transactions:
+        return jsonify({"success": False, "error": "交易內容不可為空"}), 400
+
+    try:
+        location = Location.query.filter_by(slug=location_slug).first() if isinstance(location_slug, str) else None
+        if not location:
+            return jsonify({"success": False, "error": "找不到對應的據點"}), 400
+
+        client_ids = [p.get("client_id") for p in queued_transactions if isinstance(p, dict) and isinstance(p.get("client_id"), str)]
+        seen_keys = {
+            key for key, in db.session.query(Transaction.idempotency_key).filter(Transaction.idempotency_key.in_(client_ids))
+        } if client_ids else set()
+
+        catalog = get_catalog(location.id)
+        accepted = []
+        rejected = []
+        payloads_by_date = {}
+        for payload in queued_transactions:
+            # 單筆交易格式錯誤時只拒絕該筆，不讓整批失敗而卡住佇列中其後的交易
+            if not isinstance(payload, dict):
+                rejected.append({"client_id": None, "error": "交易格式錯誤"})
+                continue
+            client_id = payload.get("client_id")
+            if client_id is not None and not isinstance(client_id, str):
+                rejected.append({"client_id": client_id, "error": "冪等鍵格式錯誤"})
+                continue
+            if client_id and len(client_id) > 64:
+                rejected.append({"client_id": client_id, "error": "冪等鍵長度不可超過 64 字元"})
+                continue
+            if client_id in seen_keys:
+                accepted.append(client_id)
+                continue
+            error = _validate_items(payload.get("items"), catalog)
+            if error:
+                rejected.append({"client_id": client_id, "error": error})
+                continue
+            payload["idempotency_key"] = client_id
+            payloads_by_date.setdefault(_client_business_date(payload, today), []).append(payload)
+            if client_id:
+                seen_keys.add(client_id)
+
+        latest = None
+        for business_date, payloads in sorted(payloads_by_date.items()):
+            open_day = resolve_open_day(location.slug, business_date)
+            figures = [_sales_figures(payload["items"], catalog) for payload in payloads]
+            # 先以帶狀態條件的 UPDATE 累加業績，營業日已被日結時不寫入任何交易
+            totals = _increment_day_totals(
+                open_day.business_day_id, sum(sales for sales, _ in figures), sum(count for _, count in figures), len(payloads)
+            ) if open_day else None
+            if totals is None:
+                if open_day:
+                    invalidate_open_days()
+                for payload in payloads:
+                    rejected.append({
+                        "client_id": payload.get("client_id"),
+                        "error": f"{business_date.isoformat()} 的營業日已不在營業中，請人工補登此筆交易",
+                        "status": "needs_manual_entry",
+                        "business_date": business_date.isoformat(),
+                        "timestamp": payload.get("timestamp"),
+                        "amount": sum(item['price'] for item in payload["items"]),
+                    })
+                continue
+
+            transactions = [_add_transaction(open_day.business_day_id, catalog, payload)[0] for payload in payloads]
+            add_item_totals(open_day.business_day_id, [item for payload in payloads for item in payload["items"]])
+            add_hourly_totals(location.id, business_date, transactions)
+            accepted.extend(payload.get("client_id") for payload in payloads)
+            latest = (open_day.business_day_id, totals)
+        db.session.commit()
+
+        if latest is None:
+            # 沒有新寫入的交易時，回傳今天營業中的累計數字 (若有)
+            open_day = resolve_open_day(location.slug, today)
+            business_day = db.session.get(BusinessDay, open_day.business_day_id) if open_day else None
+            latest = (business_day.id, business_day) if business_day else None
+        response = _day_totals_response(*latest) if latest else {"success": True}
+        return jsonify(dict(response, accepted=accepted, rejected=rejected))
+    except IntegrityError:
+        # 另一個請求同時寫入了相同的 client_id；整批回滾，前端下次重送時會被識別為重複
+        db.session.rollback()
+        current_app.logger.warning("批次記錄交易時偵測到重複的 client_id，已回滾本批次")
+        return jsonify({"success": False, "error": "偵測到重複的交易，請稍後重試"}), 409
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.error(f"批次記錄交易時發生錯誤: {e}", exc_info=True)
+        return jsonify({"success": False, "error": "伺服器內部錯誤"}), 500
+
+
 @bp.route("/close_day/<location_slug>", methods=["GET", "POST"])
 @login_required
 def close_day(location_slug):
-    location = Location.query.filter_by(slug=location_slug).first_or_404()
     today = date.today()
-    business_day = BusinessDay.query.filter_by(
-        date=today, location_id=location.id
-    ).filter(
-        BusinessDay.status.in_(["OPEN", "PENDING_REPORT"])
-    ).first()
+    open_day = resolve_open_day(location_slug, today)
+    business_day = db.session.get(BusinessDay, open_day.business_day_id) if open_day else None
+    if business_day and business_day.status == "OPEN":
+        location = open_day.location
+    else:
+        location = Location.query.filter_by(slug=location_slug).first_or_404()
+        business_day = BusinessDay.query.filter_by(
+            date=today, location_id=location.id
+        ).filter(
+            BusinessDay.status.in_(["OPEN", "PENDING_REPORT"])
+        ).first()
     if not business_day:
         flash(f'據點 "{location.name}" 今日並非營業中狀態，無法進行日結。', "warning")
         return redirect(url_for("cashier.dashboard"))
@@ -397,6 +610,8 @@ def close_day(location_slug):
             business_day.cash_breakdown = json.dumps(cash_breakdown)
             business_day.status = "PENDING_REPORT"
             db.session.commit()
+            invalidate_open_days()
+            invalidate_calendar_days([business_day.date])
             flash("現金盤點完成！請核對最後的每日報表。", "success")
             return redirect(url_for("cashier.daily_report", location_slug=location.slug))
         except Exception as e:
@@ -428,15 +643,10 @@ def daily_report(location_slug):
     # 修正點：動態重新計算 total_sales，確保顯示正確的折扣後總額
     sales_total = db.session.query(func.sum(TransactionItem.price)).join(Transaction.items).join(TransactionItem.category).filter(
         Transaction.business_day_id == business_day.id,
-        Category.category_type.in_(['product', 'discount_fixed', 'discount_percent', 'buy_n_get_m', 'buy_x_get_x_minus_1', 'buy_odd_even'])
+        Category.category_type.in_(SALES_CATEGORY_TYPES)
     ).scalar() or 0
 
-    other_income_total = db.session.query(
-        func.sum(TransactionItem.price)
-    ).join(TransactionItem.transaction).join(Transaction.business_day).join(TransactionItem.category).filter(
-        BusinessDay.id == business_day.id,
-        Category.category_type == 'other_income'
-    ).scalar() or 0
+    other_income_total = sum(other_income_for_day(business_day.id))
     
     expected_total = opening_cash + sales_total + other_income_total
     difference = closing_cash - expected_total
@@ -482,24 +692,21 @@ def confirm_report(location_slug):
             # 修正點：動態重新計算 total_sales 和 other_income_total，並存回資料庫
             sales_total = db.session.query(func.sum(TransactionItem.price)).join(Transaction.items).join(TransactionItem.category).filter(
                 Transaction.business_day_id == business_day.id,
-                Category.category_type.in_(['product', 'discount_fixed', 'discount_percent', 'buy_n_get_m', 'buy_x_get_x_minus_1', 'buy_odd_even'])
+                Category.category_type.in_(SALES_CATEGORY_TYPES)
             ).scalar() or 0
             
-            other_income_total = db.session.query(
-                func.sum(TransactionItem.price)
-            ).join(TransactionItem.transaction).join(Transaction.business_day).join(TransactionItem.category).filter(
-                BusinessDay.id == business_day.id,
-                Category.category_type == 'other_income'
-            ).scalar() or 0
+            other_income_total = sum(other_income_for_day(business_day.id))
             
             business_day.total_sales = sales_total
             business_day.expected_cash = (business_day.opening_cash or 0) + (business_day.total_sales or 0) + other_income_total
             business_day.cash_diff = (business_day.closing_cash or 0) - business_day.expected_cash
+            rebuild_monthly_totals([(business_day.location_id, business_day.date)])
             
             db.session.commit()
-            header = ["日期", "據點", "開店準備金", "本日銷售總額", "帳面總額", "盤點現金合計", "帳差", "交易筆數", "銷售件數"]
-            report_data = [business_day.date.strftime("%Y-%m-%d"), business_day.location.name, business_day.opening_cash, business_day.total_sales, business_day.expected_cash, business_day.closing_cash, business_day.cash_diff, business_day.total_transactions, business_day.total_items]
-            current_app.task_queue.enqueue('app.services.google_service.write_report_to_sheet_task', args=(location.id, report_data, header), job_timeout='10m')
+            invalidate_open_days()
+            invalidate_report_days([(business_day.location_id, business_day.date)])
+            enqueue_pdf_refresh([(business_day.location_id, business_day.date)])
+            request_sheet_sync([(business_day.location_id, business_day.date)])
             flash(f'據點 "{location.name}" 本日營業已成功歸檔！正在背景同步至雲端...', "success")
             return redirect(url_for("cashier.daily_report", location_slug=location.slug, date=report_date.isoformat()))
         except Exception as e:
@@ -514,27 +721,19 @@ def confirm_report(location_slug):
 @login_required
 def print_report(location_slug):
     location = Location.query.filter_by(slug=location_slug).first_or_404()
-    today = date.today()
+    try:
+        report_date = date.fromisoformat(request.form.get('report_date') or date.today().isoformat())
+    except ValueError:
+        abort(400)
     business_day = BusinessDay.query.filter(
-        BusinessDay.date == today, BusinessDay.location_id == location.id).first_or_404()
-    closing_cash = business_day.closing_cash or 0
-    opening_cash = business_day.opening_cash or 0
-    total_sales = business_day.total_sales or 0
-
-    # 修正點：從交易紀錄中計算其他收入並計入 expected_total
-    from sqlalchemy.sql import func
-    other_income_total = db.session.query(
-        func.sum(TransactionItem.price)
-    ).join(TransactionItem.transaction).join(Transaction.business_day).join(TransactionItem.category).filter(
-        BusinessDay.id == business_day.id,
-        Category.category_type == 'other_income'
-    ).scalar() or 0
+        BusinessDay.date == report_date, BusinessDay.location_id == location.id).first_or_404()
+    filename = f"daily_report_{location.slug}_{report_date.strftime('%Y%m%d')}.pdf"
+
+    # 已歸檔的營業日使用歸檔時的簽名，PDF 由背景任務預先產生，這裡只需送出檔案
+    if business_day.status == 'CLOSED':
+        return send_file(daily_report_pdf(business_day), mimetype="application/pdf", as_attachment=True, download_name=filename)
 
-    expected_total = opening_cash + total_sales + other_income_total
-    difference = closing_cash - expected_total
     signatures = {'operator': request.form.get('sig_operator'), 'reviewer': request.form.get(
         'sig_reviewer'), 'cashier': request.form.get('sig_cashier')}
-    html_to_render = render_template(
-        "cashier/report_print.html", day=business_day, other_income_total=other_income_total, expected_total=expected_total, difference=difference, signatures=signatures)
-    pdf = HTML(string=html_to_render).write_pdf()
-    return Response(pdf, mimetype="application/pdf", headers={"Content-Disposition": f"attachment;filename=daily_report_{location.slug}_{today.strftime('%Y%m%d')}.pdf"})
\ No newline at end of file
+    pdf = render_pdf(daily_report_html(business_day, signatures))
+    return Response(pdf, mimetype="application/pdf", headers={"Content-Disposition": f"attachment;filename={filename}"})
\ No newline at end of file
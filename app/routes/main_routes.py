@@ -1,4 +1,4 @@
-from flask import Blueprint, render_template
+from flask import Blueprint, render_template, current_app, send_from_directory
 
 bp = Blueprint('main', __name__)
 
@@ -6,3 +6,11 @@ bp = Blueprint('main', __name__)
 @bp.route('/')
 def index():
     return render_template('index.html')
+
+
+@bp.route('/sw.js')
+def service_worker():
+    """從網站根目錄提供 Service Worker，使其作用範圍涵蓋 /cashier/ 下的 POS 頁面"""
+    response = send_from_directory(current_app.static_folder, 'sw.js', mimetype='application/javascript')
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
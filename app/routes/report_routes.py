@@ -1,24 +1,41 @@
 import os
 import json
-from flask import Blueprint, render_template, request, flash, redirect, url_for, jsonify, Response
+from flask import Blueprint, render_template, request, flash, redirect, url_for, jsonify, Response, stream_with_context, send_file, current_app
 from flask_login import login_required
 from ..models import BusinessDay, Transaction, TransactionItem, Location, DailySettlement, Category
 from ..forms import ReportQueryForm, SettlementForm
 from .. import db, csrf
 from sqlalchemy.orm import selectinload
-from sqlalchemy import func, case, extract, and_
-from datetime import date, timedelta
+from sqlalchemy import func, case, extract, and_, or_
+from redis.exceptions import RedisError
+from datetime import date, datetime, timedelta
 import json
 from ..decorators import admin_required
-from weasyprint import HTML
+from ..services.category_totals_service import rebuild_category_totals
+from ..services.reference_data_service import get_reference_data, location_choices
+from ..services.report_edit_service import update_opening_cash, update_cash_breakdowns, update_transactions
+from ..services.hourly_totals_service import rebuild_hourly_totals, peak_hours, weekday_hours, WEEKDAY_NAMES
+from ..services.monthly_totals_service import rebuild_monthly_totals
+from ..services.parquet_export_service import write_line_items
+from ..services.income_service import other_income_breakdown, attach_other_income
+from ..services.analytics_service import totals_by_label, column_chart
+from ..services.report_cache_service import invalidate_report_days, invalidate_calendar_days, calendar_version
+from ..services.cache_service import remember_response, recall_response
+from ..services.pdf_service import settlement_pdf, enqueue_pdf_refresh
+from ..services.sheet_sync_service import request_sheet_sync
+from ..services.settlement_service import get_settlement, invalidate_settlement, FINANCE_ITEMS, SALES_ITEMS
+from ..services.report_service import (
+    BACKGROUND_REPORT_TYPES, get_report, recall_cached_report, range_days, product_mix_query,
+    enqueue_report, fetch_report_job, report_job_status
+)
 import csv
+import tempfile
 from io import StringIO
 from calendar import monthrange
 from collections import defaultdict
 
 bp = Blueprint('report', __name__, url_prefix='/report')
 
-LOCATION_ORDER = ["本舖", "瘋衣舍", "特賣會 1", "特賣會 2", "其他"]
 DENOMINATIONS = [1000, 500, 200, 100, 50, 10, 5, 1]
 
 @bp.before_request
@@ -48,17 +65,142 @@ def get_date_range_from_period(time_unit, year=None, month=None, quarter=None, p
     except (ValueError, TypeError):
         return None, None
 
+def iter_dates(start_date, end_date):
+    """依序產生 start_date 至 end_date（含）之間的每一天"""
+    for offset in range((end_date - start_date).days + 1):
+        yield start_date + timedelta(days=offset)
+
+# 日結狀態查詢中可直接交由資料庫篩選的狀態
+SETTLEMENT_STATUS_FILTERS = {
+    'pending_report': 'PENDING_REPORT',
+    'closed': 'CLOSED',
+}
+
+def _settlement_status_info(loc, current_date, business_day):
+    """依營業日狀態決定日結狀態查詢中顯示的標籤與按鈕"""
+    if business_day is None:
+        # 找不到紀錄，表示沒有營業
+        return {
+            'status_text': '沒有營業',
+            'badge_class': 'bg-secondary',
+            'button_text': '日結盤點',
+            'button_url': url_for('admin.new_force_close_day', location_id=loc.id, date=current_date.isoformat()),
+            'button_class': 'btn-danger'
+        }
+    if business_day.status == 'CLOSED':
+        return {
+            'status_text': '已日結',
+            'badge_class': 'bg-primary',
+            'button_text': '查詢日結報表',
+            'button_url': url_for('cashier.daily_report', location_slug=loc.slug, date=current_date.isoformat()),
+            'button_class': 'btn-primary'
+        }
+    if business_day.status == 'PENDING_REPORT':
+        return {
+            'status_text': '待確認報表',
+            'badge_class': 'bg-warning text-dark',
+            'button_text': '確認報表',
+            'button_url': url_for('cashier.daily_report', location_slug=loc.slug, date=current_date.isoformat()),
+            'button_class': 'btn-warning'
+        }
+    if business_day.status == 'OPEN':
+        return {
+            'status_text': '營業中',
+            'badge_class': 'bg-success',
+            'button_text': '強制日結盤點',
+            'button_url': url_for('admin.force_close_day', business_day_id=business_day.id),
+            'button_class': 'btn-danger'
+        }
+    return None
+
+def _daily_settlement_results(start_date, end_date, location_id, status_filter):
+    """各據點於日期區間內每一天的日結狀態，供日結狀態查詢與匯出使用"""
+    locations = get_reference_data().locations
+    if location_id != 'all':
+        locations = [loc for loc in locations if str(loc.id) == location_id]
+
+    # 以單一區間查詢載入所有營業日，再依 (據點, 日期) 對照
+    day_query = db.session.query(BusinessDay.id, BusinessDay.location_id, BusinessDay.date, BusinessDay.status).filter(
+        BusinessDay.date.between(start_date, end_date),
+        BusinessDay.location_id.in_([loc.id for loc in locations])
+    )
+    sql_status = SETTLEMENT_STATUS_FILTERS.get(status_filter)
+    if sql_status:
+        day_query = day_query.filter(BusinessDay.status == sql_status)
+    business_days = {(row.location_id, row.date): row for row in day_query.order_by(BusinessDay.id.desc()).all()}
+
+    results = []
+    for loc in locations:
+        if sql_status:
+            # 只列出特定狀態時不需要補上「沒有營業」的日期
+            days = sorted(day for (loc_id, day) in business_days if loc_id == loc.id)
+        else:
+            days = iter_dates(start_date, end_date)
+
+        for current_date in days:
+            business_day = business_days.get((loc.id, current_date))
+
+            # 根據篩選器篩選結果
+            if status_filter == 'open' and business_day and business_day.status != 'OPEN': continue
+            if status_filter == 'no_data' and business_day: continue
+
+            results.append({
+                'location': loc,
+                'date': current_date,
+                'status_info': _settlement_status_info(loc, current_date, business_day)
+            })
+    return results
+
+def _with_dates(rows):
+    """將快取中以 ISO 字串保存的日期還原為 date，供模板格式化。"""
+    return [dict(row, date=date.fromisoformat(row['date'])) for row in rows]
+
+def _load_report(report_type, location_id, periods, time_unit=None):
+    """取得可背景產生的報表結果，回傳 (結果, 背景任務)，兩者其中之一為 None。
+
+    查詢網址帶有 job_id 時讀取該背景任務的結果；否則區間超過 REPORT_JOB_THRESHOLD_DAYS
+    且沒有快取時排入背景任務，讓網頁 worker 不被大範圍報表佔用。
+    """
+    job_id = request.args.get('job_id')
+    if job_id:
+        try:
+            job = fetch_report_job(job_id, report_type, location_id, periods, time_unit)
+            if job is not None:
+                status = report_job_status(job)
+                if status['ready']:
+                    return job.return_value(), None
+                if status['failed']:
+                    flash('背景產生報表失敗，請重新查詢或縮小查詢範圍。', 'danger')
+                    return {'rows': [], 'chart_data': None}, None
+                return None, job
+        except RedisError as e:
+            current_app.logger.warning(f"讀取報表背景任務失敗，改為直接產生報表: {e}")
+            return get_report(report_type, location_id, periods, time_unit), None
+
+    if range_days(periods) <= current_app.config['REPORT_JOB_THRESHOLD_DAYS']:
+        return get_report(report_type, location_id, periods, time_unit), None
+    report = recall_cached_report(report_type, location_id, periods, time_unit)
+    if report is not None:
+        return report, None
+    try:
+        return None, enqueue_report(report_type, location_id, periods, time_unit)
+    except RedisError as e:
+        # 無法排入背景任務時退回在目前的請求中產生，較慢但不會讓查詢失敗
+        current_app.logger.warning(f"排入報表背景任務失敗，改為直接產生報表: {e}")
+        return get_report(report_type, location_id, periods, time_unit), None
+
 @bp.route('/query', methods=['GET'])
 def query():
     form = ReportQueryForm()
     
-    all_categories = Category.query.all()
-    form.location_id.choices = [('all', '所有據點')] + [(str(l.id), l.name) for l in Location.query.order_by(Location.id).all()]
+    all_categories = get_reference_data().categories
+    form.location_id.choices = location_choices()
     
     results = []
     grand_total = None
     chart_data = None
     total_revenue = 0
+    report_job = None
     report_type = request.args.get('report_type')
     form.report_type.data = report_type
 
@@ -82,73 +224,8 @@ def query():
                 form.end_date.data = end_date
                 return render_template('report/query.html', form=form, report_type=report_type, results=results, all_categories=all_categories)
             
-            locations = Location.query.order_by(Location.id).all()
-            results = []
-            for loc in locations:
-                if location_id != 'all' and str(loc.id) != location_id:
-                    continue
-                
-                # 遍歷日期範圍，找出所有可能的營業日
-                current_date = start_date
-                while current_date <= end_date:
-                    business_day = BusinessDay.query.filter(
-                        and_(BusinessDay.date == current_date, BusinessDay.location_id == loc.id)
-                    ).first()
-                    
-                    status_info = None
-                    if business_day:
-                        # 找到紀錄，根據狀態決定按鈕
-                        if business_day.status == 'CLOSED':
-                            status_info = {
-                                'status_text': '已日結',
-                                'badge_class': 'bg-primary',
-                                'button_text': '查詢日結報表',
-                                'button_url': url_for('cashier.daily_report', location_slug=loc.slug, date=current_date.isoformat()),
-                                'button_class': 'btn-primary'
-                            }
-                        elif business_day.status == 'PENDING_REPORT':
-                            status_info = {
-                                'status_text': '待確認報表',
-                                'badge_class': 'bg-warning text-dark',
-                                'button_text': '確認報表',
-                                'button_url': url_for('cashier.daily_report', location_slug=loc.slug, date=current_date.isoformat()),
-                                'button_class': 'btn-warning'
-                            }
-                        elif business_day.status == 'OPEN':
-                            status_info = {
-                                'status_text': '營業中',
-                                'badge_class': 'bg-success',
-                                'button_text': '強制日結盤點',
-                                'button_url': url_for('admin.force_close_day', business_day_id=business_day.id),
-                                'button_class': 'btn-danger'
-                            }
-                    else:
-                        # 找不到紀錄，表示沒有營業
-                        status_info = {
-                            'status_text': '沒有營業',
-                            'badge_class': 'bg-secondary',
-                            'button_text': '日結盤點',
-                            'button_url': url_for('admin.new_force_close_day', location_id=loc.id, date=current_date.isoformat()),
-                            'button_class': 'btn-danger'
-                        }
-                    
-                    # 根據篩選器篩選結果
-                    is_filtered_out = False
-                    if status_filter != 'all':
-                        if status_filter == 'open' and business_day and business_day.status != 'OPEN': is_filtered_out = True
-                        if status_filter == 'pending_report' and (not business_day or business_day.status != 'PENDING_REPORT'): is_filtered_out = True
-                        if status_filter == 'closed' and (not business_day or business_day.status != 'CLOSED'): is_filtered_out = True
-                        if status_filter == 'no_data' and business_day: is_filtered_out = True
-                    
-                    if not is_filtered_out:
-                        results.append({
-                            'location': loc,
-                            'date': current_date,
-                            'status_info': status_info
-                        })
-                    
-                    current_date += timedelta(days=1)
-            
+            results = _daily_settlement_results(start_date, end_date, location_id, status_filter)
+
             return render_template('report/query.html',
                            form=form,
                            results=results,
@@ -188,44 +265,35 @@ def query():
             if location_id != 'all':
                 query_base = query_base.filter(BusinessDay.location_id == location_id)
 
-        if report_type == 'daily_summary':
-            results = query_base.order_by(BusinessDay.date.desc(), BusinessDay.location_id).all()
-            if results:
-                chart_labels = sorted(list(set(r.date.strftime('%Y-%m-%d') for r in results)))
-                locations = sorted(list(set(r.location.name for r in results)))
-                datasets = []
-                for loc_name in locations:
-                    data = [sum(r.total_sales or 0 for r in results if r.date.strftime('%Y-%m-%d') == label_date and r.location.name == loc_name) for label_date in chart_labels]
-                    datasets.append({'label': loc_name, 'data': data})
-                chart_data = {'labels': chart_labels, 'datasets': datasets}
+        if report_type in BACKGROUND_REPORT_TYPES:
+            if report_type == 'periodic_performance':
+                periods = [(start_date_a, end_date_a), (start_date_b, end_date_b)]
+            else:
+                periods = [(start_date, end_date)]
+                time_unit = None
+            report, job = _load_report(report_type, location_id, periods, time_unit)
+            if job is not None:
+                results = None
+                report_job = {
+                    'status_url': url_for('report.report_job_status_api', job_id=job.id),
+                    'result_url': url_for('report.query', **dict(request.args.to_dict(), job_id=job.id))
+                }
+            else:
+                results = report['rows']
+                if report_type in ('daily_summary', 'sales_trend'):
+                    results = _with_dates(results)
+                total_revenue = report.get('total_revenue', 0)
+                chart_data = report['chart_data']
 
         elif report_type == 'transaction_log':
-            business_day_ids = [b.id for b in query_base.all()]
-            results = db.session.query(Transaction).join(BusinessDay).options(
-                selectinload(Transaction.items).selectinload(TransactionItem.category),
-                db.joinedload(Transaction.business_day).joinedload(BusinessDay.location)
-            ).filter(Transaction.business_day_id.in_(business_day_ids)).order_by(Transaction.timestamp).all()
+            # 交易明細由頁面捲動時向 transaction_log_api 分頁載入，這裡只提供查詢網址
+            results = {'api_url': url_for('report.transaction_log_api', start_date=start_date.isoformat(), end_date=end_date.isoformat(), location_id=location_id)}
 
         elif report_type in ['daily_cash_summary', 'daily_cash_check']:
             results = query_base.order_by(BusinessDay.date.desc(), BusinessDay.location_id).all()
             if results:
                 # 重新動態計算 donation_total 和 other_total，以避免 AttributeError
-                for r in results:
-                    other_income_totals = db.session.query(
-                        Category.name,
-                        func.sum(TransactionItem.price)
-                    ).join(TransactionItem.transaction).join(Transaction.business_day).join(TransactionItem.category).filter(
-                        BusinessDay.id == r.id,
-                        Category.category_type == 'other_income'
-                    ).group_by(Category.name).all()
-                    
-                    r.donation_total = 0
-                    r.other_total = 0
-                    for name, total in other_income_totals:
-                        if name == '捐款':
-                            r.donation_total = total
-                        else:
-                            r.other_total += total
+                attach_other_income(results)
                 
                 grand_total_dict = {
                     'opening_cash': sum(r.opening_cash or 0 for r in results),
@@ -241,13 +309,7 @@ def query():
                 class GrandTotal:
                     def __init__(self, **entries): self.__dict__.update(entries)
                 grand_total = GrandTotal(**grand_total_dict)
-                sales_by_location = defaultdict(float)
-                for r in results:
-                    sales_by_location[r.location.name] += r.total_sales or 0
-                chart_data = {
-                    'labels': list(sales_by_location.keys()),
-                    'datasets': [{'label': '手帳營收', 'data': list(sales_by_location.values())}]
-                }
+                chart_data = totals_by_label([r.location.name for r in results], [r.total_sales for r in results], '手帳營收')
         
         elif report_type == 'combined_summary_final':
             check_results = []
@@ -272,76 +334,26 @@ def query():
                 current_date += timedelta(days=1)
             results = check_results
 
-        elif report_type == 'product_mix':
-            query = db.session.query(
-                Category.name.label('category_name'),
-                func.sum(case((TransactionItem.price > 0, TransactionItem.price), else_=0)).label('total_sales'),
-                func.count(case((TransactionItem.price > 0, TransactionItem.id), else_=None)).label('items_sold')
-            ).join(TransactionItem.transaction).join(Transaction.business_day).join(TransactionItem.category).filter(
-                BusinessDay.date.between(start_date, end_date), Category.category_type == 'product'
-            )
-            if location_id != 'all': query = query.filter(BusinessDay.location_id == location_id)
-            results = query.group_by(Category.name).order_by(func.sum(TransactionItem.price).desc()).all()
-            total_revenue = sum(r.total_sales for r in results) if results else 0
-            chart_data = {
-                'labels': [r.category_name for r in results],
-                'datasets': [{'label': '銷售總額', 'data': [r.total_sales for r in results]}]
-            }
-
-        elif report_type == 'sales_trend':
-            query = db.session.query(BusinessDay.date, func.sum(BusinessDay.total_sales).label('total_sales'), func.sum(BusinessDay.total_transactions).label('total_transactions')).filter(BusinessDay.date.between(start_date, end_date))
-            if location_id != 'all': query = query.filter(BusinessDay.location_id == location_id)
-            results = query.group_by(BusinessDay.date).order_by(BusinessDay.date).all()
-            chart_data = {
-                'labels': [r.date.strftime('%Y-%m-%d') for r in results],
-                'datasets': [{'label': '總銷售額', 'data': [r.total_sales for r in results], 'borderColor': 'rgb(75, 192, 192)', 'tension': 0.1, 'yAxisID': 'y'}, {'label': '總交易筆數', 'data': [r.total_transactions for r in results], 'borderColor': 'rgb(255, 99, 132)', 'tension': 0.1, 'yAxisID': 'y1'}]
-            }
-
-        elif report_type == 'peak_hours':
-            query = db.session.query(
-                func.strftime('%H', Transaction.timestamp).label('hour'),
-                func.count(Transaction.id).label('transactions'),
-                func.sum(Transaction.amount).label('total_sales')
-            ).join(BusinessDay).filter(BusinessDay.date.between(start_date, end_date))
-            if location_id != 'all': query = query.filter(BusinessDay.location_id == location_id)
-            results = query.group_by('hour').order_by('hour').all()
-            chart_data = {
-                'labels': [f"{r.hour}:00 - {int(r.hour)+1}:00" for r in results],
-                'datasets': [{'label': '交易筆數', 'data': [r.transactions for r in results]}, {'label': '銷售總額', 'data': [r.total_sales for r in results]}]
-            }
-
-        elif report_type == 'periodic_performance':
-            def get_period_data(start, end, unit):
-                time_unit_expressions = {
-                    'year': [extract('year', BusinessDay.date)], 'quarter': [extract('year', BusinessDay.date), case((extract('month', BusinessDay.date) <= 3, 1), (extract('month', BusinessDay.date) <= 6, 2), (extract('month', BusinessDay.date) <= 9, 3), else_=4)], 'month': [extract('year', BusinessDay.date), extract('month', BusinessDay.date)]
-                }
-                query = db.session.query(*time_unit_expressions[unit], func.sum(BusinessDay.total_sales).label('total_sales'), func.sum(BusinessDay.total_transactions).label('total_transactions')).filter(BusinessDay.date.between(start, end))
-                if location_id != 'all': query = query.filter(BusinessDay.location_id == location_id)
-                return query.group_by(*time_unit_expressions[unit]).order_by(*time_unit_expressions[unit]).all()
-
-            data_a = get_period_data(start_date_a, end_date_a, time_unit)
-            data_b = get_period_data(start_date_b, end_date_b, time_unit)
-            dict_a = {tuple(row[:-2]): row[-2:] for row in data_a}
-            dict_b = {tuple(row[:-2]): row[-2:] for row in data_b}
-            all_keys = sorted(list(set(dict_a.keys()) | set(dict_b.keys())))
-            results = []
-            for key in all_keys:
-                sales_a, trans_a = dict_a.get(key, (0, 0))
-                sales_b, trans_b = dict_b.get(key, (0, 0))
-                sales_diff = (sales_b or 0) - (sales_a or 0)
-                sales_perc = (sales_diff / sales_a * 100) if sales_a else float('inf')
-                label = ""
-                if time_unit == 'year': label = str(key[0])
-                elif time_unit == 'quarter': label = f"{key[0]}-Q{key[1]}"
-                elif time_unit == 'month': label = f"{key[0]}-{key[1]:02d}"
-                results.append({
-                    'label': label, 'sales_a': sales_a or 0, 'trans_a': trans_a or 0, 'sales_b': sales_b or 0, 'trans_b': trans_b or 0, 'sales_diff': sales_diff, 'sales_perc': sales_perc
-                })
-            chart_data = {
-                'labels': [r['label'] for r in results],
-                'datasets': [{'label': f'期間 A', 'data': [r['sales_a'] for r in results]}, {'label': f'期間 B', 'data': [r['sales_b'] for r in results]}]
-            }
-            
+        elif report_type == 'weekday_hours':
+            rows = weekday_hours(start_date, end_date, location_id)
+            if rows:
+                cells = {(r.weekday, r.hour): r for r in rows}
+                hours = list(range(min(r.hour for r in rows), max(r.hour for r in rows) + 1))
+                max_transactions = max(r.transactions for r in rows) or 1
+                heatmap_rows = []
+                for weekday, weekday_name in enumerate(WEEKDAY_NAMES):
+                    row_cells = []
+                    for hour in hours:
+                        cell = cells.get((weekday, hour))
+                        transactions = cell.transactions if cell else 0
+                        row_cells.append({
+                            'transactions': transactions,
+                            'total_sales': cell.total_sales if cell else 0,
+                            'intensity': transactions / max_transactions
+                        })
+                    heatmap_rows.append({'weekday': weekday_name, 'cells': row_cells})
+                results = {'hours': hours, 'rows': heatmap_rows}
+
     return render_template('report/query.html', 
                            form=form, 
                            results=results, 
@@ -349,23 +361,21 @@ def query():
                            grand_total=grand_total,
                            chart_data=json.dumps(chart_data) if chart_data else None,
                            total_revenue=total_revenue,
+                           report_job=report_job,
                            denominations=DENOMINATIONS,
-                           all_categories=[{'id': c.id, 'name': c.name, 'category_type': c.category_type} for c in all_categories])
+                           all_categories=all_categories)
 
 
 @bp.route('/save_daily_summary_data', methods=['POST'])
 @csrf.exempt
 def save_daily_summary_data():
     try:
-        data = request.get_json()
-        for row_data in data:
-            business_day = BusinessDay.query.get(row_data.get('id'))
-            if not business_day:
-                continue
-            business_day.opening_cash = float(row_data.get('opening_cash', business_day.opening_cash))
-            business_day.expected_cash = (business_day.opening_cash or 0) + (business_day.total_sales or 0)
-            business_day.cash_diff = (business_day.closing_cash or 0) - (business_day.expected_cash or 0)
+        changed_days = update_opening_cash(request.get_json())
+        rebuild_monthly_totals(changed_days)
         db.session.commit()
+        invalidate_report_days(changed_days)
+        enqueue_pdf_refresh(changed_days)
+        request_sheet_sync(changed_days)
         return jsonify({'success': True, 'message': '每日摘要數據已成功更新。'})
     except Exception as e:
         db.session.rollback()
@@ -375,22 +385,12 @@ def save_daily_summary_data():
 @csrf.exempt
 def save_cash_check_data():
     try:
-        data = request.get_json()
-        
-        for row_data in data:
-            business_day_id = row_data.get('id')
-            business_day = BusinessDay.query.get(business_day_id)
-            if not business_day:
-                continue
-            cash_breakdown_raw = row_data.get('cash_breakdown')
-            if isinstance(cash_breakdown_raw, dict):
-                cash_breakdown_dict = {key: int(value) for key, value in cash_breakdown_raw.items()}
-                business_day.cash_breakdown = json.dumps(cash_breakdown_dict)
-                closing_cash = sum(int(denom) * count for denom, count in cash_breakdown_dict.items())
-                business_day.closing_cash = float(closing_cash)
-            business_day.expected_cash = (business_day.opening_cash or 0) + (business_day.total_sales or 0)
-            business_day.cash_diff = (business_day.closing_cash or 0) - (business_day.expected_cash or 0)
+        changed_days = update_cash_breakdowns(request.get_json())
+        rebuild_monthly_totals(changed_days)
         db.session.commit()
+        invalidate_report_days(changed_days)
+        enqueue_pdf_refresh(changed_days)
+        request_sheet_sync(changed_days)
         return jsonify({'success': True, 'message': '報表數據已成功儲存！'})
     except Exception as e:
         db.session.rollback()
@@ -400,27 +400,14 @@ def save_cash_check_data():
 @csrf.exempt
 def save_transaction_log_data():
     try:
-        data = request.get_json()
-        for transaction_data in data:
-            transaction = Transaction.query.get(transaction_data.get('id'))
-            if not transaction:
-                continue
-            transaction.cash_received = float(transaction_data.get('cash_received', transaction.cash_received))
-            for item_data in transaction_data.get('items', []):
-                item = TransactionItem.query.get(item_data.get('id'))
-                if item:
-                    item.price = float(item_data.get('price', item.price))
-                    item.category_id = item_data.get('category_id', item.category_id)
-            new_transaction_amount = sum(item.price for item in transaction.items)
-            transaction.amount = new_transaction_amount
-            transaction.change_given = (transaction.cash_received or 0) - (transaction.amount or 0)
-            business_day = transaction.business_day
-            if business_day:
-                all_transactions_for_day = BusinessDay.query.get(business_day.id).transactions
-                business_day.total_sales = sum(t.amount or 0 for t in all_transactions_for_day)
-                business_day.expected_cash = (business_day.opening_cash or 0) + (business_day.total_sales or 0)
-                business_day.cash_diff = (business_day.closing_cash or 0) - (business_day.expected_cash or 0)
+        changed_business_day_ids, changed_days = update_transactions(request.get_json())
+        rebuild_category_totals(changed_business_day_ids)
+        rebuild_hourly_totals(changed_business_day_ids)
+        rebuild_monthly_totals(changed_days)
         db.session.commit()
+        invalidate_report_days(changed_days)
+        enqueue_pdf_refresh(changed_days)
+        request_sheet_sync(changed_days)
         return jsonify({'success': True, 'message': '交易細節數據已成功更新。'})
     except Exception as e:
         db.session.rollback()
@@ -432,15 +419,51 @@ def save_daily_cash_summary_data():
     flash('錯誤：捐款與其他收入為累計欄位，無法手動修改。', 'danger')
     return jsonify({'success': False, 'message': '捐款與其他收入為累計欄位，無法手動修改。'}), 400
 
+# 串流匯出時每累積這麼多字元就送出一次，避免整份檔案留在記憶體中
+CSV_CHUNK_SIZE = 64 * 1024
+# 串流匯出時每次自資料庫取回的列數
+CSV_FETCH_SIZE = 1000
+
+def _stream_csv(header, rows):
+    """將標題與資料列逐段轉為 CSV 輸出，開頭加上 UTF-8 BOM 讓 Excel 正確辨識編碼"""
+    buffer = StringIO()
+    writer = csv.writer(buffer)
+    buffer.write('\ufeff')
+    writer.writerow(header)
+    for row in rows:
+        writer.writerow(row)
+        if buffer.tell() >= CSV_CHUNK_SIZE:
+            yield buffer.getvalue().encode('utf-8')
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue().encode('utf-8')
+
+def _business_day_csv_rows(query):
+    """逐批讀取營業日並附上其他收入，產生每日報表的 CSV 資料列"""
+    def rows_for(batch):
+        income_by_day = other_income_breakdown(r.id for r in batch)
+        for r in batch:
+            donation_total, other_total = income_by_day[r.id]
+            yield [
+                r.date.strftime('%Y-%m-%d'), r.location.name, r.opening_cash, r.total_sales, (donation_total or 0) + (other_total or 0),
+                r.expected_cash, r.closing_cash, r.cash_diff, r.total_transactions, r.total_items
+            ]
+
+    batch = []
+    for r in query.yield_per(CSV_FETCH_SIZE):
+        batch.append(r)
+        if len(batch) >= CSV_FETCH_SIZE:
+            yield from rows_for(batch)
+            batch = []
+    yield from rows_for(batch)
+
 @bp.route('/export_csv')
 def export_csv():
     report_type = request.args.get('report_type')
     location_id = request.args.get('location_id')
     
-    si = StringIO()
-    cw = csv.writer(si)
     header = []
-    results_to_write = []
+    rows = []
 
     if report_type != 'periodic_performance':
         start_date = date.fromisoformat(request.args.get('start_date'))
@@ -457,121 +480,66 @@ def export_csv():
         header = ['日期', '據點', '開店現金', '手帳營收', '其他現金', '應有現金', '實有現金', '溢短收', '交易筆數', '銷售件數']
         query = db.session.query(BusinessDay).filter(BusinessDay.date.between(start_date, end_date))
         if location_id != 'all': query = query.filter(BusinessDay.location_id == location_id)
-        results = query.order_by(BusinessDay.date.desc(), BusinessDay.location_id).all()
-        for r in results:
-            other_income_totals = db.session.query(
-                Category.name,
-                func.sum(TransactionItem.price)
-            ).join(TransactionItem.transaction).join(Transaction.business_day).join(TransactionItem.category).filter(
-                BusinessDay.id == r.id,
-                Category.category_type == 'other_income'
-            ).group_by(Category.name).all()
-            
-            donation_total = 0
-            other_total = 0
-            for name, total in other_income_totals:
-                if name == '捐款':
-                    donation_total = total
-                else:
-                    other_total += total
-            
-            results_to_write.append([
-                r.date.strftime('%Y-%m-%d'), r.location.name, r.opening_cash, r.total_sales, (donation_total or 0) + (other_total or 0),
-                r.expected_cash, r.closing_cash, r.cash_diff, r.total_transactions, r.total_items
-            ])
+        rows = _business_day_csv_rows(query.order_by(BusinessDay.date.desc(), BusinessDay.location_id))
     
     elif report_type == 'daily_cash_summary':
         header = ['日期', '據點', '開店現金', '手帳營收', '其他現金', '應有現金', '實有現金', '溢短收', '交易筆數', '銷售件數']
         query = db.session.query(BusinessDay).filter(BusinessDay.date.between(start_date, end_date))
         if location_id != 'all': query = query.filter(BusinessDay.location_id == location_id)
-        results = query.order_by(BusinessDay.date, BusinessDay.location_id).all()
-        for r in results:
-            other_income_totals = db.session.query(
-                Category.name,
-                func.sum(TransactionItem.price)
-            ).join(TransactionItem.transaction).join(Transaction.business_day).join(TransactionItem.category).filter(
-                BusinessDay.id == r.id,
-                Category.category_type == 'other_income'
-            ).group_by(Category.name).all()
-            
-            donation_total = 0
-            other_total = 0
-            for name, total in other_income_totals:
-                if name == '捐款':
-                    donation_total = total
-                else:
-                    other_total += total
-            
-            results_to_write.append([
-                r.date.strftime('%Y-%m-%d'), r.location.name, r.opening_cash, r.total_sales, (donation_total or 0) + (other_total or 0), r.expected_cash,
-                r.closing_cash, r.cash_diff, r.total_transactions, r.total_items
-            ])
+        rows = _business_day_csv_rows(query.order_by(BusinessDay.date, BusinessDay.location_id))
 
     elif report_type == 'daily_cash_check':
         header = ['日期', '據點', '總計'] + [str(d) for d in DENOMINATIONS]
-        query = db.session.query(BusinessDay).filter(BusinessDay.date.between(start_date, end_date))
+        query = db.session.query(BusinessDay.date, Location.name, BusinessDay.closing_cash, BusinessDay.cash_breakdown).join(BusinessDay.location).filter(BusinessDay.date.between(start_date, end_date))
         if location_id != 'all': query = query.filter(BusinessDay.location_id == location_id)
-        results = query.order_by(BusinessDay.date, BusinessDay.location_id).all()
-        for r in results:
-            cash_breakdown = json.loads(r.cash_breakdown) if r.cash_breakdown else {}
-            row_data = [
-                r.date.strftime('%Y-%m-%d'), 
-                r.location.name, 
-                r.closing_cash or 0
-            ]
-            for denom in DENOMINATIONS:
-                row_data.append(cash_breakdown.get(str(denom), 0))
-            results_to_write.append(row_data)
+        def cash_check_rows():
+            for r in query.order_by(BusinessDay.date, BusinessDay.location_id).yield_per(CSV_FETCH_SIZE):
+                cash_breakdown = json.loads(r.cash_breakdown) if r.cash_breakdown else {}
+                yield [r.date.strftime('%Y-%m-%d'), r.name, r.closing_cash or 0] + [cash_breakdown.get(str(denom), 0) for denom in DENOMINATIONS]
+        rows = cash_check_rows()
 
     elif report_type == 'transaction_log':
         header = ['時間', '據點', '項目/折扣', '類型', '單價/折扣額', '收到現金', '交易總額', '找零']
-        query_base = db.session.query(BusinessDay).filter(BusinessDay.date.between(start_date, end_date))
-        if location_id != 'all': query_base = query_base.filter(BusinessDay.location_id == location_id)
-        business_day_ids = [b.id for b in query_base.all()]
-        results = db.session.query(Transaction).filter(Transaction.business_day_id.in_(business_day_ids)).order_by(Transaction.timestamp).all()
-        for trans in results:
-            for item in trans.items:
-                results_to_write.append([
-                    trans.timestamp.strftime('%Y-%m-%d %H:%M:%S'), trans.business_day.location.name,
-                    item.category.name if item.category else '手動輸入', '商品' if item.price > 0 else '折扣',
-                    item.price, trans.cash_received, trans.amount, trans.change_given
-                ])
+        # 直接逐列讀取所需欄位，不建立 ORM 物件
+        query = db.session.query(
+            Transaction.timestamp, Location.name.label('location_name'), Category.name.label('category_name'), TransactionItem.price,
+            Transaction.cash_received, Transaction.amount, Transaction.change_given
+        ).select_from(TransactionItem).join(TransactionItem.transaction).join(Transaction.business_day).join(BusinessDay.location).outerjoin(TransactionItem.category).filter(
+            BusinessDay.date.between(start_date, end_date)
+        )
+        if location_id != 'all': query = query.filter(BusinessDay.location_id == location_id)
+        rows = ([
+            r.timestamp.strftime('%Y-%m-%d %H:%M:%S'), r.location_name,
+            r.category_name if r.category_name is not None else '手動輸入', '商品' if r.price > 0 else '折扣',
+            r.price, r.cash_received, r.amount, r.change_given
+        ] for r in query.order_by(Transaction.timestamp, Transaction.id, TransactionItem.id).yield_per(CSV_FETCH_SIZE))
 
     elif report_type == 'product_mix':
         header = ['類別名稱', '銷售數量', '銷售總額']
-        query = db.session.query(Category.name, func.count(case((TransactionItem.price > 0, TransactionItem.id), else_=None)), func.sum(case((TransactionItem.price > 0, TransactionItem.price), else_=0))).join(TransactionItem.transaction).join(Transaction.business_day).join(TransactionItem.category).filter(BusinessDay.date.between(start_date, end_date), Category.category_type == 'product')
-        if location_id != 'all': query = query.filter(BusinessDay.location_id == location_id)
-        results = query.group_by(Category.name).order_by(func.sum(TransactionItem.price).desc()).all()
-        total_revenue = sum(r.total_sales for r in results) if results else 0
-        chart_data = {
-            'labels': [r.category_name for r in results],
-            'datasets': [{'label': '銷售總額', 'data': [r.total_sales for r in results]}]
-        }
+        rows = db.session.execute(product_mix_query(start_date, end_date, location_id)).all()
 
     elif report_type == 'sales_trend':
         header = ['日期', '總銷售額', '總交易筆數']
         query = db.session.query(BusinessDay.date, func.sum(BusinessDay.total_sales).label('total_sales'), func.sum(BusinessDay.total_transactions).label('total_transactions')).filter(BusinessDay.date.between(start_date, end_date))
         if location_id != 'all': query = query.filter(BusinessDay.location_id == location_id)
-        results = query.group_by(BusinessDay.date).order_by(BusinessDay.date).all()
-        results_to_write = [[r.date.strftime('%Y-%m-%d'), r.total_sales, r.total_transactions] for r in results]
+        rows = ([r.date.strftime('%Y-%m-%d'), r.total_sales, r.total_transactions] for r in query.group_by(BusinessDay.date).order_by(BusinessDay.date).yield_per(CSV_FETCH_SIZE))
 
     elif report_type == 'peak_hours':
         header = ['時段', '交易筆數', '銷售總額']
-        query = db.session.query(func.strftime('%H', Transaction.timestamp), func.count(Transaction.id), func.sum(Transaction.amount)).join(BusinessDay).filter(BusinessDay.date.between(start_date, end_date))
-        if location_id != 'all': query = query.filter(BusinessDay.location_id == location_id)
-        query_results = query.group_by(func.strftime('%H', Transaction.timestamp)).order_by(func.strftime('%H', Transaction.timestamp)).all()
-        results_to_write = [(f"{r[0]}:00 - {int(r[0])+1}:00", r[1], r[2]) for r in query_results]
+        rows = [(f"{r.hour:02d}:00 - {r.hour + 1:02d}:00", r.transactions, r.total_sales) for r in peak_hours(start_date, end_date, location_id)]
+
+    elif report_type == 'weekday_hours':
+        header = ['星期', '時段', '交易筆數', '銷售總額']
+        rows = [(WEEKDAY_NAMES[r.weekday], f"{r.hour:02d}:00 - {r.hour + 1:02d}:00", r.transactions, r.total_sales) for r in weekday_hours(start_date, end_date, location_id)]
     
     elif report_type == 'daily_settlement_query':
         header = ['日期', '據點', '狀態', '營業日ID']
-        # 由於已在上面處理，這裡不需要再查詢，直接寫入 results_to_write
-        for r in results:
-            results_to_write.append([
-                r['date'].strftime('%Y-%m-%d'),
-                r['location'].name,
-                r['status_info']['status_text'],
-                r['location'].id
-            ])
+        rows = [[
+            r['date'].strftime('%Y-%m-%d'),
+            r['location'].name,
+            r['status_info']['status_text'] if r['status_info'] else '',
+            r['location'].id
+        ] for r in _daily_settlement_results(start_date, end_date, location_id, request.args.get('status'))]
 
     elif report_type == 'periodic_performance':
         header = ['時間單位', '期間 A 銷售額', '期間 A 交易數', '期間 B 銷售額', '期間 B 交易數', '銷售額差異', '增長率']
@@ -585,6 +553,7 @@ def export_csv():
         dict_a = {tuple(row[:-2]): row[-2:] for row in data_a}
         dict_b = {tuple(row[:-2]): row[-2:] for row in data_b}
         all_keys = sorted(list(set(dict_a.keys()) | set(dict_b.keys())))
+        rows = []
         for key in all_keys:
             sales_a, trans_a = dict_a.get(key, (0, 0))
             sales_b, trans_b = dict_b.get(key, (0, 0))
@@ -594,23 +563,38 @@ def export_csv():
             if time_unit == 'year': label = str(key[0])
             elif time_unit == 'quarter': label = f"{key[0]}-Q{key[1]}"
             elif time_unit == 'month': label = f"{key[0]}-{key[1]:02d}"
-            results_to_write.append((label, sales_a or 0, trans_a or 0, sales_b or 0, trans_b or 0, sales_diff, f"{sales_perc:.2f}%" if sales_a else "N/A"))
+            rows.append((label, sales_a or 0, trans_a or 0, sales_b or 0, trans_b or 0, sales_diff, f"{sales_perc:.2f}%" if sales_a else "N/A"))
             
     else:
         flash('此報表類型不支援匯出功能。', 'warning')
         return redirect(url_for('report.query'))
 
-    cw.writerow(header)
-    cw.writerows(results_to_write)
-    output = si.getvalue().encode('utf-8-sig')
-    
     filename = f"{report_type}_{date.today().strftime('%Y%m%d')}.csv"
+    # 以產生器逐段輸出，資料列在寫出的同時才自資料庫讀取
     return Response(
-        output,
+        stream_with_context(_stream_csv(header, rows)),
         mimetype="text/csv",
         headers={"Content-disposition": f"attachment; filename={filename}"}
     )
     
+@bp.route('/export_parquet')
+def export_parquet():
+    """以 Parquet 格式匯出交易品項明細 (含交易、營業日、據點與類別欄位)，供資料分析使用"""
+    try:
+        start_date = date.fromisoformat(request.args.get('start_date'))
+        end_date = date.fromisoformat(request.args.get('end_date')) if request.args.get('end_date') else start_date
+    except (ValueError, TypeError):
+        flash('無法匯出：日期格式無效。', 'warning')
+        return redirect(url_for('report.query'))
+    location_id = request.args.get('location_id', 'all')
+
+    # Parquet 的檔尾需在寫完所有 row group 後才能產生，因此先寫入暫存檔再送出
+    output = tempfile.TemporaryFile()
+    write_line_items(output, start_date, end_date, location_id)
+    output.seek(0)
+    filename = f"transaction_items_{start_date.strftime('%Y%m%d')}_{end_date.strftime('%Y%m%d')}.parquet"
+    return send_file(output, mimetype='application/vnd.apache.parquet', as_attachment=True, download_name=filename)
+
 @bp.route('/settlement', methods=['GET'])
 @login_required
 @admin_required
@@ -622,101 +606,22 @@ def settlement():
         report_date = date.today()
 
     form = SettlementForm()
-    
-    opened_locations = db.session.query(Location.name).join(BusinessDay).filter(BusinessDay.date == report_date).all()
-    opened_location_names = {name for name, in opened_locations}
+    result = get_settlement(report_date)
+    grand_total = result.grand_total
 
-    closed_reports = db.session.query(BusinessDay).options(db.joinedload(BusinessDay.location)).filter(
-        BusinessDay.date == report_date,
-        BusinessDay.status == 'CLOSED'
-    ).all()
-    
-    daily_settlement = DailySettlement.query.filter_by(date=report_date).first()
-    is_settled = daily_settlement is not None
-
-    unclosed_locations = opened_location_names - {r.location.name for r in closed_reports}
-    all_closed = not unclosed_locations
-    
-    reports = {r.location.name: r for r in closed_reports}
-
-    active_locations_ordered = [name for name in LOCATION_ORDER if name in reports]
-    
-    # --- 修正點：動態計算 donation_total 和 other_total ---
-    for r in closed_reports:
-        r.donation_total = 0
-        r.other_total = 0
-        other_income_totals = db.session.query(
-            Category.name,
-            func.sum(TransactionItem.price)
-        ).join(TransactionItem.transaction).join(Transaction.business_day).join(TransactionItem.category).filter(
-            BusinessDay.id == r.id,
-            Category.category_type == 'other_income'
-        ).group_by(Category.name).all()
-        for name, total in other_income_totals:
-            if name == '捐款':
-                r.donation_total = total
-            else:
-                r.other_total += total
-    
-    # --- 修正點：根據新規則重新計算 grand_total_dict ---
-    grand_total_dict = {}
-    grand_total_dict['B'] = sum(r.opening_cash or 0 for r in closed_reports)  # B: 開店現金
-    grand_total_dict['C'] = sum(r.total_sales or 0 for r in closed_reports)  # C: 手帳營收
-    grand_total_dict['D'] = sum((r.donation_total or 0) + (r.other_total or 0) for r in closed_reports)  # D: 其他現金
-    grand_total_dict['E'] = sum(r.closing_cash or 0 for r in closed_reports)  # E: 實有現金
-    
-    # A: 應有現金 = B + C + D
-    grand_total_dict['A'] = grand_total_dict['B'] + grand_total_dict['C'] + grand_total_dict['D']
-    
-    # F: 溢短收 = E - A
-    grand_total_dict['F'] = grand_total_dict['E'] - grand_total_dict['A']
-
-    grand_total_dict['J'] = sum(r.total_transactions or 0 for r in closed_reports)
-    grand_total_dict['K'] = sum(r.total_items or 0 for r in closed_reports)
-
-    if is_settled:
-        grand_total_dict['H'] = daily_settlement.total_deposit
-        grand_total_dict['I'] = daily_settlement.total_next_day_opening_cash
-    else:
-        grand_total_dict['I'] = 0 
-        # H: 存款 = E - I
-        grand_total_dict['H'] = grand_total_dict['E'] - grand_total_dict['I']
-
-    class GrandTotal:
-        def __init__(self, **entries): self.__dict__.update(entries)
-    grand_total = GrandTotal(**grand_total_dict)
-    
     form.date.data = report_date.isoformat()
-    
-    if is_settled:
-        form.total_deposit.data = grand_total.H
-        form.total_next_day_opening_cash.data = grand_total.I
-        if daily_settlement.remarks:
-            remarks_data = json.loads(daily_settlement.remarks)
-            for remark_form in form.remarks:
-                if remark_form.key.data in remarks_data:
-                    remark_form.value.data = remarks_data[remark_form.key.data]
-    else:
-        form.total_next_day_opening_cash.data = grand_total.I
-        form.total_deposit.data = grand_total.H
-
-    # --- 修正點：更新 finance_items 列表的順序和 attr/key ---
-    finance_items = [
-        ('A', '應有現金', 'A', 'expected_cash_new'),
-        ('B', '開店現金', 'B', 'opening_cash'),
-        ('C', '手帳營收', 'C', 'total_sales'),
-        ('D', '其他現金', 'D', 'other_cash'),
-        ('E', '實有現金', 'E', 'closing_cash'),
-        ('F', '溢短收', 'F', 'cash_diff_new'),
-        ('H', '存款', 'H', 'deposit'),
-        ('I', '明日開店現金', 'I', 'next_day_opening_cash')
-    ]
-    sales_items = [('J', '結單數', 'J', 'total_transactions'), ('K', '品項數', 'K', 'total_items')]
+    form.total_deposit.data = grand_total['H']
+    form.total_next_day_opening_cash.data = grand_total['I']
+    if result.is_settled:
+        for remark_form in form.remarks:
+            if remark_form.key.data in result.remarks_data:
+                remark_form.value.data = result.remarks_data[remark_form.key.data]
 
     return render_template(
-        'report/settlement.html', form=form, report_date=report_date, reports=reports, active_locations_ordered=active_locations_ordered,
-        grand_total=grand_total, all_closed=all_closed, unclosed_locations=sorted(list(unclosed_locations)),
-        is_settled=is_settled, finance_items=finance_items, sales_items=sales_items
+        'report/settlement.html', form=form, report_date=report_date, reports=result.reports,
+        active_locations_ordered=result.active_locations_ordered, grand_total=grand_total,
+        all_closed=result.all_closed, unclosed_locations=result.unclosed_locations,
+        is_settled=result.is_settled, finance_items=FINANCE_ITEMS, sales_items=SALES_ITEMS
     )
 
 @bp.route('/save_settlement', methods=['POST'])
@@ -726,14 +631,26 @@ def save_settlement():
     form = SettlementForm()
     if form.validate_on_submit():
         report_date = date.fromisoformat(form.date.data)
-        if DailySettlement.query.filter_by(date=report_date).first():
+        result = get_settlement(report_date)
+        if result.is_settled:
             flash(f"{report_date.strftime('%Y-%m-%d')} 的總結算已歸檔，無法重複儲存。", "warning")
             return redirect(url_for('report.settlement', date=report_date.isoformat()))
+        if not result.all_closed:
+            flash(f"尚有據點未完成結帳 ({'、'.join(result.unclosed_locations)})，無法進行總結算。", "warning")
+            return redirect(url_for('report.settlement', date=report_date.isoformat()))
         try:
             remarks_dict = {item.key.data: item.value.data for item in form.remarks if item.value.data}
-            new_settlement = DailySettlement(date=report_date, total_deposit=form.total_deposit.data, total_next_day_opening_cash=form.total_next_day_opening_cash.data, remarks=json.dumps(remarks_dict))
+            next_day_opening_cash = form.total_next_day_opening_cash.data
+            # H: 存款 = E - I，頁面未送出存款時由伺服器端的結算數字計算
+            total_deposit = form.total_deposit.data
+            if total_deposit is None:
+                total_deposit = result.grand_total['E'] - next_day_opening_cash
+            new_settlement = DailySettlement(date=report_date, total_deposit=total_deposit, total_next_day_opening_cash=next_day_opening_cash, remarks=json.dumps(remarks_dict))
             db.session.add(new_settlement)
             db.session.commit()
+            invalidate_settlement(report_date)
+            invalidate_calendar_days([report_date])
+            enqueue_pdf_refresh(settlement_dates=[report_date])
             flash(f"已成功儲存 {report_date.strftime('%Y-%m-%d')} 的總結算資料。", "success")
         except Exception as e:
             db.session.rollback()
@@ -754,91 +671,50 @@ def print_settlement(date_str):
     except (ValueError, TypeError):
         flash("無效的日期格式。", "danger")
         return redirect(url_for('report.settlement'))
-    closed_reports = db.session.query(BusinessDay).options(db.joinedload(BusinessDay.location)).filter(
-        BusinessDay.date == report_date, BusinessDay.status == 'CLOSED').all()
-    daily_settlement = DailySettlement.query.filter_by(date=report_date).first()
-    if not daily_settlement:
+    # 結算後由背景任務預先產生 PDF，這裡通常只需送出檔案
+    path = settlement_pdf(report_date)
+    if path is None:
         flash("該日期的合併報表尚未結算，無法列印。", "warning")
-    return redirect(url_for('report.settlement', date=report_date.isoformat()))
-    reports = {r.location.name: r for r in closed_reports}
-    active_locations_ordered = [name for name in LOCATION_ORDER if name in reports]
-
-    # --- 修正點：動態計算 donation_total 和 other_total ---
-    for r in closed_reports:
-        r.donation_total = 0
-        r.other_total = 0
-        other_income_totals = db.session.query(
-            Category.name,
-            func.sum(TransactionItem.price)
-        ).join(TransactionItem.transaction).join(Transaction.business_day).join(TransactionItem.category).filter(
-            BusinessDay.id == r.id,
-            Category.category_type == 'other_income'
-        ).group_by(Category.name).all()
-        for name, total in other_income_totals:
-            if name == '捐款':
-                r.donation_total = total
-            else:
-                r.other_total += total
-    
-    # --- 修正點：根據新規則重新計算 grand_total_dict ---
-    grand_total_dict = {}
-    grand_total_dict['B'] = sum(r.opening_cash or 0 for r in closed_reports)  # B: 開店現金
-    grand_total_dict['C'] = sum(r.total_sales or 0 for r in closed_reports)  # C: 手帳營收
-    grand_total_dict['D'] = sum((r.donation_total or 0) + (r.other_total or 0) for r in closed_reports)  # D: 其他現金
-    grand_total_dict['E'] = sum(r.closing_cash or 0 for r in closed_reports)  # E: 實有現金
-    
-    # A: 應有現金 = B + C + D
-    grand_total_dict['A'] = grand_total_dict['B'] + grand_total_dict['C'] + grand_total_dict['D']
-    
-    # F: 溢短收 = E - A
-    grand_total_dict['F'] = grand_total_dict['E'] - grand_total_dict['A']
-
-    grand_total_dict['J'] = sum(r.total_transactions or 0 for r in closed_reports)
-    grand_total_dict['K'] = sum(r.total_items or 0 for r in closed_reports)
+        return redirect(url_for('report.settlement', date=report_date.isoformat()))
+    return send_file(path, mimetype='application/pdf', as_attachment=True, download_name=f"settlement_report_{report_date.isoformat()}.pdf")
 
-    if is_settled:
-        grand_total_dict['H'] = daily_settlement.total_deposit
-        grand_total_dict['I'] = daily_settlement.total_next_day_opening_cash
-    else:
-        grand_total_dict['I'] = 0 
-        # H: 存款 = E - I
-        grand_total_dict['H'] = grand_total_dict['E'] - grand_total_dict['I']
+# 月曆狀態的暫存時間；資料異動時靠版本號失效
+CALENDAR_CACHE_TTL = 7 * 24 * 60 * 60
 
-    class GrandTotal:
-        def __init__(self, **entries): self.__dict__.update(entries)
-    grand_total = GrandTotal(**grand_total_dict)
-    
-    remarks_data = json.loads(daily_settlement.remarks) if daily_settlement and daily_settlement.remarks else {}
-
-    # --- 修正點：更新 finance_items 列表的順序和 attr/key ---
-    finance_items = [
-        ('A', '應有現金', 'A', 'expected_cash_new'),
-        ('B', '開店現金', 'B', 'opening_cash'),
-        ('C', '手帳營收', 'C', 'total_sales'),
-        ('D', '其他現金', 'D', 'other_cash'),
-        ('E', '實有現金', 'E', 'closing_cash'),
-        ('F', '溢短收', 'F', 'cash_diff_new'),
-        ('H', '存款', 'H', 'deposit'),
-        ('I', '明日開店現金', 'I', 'next_day_opening_cash')
-    ]
-    sales_items = [('J', '結單數', 'J', 'total_transactions'), ('K', '品項數', 'K', 'total_items')]
-
-    html_to_render = render_template(
-        'report/settlement_print.html', report_date=report_date, reports=reports, active_locations_ordered=active_locations_ordered,
-        grand_total=grand_total, remarks_data=remarks_data, finance_items=finance_items, sales_items=sales_items
-    )
-    pdf = HTML(string=html_to_render).write_pdf()
-    return Response(pdf, mimetype="application/pdf", headers={"Content-Disposition": f"attachment;filename=settlement_report_{report_date.isoformat()}.pdf"})
 
-@bp.route('/api/settlement_status')
-@login_required
-@admin_required
-def settlement_status_api():
-    year = request.args.get('year', type=int)
-    month = request.args.get('month', type=int)
-    if not year or not month: return jsonify({"error": "Year and month are required"}), 400
+def _month_range(year, month):
     start_date = date(year, month, 1)
     end_date = (start_date + timedelta(days=32)).replace(day=1) - timedelta(days=1)
+    return start_date, end_date
+
+
+def _calendar_response(kind, year, month, compute):
+    """月曆狀態 API 的回應，以月份資料版本作為強 ETag。
+
+    版本未變時回傳 304；計算結果以 ETag 為鍵暫存於 Redis，其他使用者切換到同一個月份時不需再查詢資料庫。
+    過去的月份也可能因補登日結而改變，因此每次都要求瀏覽器以 ETag 重新驗證 (no-cache)。
+    """
+    version = calendar_version(year, month)
+    etag = f"{kind}-{year}-{month:02d}-{version}" if version is not None else None
+    cached = recall_response(f"calendar:{etag}") if etag else None
+    if cached is None:
+        start_date, end_date = _month_range(year, month)
+        cached = {'data': compute(start_date, end_date)}
+        if etag:
+            remember_response(f"calendar:{etag}", cached, CALENDAR_CACHE_TTL)
+
+    if etag and request.if_none_match.contains(etag):
+        response = current_app.response_class(status=304)
+    else:
+        response = jsonify(cached['data'])
+    if etag:
+        response.set_etag(etag)
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response
+
+
+def _settlement_statuses(start_date, end_date):
     business_days = db.session.query(BusinessDay.date, BusinessDay.status, Location.name).join(Location).filter(BusinessDay.date.between(start_date, end_date)).all()
     settlements = db.session.query(DailySettlement.date).filter(DailySettlement.date.between(start_date, end_date)).all()
     settled_dates = {s.date for s in settlements}
@@ -861,16 +737,10 @@ def settlement_status_api():
         else:
             response_data[iso_date] = 'no_data'
         current_date += timedelta(days=1)
-    return jsonify(response_data)
+    return response_data
 
-@bp.route('/api/query_status')
-@login_required
-def query_status_api():
-    year = request.args.get('year', type=int)
-    month = request.args.get('month', type=int)
-    if not year or not month: return jsonify({"error": "Year and month are required"}), 400
-    start_date = date(year, month, 1)
-    end_date = (start_date + timedelta(days=32)).replace(day=1) - timedelta(days=1)
+
+def _query_statuses(start_date, end_date):
     business_days = db.session.query(BusinessDay.date, BusinessDay.status).filter(BusinessDay.date.between(start_date, end_date)).all()
     day_statuses = defaultdict(list)
     for d, status in business_days: day_statuses[d].append(status)
@@ -887,4 +757,117 @@ def query_status_api():
         else:
             response_data[iso_date] = 'no_data'
         current_date += timedelta(days=1)
-    return jsonify(response_data)
\ No newline at end of file
+    return response_data
+
+
+@bp.route('/api/settlement_status')
+@login_required
+@admin_required
+def settlement_status_api():
+    year = request.args.get('year', type=int)
+    month = request.args.get('month', type=int)
+    if not year or not month: return jsonify({"error": "Year and month are required"}), 400
+    return _calendar_response('settlement', year, month, _settlement_statuses)
+
+@bp.route('/api/query_status')
+@login_required
+def query_status_api():
+    year = request.args.get('year', type=int)
+    month = request.args.get('month', type=int)
+    if not year or not month: return jsonify({"error": "Year and month are required"}), 400
+    return _calendar_response('query', year, month, _query_statuses)
+
+@bp.route('/api/reference_data')
+@login_required
+def reference_data_api():
+    """據點與類別清單，以資料版本作為 ETag，瀏覽器可以快取並以 304 重新驗證。"""
+    data = get_reference_data()
+    etag = f"reference-{data.version}" if data.version is not None else None
+    if etag and request.if_none_match.contains(etag):
+        response = current_app.response_class(status=304)
+    else:
+        response = jsonify({
+            'locations': [loc._asdict() for loc in data.locations],
+            'categories': list(data.categories),
+        })
+    if etag:
+        response.set_etag(etag)
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response
+
+TRANSACTION_LOG_PAGE_SIZE = 100
+TRANSACTION_LOG_MAX_PAGE_SIZE = 500
+
+@bp.route('/api/transaction_log')
+@login_required
+@admin_required
+def transaction_log_api():
+    """以 (交易時間, 交易 id) 為游標分頁回傳交易明細，供交易細節報表捲動時載入"""
+    try:
+        start_date = date.fromisoformat(request.args.get('start_date'))
+        end_date = date.fromisoformat(request.args.get('end_date')) if request.args.get('end_date') else start_date
+    except (ValueError, TypeError):
+        return jsonify({"error": "Invalid start_date or end_date"}), 400
+    location_id = request.args.get('location_id', 'all')
+    limit = min(request.args.get('limit', TRANSACTION_LOG_PAGE_SIZE, type=int) or TRANSACTION_LOG_PAGE_SIZE, TRANSACTION_LOG_MAX_PAGE_SIZE)
+
+    query = db.session.query(Transaction).join(Transaction.business_day).options(
+        selectinload(Transaction.items).selectinload(TransactionItem.category),
+        db.contains_eager(Transaction.business_day).joinedload(BusinessDay.location)
+    ).filter(BusinessDay.date.between(start_date, end_date))
+    if location_id != 'all':
+        query = query.filter(BusinessDay.location_id == location_id)
+
+    after_timestamp = request.args.get('after_timestamp')
+    after_id = request.args.get('after_id', type=int)
+    if after_timestamp and after_id is not None:
+        try:
+            after_timestamp = datetime.fromisoformat(after_timestamp)
+        except ValueError:
+            return jsonify({"error": "Invalid cursor"}), 400
+        query = query.filter(or_(
+            Transaction.timestamp > after_timestamp,
+            and_(Transaction.timestamp == after_timestamp, Transaction.id > after_id)
+        ))
+
+    # 多取一筆以判斷是否還有下一頁
+    transactions = query.order_by(Transaction.timestamp, Transaction.id).limit(limit + 1).all()
+    has_more = len(transactions) > limit
+    transactions = transactions[:limit]
+
+    next_cursor = None
+    if has_more:
+        last = transactions[-1]
+        next_cursor = {'after_timestamp': last.timestamp.isoformat(), 'after_id': last.id}
+    return jsonify({
+        'transactions': [{
+            'id': t.id,
+            'timestamp': t.timestamp.strftime('%Y-%m-%d %H:%M:%S'),
+            'location_name': t.business_day.location.name,
+            'cash_received': t.cash_received,
+            'amount': t.amount,
+            'change_given': t.change_given,
+            'items': [{
+                'id': item.id,
+                'price': item.price,
+                'category_id': item.category.id if item.category else None,
+                'category_name': item.category.name if item.category else None,
+                'category_type': item.category.category_type if item.category else None
+            } for item in t.items]
+        } for t in transactions],
+        'next_cursor': next_cursor
+    })
+
+@bp.route('/api/report_job/<job_id>')
+@login_required
+def report_job_status_api(job_id):
+    """背景產生中的報表狀態，查詢頁面輪詢到 ready 後重新載入以顯示結果"""
+    try:
+        job = fetch_report_job(job_id)
+        if job is None:
+            return jsonify({"error": "Job not found"}), 404
+        return jsonify(report_job_status(job))
+    except RedisError as e:
+        current_app.logger.warning(f"查詢報表背景任務狀態失敗: {e}")
+        return jsonify({"error": "Job status unavailable"}), 503
@@ -0,0 +1,131 @@
+# app/services/analytics_service.py
+import numpy as np
+
+
+def load_columns(stmt):
+    """以單一 Core select 讀取報表需要的欄位，回傳 {欄位名稱: numpy 陣列 (object dtype，保留原始值)}。"""
+    from .. import db
+
+    result = db.session.execute(stmt)
+    names = list(result.keys())
+    rows = result.all()
+    columns = {}
+    for index, name in enumerate(names):
+        column = np.empty(len(rows), dtype=object)
+        column[:] = [row[index] for row in rows]
+        columns[name] = column
+    return columns
+
+
+def numeric(values):
+    """轉為 float 陣列，NULL 視為 0 (與報表中 `value or 0` 的處理一致)。"""
+    return np.nan_to_num(np.asarray(values, dtype=float))
+
+
+def counts(values):
+    """加總後的筆數轉回整數，避免模板顯示成 5.0。"""
+    return np.rint(values).astype(np.int64)
+
+
+def group_sum(keys, values, order='sorted'):
+    """依 keys 分組加總 values，回傳 (分組鍵, 加總值)。
+
+    order 為 'sorted' 時依鍵值排序，'first' 時依各鍵第一次出現的順序。
+    """
+    labels, first_index, inverse = np.unique(keys, return_index=True, return_inverse=True)
+    sums = np.bincount(inverse.ravel(), weights=numeric(values), minlength=len(labels))
+    if order == 'first':
+        ordering = np.argsort(first_index, kind='stable')
+        return labels[ordering], sums[ordering]
+    return labels, sums
+
+
+def pivot_sum(row_keys, column_keys, values):
+    """以 (row_key, column_key) 分組加總為二維表，回傳 (列鍵, 欄鍵, 矩陣)，列鍵與欄鍵皆已排序。"""
+    row_labels, row_index = np.unique(row_keys, return_inverse=True)
+    column_labels, column_index = np.unique(column_keys, return_inverse=True)
+    flat = row_index.ravel() * len(column_labels) + column_index.ravel()
+    matrix = np.bincount(flat, weights=numeric(values), minlength=len(row_labels) * len(column_labels))
+    return row_labels, column_labels, matrix.reshape(len(row_labels), len(column_labels))
+
+
+def date_parts(dates):
+    """將 date 陣列拆成 (年, 月, 季) 三個整數陣列。"""
+    days = np.asarray(dates, dtype='datetime64[D]')
+    years = days.astype('datetime64[Y]').astype(np.int64) + 1970
+    months = days.astype('datetime64[M]').astype(np.int64) % 12 + 1
+    return years, months, (months - 1) // 3 + 1
+
+
+def series_by_location(dates, locations, values):
+    """每日 × 據點的折線/長條圖資料：labels 為排序後的日期，每個據點 (依名稱排序) 一條數列。"""
+    if len(dates) == 0:
+        return None
+    date_labels, location_labels, matrix = pivot_sum([d.isoformat() for d in dates], locations, values)
+    return {
+        'labels': date_labels.tolist(),
+        'datasets': [{'label': name, 'data': matrix[:, i].tolist()} for i, name in enumerate(location_labels.tolist())]
+    }
+
+
+def totals_by_label(labels, values, dataset_label):
+    """依 labels 加總的單一數列圖表，標籤依第一次出現的順序排列。"""
+    if len(labels) == 0:
+        return None
+    keys, sums = group_sum(labels, values, order='first')
+    return {'labels': keys.tolist(), 'datasets': [{'label': dataset_label, 'data': sums.tolist()}]}
+
+
+def column_chart(labels, series):
+    """已彙總好的欄位直接轉為圖表資料，series 為 [(數列名稱, 數值欄位, 其他 Chart.js 設定)]。"""
+    return {
+        'labels': list(labels),
+        'datasets': [dict({'label': name, 'data': np.asarray(values).tolist()}, **options) for name, values, options in series]
+    }
+
+
+def _period_codes(dates, time_unit):
+    years, months, quarters = date_parts(dates)
+    if time_unit == 'year':
+        return years
+    if time_unit == 'quarter':
+        return years * 10 + quarters
+    return years * 100 + months
+
+
+def _period_label(code, time_unit):
+    if time_unit == 'year':
+        return str(code)
+    if time_unit == 'quarter':
+        return f"{code // 10}-Q{code % 10}"
+    return f"{code // 100}-{code % 100:02d}"
+
+
+def compare_periods(dates, sales, transactions, mask_a, mask_b, time_unit):
+    """兩個期間依年、季或月分組的銷售比較，回傳報表資料列 (依期間排序)。
+
+    mask_a、mask_b 標示每一筆營業日資料屬於哪個期間 (兩個期間可以重疊)。
+    """
+    if len(dates) == 0:
+        return []
+    codes = _period_codes(dates, time_unit)
+    sales = numeric(sales)
+    transactions = numeric(transactions)
+    keys = np.union1d(codes[mask_a], codes[mask_b])
+    index = np.searchsorted(keys, codes)
+
+    def sums(values, mask):
+        return np.bincount(index[mask], weights=values[mask], minlength=len(keys))
+
+    sales_a, sales_b = sums(sales, mask_a), sums(sales, mask_b)
+    trans_a, trans_b = counts(sums(transactions, mask_a)), counts(sums(transactions, mask_b))
+    sales_diff = sales_b - sales_a
+    with np.errstate(divide='ignore', invalid='ignore'):
+        sales_perc = np.where(sales_a != 0, sales_diff / np.where(sales_a != 0, sales_a, 1) * 100, np.inf)
+    return [{
+        'label': _period_label(code, time_unit), 'sales_a': sa, 'trans_a': ta, 'sales_b': sb, 'trans_b': tb,
+        'sales_diff': diff, 'sales_perc': perc
+    } for code, sa, ta, sb, tb, diff, perc in zip(
+        keys.tolist(), sales_a.tolist(), trans_a.tolist(), sales_b.tolist(), trans_b.tolist(),
+        sales_diff.tolist(), sales_perc.tolist()
+    )]
@@ -0,0 +1,56 @@
+# app/services/business_day_service.py
+import threading
+from collections import namedtuple
+
+from .cache_service import get_version, bump_version
+
+LocationRef = namedtuple('LocationRef', ['id', 'name', 'slug'])
+OpenBusinessDay = namedtuple('OpenBusinessDay', ['business_day_id', 'location'])
+
+_NAMESPACE = 'open_business_days'
+_state = {'version': None, 'entries': {}}
+_lock = threading.Lock()
+
+
+def _query_open_day(location_slug, day):
+    from .. import db
+    from ..models import BusinessDay, Location
+    row = db.session.query(BusinessDay.id, Location.id, Location.name, Location.slug).join(Location).filter(
+        Location.slug == location_slug,
+        BusinessDay.date == day,
+        BusinessDay.status == 'OPEN'
+    ).first()
+    if row is None:
+        return None
+    business_day_id, location_id, location_name, slug = row
+    return OpenBusinessDay(business_day_id, LocationRef(location_id, location_name, slug))
+
+
+def resolve_open_day(location_slug, day):
+    """將 (據點 slug, 日期) 對應到營業中的營業日 id 與據點資訊；查無營業中紀錄時回傳 None。
+
+    結果快取於行程內，並以 Redis 上的版本號判斷是否仍有效；Redis 無法連線時每次都查詢資料庫。
+    """
+    version = get_version(_NAMESPACE)
+    key = (location_slug, day)
+    if version is not None and _state['version'] == version:
+        cached = _state['entries'].get(key)
+        if cached:
+            return cached
+
+    open_day = _query_open_day(location_slug, day)
+    if open_day and version is not None:
+        with _lock:
+            if _state['version'] != version:
+                _state['version'] = version
+                _state['entries'] = {}
+            _state['entries'][key] = open_day
+    return open_day
+
+
+def invalidate_open_days():
+    """營業日狀態或據點資料異動並 commit 後呼叫，讓所有行程重新解析營業中的營業日。"""
+    with _lock:
+        _state['version'] = None
+        _state['entries'] = {}
+    bump_version(_NAMESPACE)
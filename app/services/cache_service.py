@@ -0,0 +1,63 @@
+# app/services/cache_service.py
+import json
+from flask import current_app
+from redis.exceptions import RedisError
+
+
+def _version_key(namespace):
+    return f"cache_version:{namespace}"
+
+
+def get_version(namespace):
+    """讀取快取命名空間目前的版本號；Redis 無法連線時回傳 None，呼叫端應視為快取失效。"""
+    try:
+        value = current_app.redis.get(_version_key(namespace))
+    except RedisError as e:
+        current_app.logger.warning(f"讀取快取版本 '{namespace}' 失敗: {e}")
+        return None
+    return int(value) if value else 0
+
+
+def get_versions(namespaces):
+    """一次讀取多個快取命名空間的版本號 (list，順序同 namespaces)；Redis 無法連線時回傳 None。"""
+    try:
+        values = current_app.redis.mget([_version_key(namespace) for namespace in namespaces])
+    except RedisError as e:
+        current_app.logger.warning(f"讀取快取版本失敗: {e}")
+        return None
+    return [int(value) if value else 0 for value in values]
+
+
+def bump_version(namespace):
+    """將快取命名空間的版本號加一，讓所有行程中的舊快取在下次讀取時失效。"""
+    try:
+        return current_app.redis.incr(_version_key(namespace))
+    except RedisError as e:
+        current_app.logger.warning(f"更新快取版本 '{namespace}' 失敗: {e}")
+        return None
+
+
+def remember_response(key, payload, ttl_seconds):
+    """將 JSON 可序列化的回應暫存於 Redis，供短時間內的重送請求直接取用。"""
+    try:
+        current_app.redis.set(f"response_cache:{key}", json.dumps(payload), ex=ttl_seconds)
+    except RedisError as e:
+        current_app.logger.warning(f"暫存回應 '{key}' 失敗: {e}")
+
+
+def recall_response(key):
+    """取回 remember_response 暫存的回應；不存在或 Redis 無法連線時回傳 None。"""
+    try:
+        value = current_app.redis.get(f"response_cache:{key}")
+    except RedisError as e:
+        current_app.logger.warning(f"讀取暫存回應 '{key}' 失敗: {e}")
+        return None
+    return json.loads(value) if value else None
+
+
+def forget_response(key):
+    """刪除 remember_response 暫存的回應，讓下次讀取時重新查詢。"""
+    try:
+        current_app.redis.delete(f"response_cache:{key}")
+    except RedisError as e:
+        current_app.logger.warning(f"刪除暫存回應 '{key}' 失敗: {e}")
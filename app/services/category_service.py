@@ -0,0 +1,59 @@
+# app/services/category_service.py
+import threading
+from collections import namedtuple
+from types import MappingProxyType
+
+from .cache_service import get_version, bump_version
+
+# 計入「手帳營收」的類別類型 (商品與各種折扣)
+SALES_CATEGORY_TYPES = ('product', 'discount_fixed', 'discount_percent', 'buy_n_get_m', 'buy_x_get_x_minus_1', 'buy_odd_even')
+
+CategoryEntry = namedtuple('CategoryEntry', ['id', 'name', 'color', 'category_type', 'discount_rules', 'rules'])
+
+_catalogs = {}
+_lock = threading.Lock()
+
+
+def _namespace(location_id):
+    return f"category_catalog:{location_id}"
+
+
+def _load_catalog(location_id):
+    from ..models import Category
+    entries = {}
+    for c in Category.query.filter_by(location_id=location_id).order_by(Category.id).all():
+        entries[c.id] = CategoryEntry(
+            id=c.id,
+            name=c.name,
+            color=c.color,
+            category_type=c.category_type,
+            discount_rules=c.discount_rules,
+            rules=MappingProxyType(c.get_rules()),
+        )
+    return MappingProxyType(entries)
+
+
+def get_catalog(location_id):
+    """取得據點的類別目錄 (唯讀的 id -> CategoryEntry 對照表)，依版本號快取於行程內。"""
+    version = get_version(_namespace(location_id))
+    if version is None:
+        with _lock:
+            _catalogs.pop(location_id, None)
+        return _load_catalog(location_id)
+
+    cached = _catalogs.get(location_id)
+    if cached and cached[0] == version:
+        return cached[1]
+
+    catalog = _load_catalog(location_id)
+    with _lock:
+        _catalogs[location_id] = (version, catalog)
+    return catalog
+
+
+def invalidate_catalog(location_id):
+    """類別資料異動並 commit 後呼叫，讓所有行程重新載入該據點的類別目錄。"""
+    with _lock:
+        _catalogs.pop(location_id, None)
+    bump_version(_namespace(location_id))
+
@@ -0,0 +1,115 @@
+# app/services/category_totals_service.py
+from collections import defaultdict
+
+from sqlalchemy import func, case, select, insert, delete, update
+
+# 單次 IN 查詢的營業日數量上限，避免超過資料庫的參數個數限制
+_CHUNK_SIZE = 500
+
+
+def _summarize_items(items):
+    """將品項 (dict，含 category_id 與 price) 依類別彙總為 {category_id: [件數, 銷售額, 折扣額]}。"""
+    totals = defaultdict(lambda: [0, 0.0, 0.0])
+    for item in items:
+        price = float(item['price'])
+        entry = totals[int(item['category_id'])]
+        if price > 0:
+            entry[0] += 1
+            entry[1] += price
+        elif price < 0:
+            entry[2] -= price
+    return totals
+
+
+def _upsert_statement(dialect_name, table):
+    """取得支援 ON CONFLICT 的 INSERT 建構函式；不支援的資料庫回傳 None。"""
+    if dialect_name == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    elif dialect_name == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    else:
+        return None
+    return dialect_insert(table)
+
+
+def increment_rows(table, key_columns, value_columns, rows):
+    """將 rows 中 value_columns 欄位的數值累加到彙總表既有的資料列，不存在時新增整列 (不 commit)。
+
+    以資料庫端的 upsert 累加，多個收銀台同時結帳也不會互相覆蓋。
+    """
+    from .. import db
+
+    if not rows:
+        return
+    stmt = _upsert_statement(db.session.get_bind().dialect.name, table)
+    if stmt is not None:
+        stmt = stmt.values(rows)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[table.c[name] for name in key_columns],
+            set_={name: table.c[name] + stmt.excluded[name] for name in value_columns}
+        )
+        db.session.execute(stmt)
+        return
+
+    for row in rows:
+        result = db.session.execute(
+            update(table).where(
+                *[table.c[name] == row[name] for name in key_columns]
+            ).values(
+                {name: table.c[name] + row[name] for name in value_columns}
+            )
+        )
+        if result.rowcount == 0:
+            db.session.execute(insert(table).values(**row))
+
+
+def add_item_totals(business_day_id, items):
+    """將新結帳的品項累加到營業日類別彙總 (不 commit，與交易寫入同一個資料庫交易)。"""
+    from ..models import BusinessDayCategoryTotal
+
+    rows = [
+        {'business_day_id': business_day_id, 'category_id': category_id,
+         'item_count': item_count, 'gross': gross, 'discount': discount}
+        for category_id, (item_count, gross, discount) in sorted(_summarize_items(items).items())
+    ]
+    increment_rows(BusinessDayCategoryTotal.__table__, ('business_day_id', 'category_id'),
+                   ('item_count', 'gross', 'discount'), rows)
+
+
+def rebuild_category_totals(business_day_ids):
+    """依交易品項重新計算指定營業日的類別彙總 (不 commit)，用於修改既有交易後與補建歷史資料。"""
+    from .. import db
+    from ..models import BusinessDayCategoryTotal, Transaction, TransactionItem
+
+    ids = sorted({i for i in business_day_ids if i is not None})
+    table = BusinessDayCategoryTotal.__table__
+    db.session.flush()
+    for start in range(0, len(ids), _CHUNK_SIZE):
+        chunk = ids[start:start + _CHUNK_SIZE]
+        db.session.execute(delete(table).where(table.c.business_day_id.in_(chunk)))
+        summary = select(
+            Transaction.business_day_id,
+            TransactionItem.category_id,
+            func.count(case((TransactionItem.price > 0, TransactionItem.id), else_=None)),
+            func.sum(case((TransactionItem.price > 0, TransactionItem.price), else_=0)),
+            func.sum(case((TransactionItem.price < 0, -TransactionItem.price), else_=0))
+        ).join(TransactionItem.transaction).where(
+            Transaction.business_day_id.in_(chunk)
+        ).group_by(Transaction.business_day_id, TransactionItem.category_id)
+        db.session.execute(insert(table).from_select(
+            ['business_day_id', 'category_id', 'item_count', 'gross', 'discount'], summary
+        ))
+
+
+def backfill_category_totals(batch_size=_CHUNK_SIZE, progress=None):
+    """依歷史交易重建所有營業日的類別彙總，每批營業日 commit 一次；回傳處理的營業日數。"""
+    from .. import db
+    from ..models import BusinessDay
+
+    ids = [row[0] for row in db.session.query(BusinessDay.id).order_by(BusinessDay.id).all()]
+    for start in range(0, len(ids), batch_size):
+        rebuild_category_totals(ids[start:start + batch_size])
+        db.session.commit()
+        if progress:
+            progress(min(start + batch_size, len(ids)), len(ids))
+    return len(ids)
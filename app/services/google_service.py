@@ -6,10 +6,13 @@ from google.oauth2.credentials import Credentials
 from google.auth.transport.requests import Request
 from datetime import datetime
 from googleapiclient.errors import HttpError
-from sqlalchemy import func, extract
-from collections import defaultdict
 import requests
 
+from .cache_service import remember_response, recall_response, forget_response
+
+# Drive 資料夾、試算表 id 與工作表名稱在 Redis 中的保存時間；檔案被刪除 (404) 時會清除並重新查詢
+DRIVE_ID_CACHE_TTL = 7 * 24 * 60 * 60
+
 # 新增：從環境變數讀取 JSON 內容並寫入檔案
 def write_creds_from_env(app):
     token_file = os.path.join(app.instance_path, "token.json")
@@ -91,16 +94,19 @@ def find_or_create_folder(drive_service, folder_name):
         )
         return folder.get("id")
 
-def find_or_create_spreadsheet(drive_service, sheets_service, folder_id, location_obj, overwrite=False):
+def spreadsheet_file_name(location_obj, year=None):
     from app.models import SystemSetting
     now = datetime.now()
     filename_format = SystemSetting.get('sheets_filename_format', '{location_name}_{year}_業績')
-    file_name = filename_format.format(
+    return filename_format.format(
         location_name=location_obj.name,
         location_slug=location_obj.slug,
-        year=now.year,
+        year=year or now.year,
         month=f"{now.month:02d}"
     )
+
+def find_or_create_spreadsheet(drive_service, sheets_service, folder_id, location_obj, overwrite=False, year=None):
+    file_name = spreadsheet_file_name(location_obj, year)
     response = (
         drive_service.files()
         .list(
@@ -155,6 +161,44 @@ def find_or_create_spreadsheet(drive_service, sheets_service, folder_id, locatio
     current_app.logger.info(f"成功將試算表移動至資料夾 ID: {folder_id}")
     return spreadsheet_id
 
+def _folder_cache_key(folder_name):
+    return f"drive_folder:{folder_name}"
+
+def _spreadsheet_cache_key(folder_name, file_name):
+    return f"drive_spreadsheet:{folder_name}:{file_name}"
+
+def _sheet_titles_cache_key(spreadsheet_id):
+    return f"sheet_titles:{spreadsheet_id}"
+
+def get_spreadsheet_id(drive_service, sheets_service, folder_name, location_obj, overwrite=False, year=None):
+    """據點 year 年度 (預設為本年度) 試算表的 id；資料夾與試算表 id 以 (資料夾名稱, 檔名) 為鍵暫存於 Redis，命中時不需呼叫 Drive API。
+
+    檔名由檔名格式、據點與年份組成，設定變更或跨年度時自然對應到新的鍵；overwrite 時一律重建並更新暫存。
+    """
+    file_name = spreadsheet_file_name(location_obj, year)
+    spreadsheet_key = _spreadsheet_cache_key(folder_name, file_name)
+    if not overwrite:
+        spreadsheet_id = recall_response(spreadsheet_key)
+        if spreadsheet_id:
+            return spreadsheet_id
+
+    folder_id = recall_response(_folder_cache_key(folder_name))
+    if not folder_id:
+        folder_id = find_or_create_folder(drive_service, folder_name)
+        if not folder_id:
+            return None
+        remember_response(_folder_cache_key(folder_name), folder_id, DRIVE_ID_CACHE_TTL)
+    spreadsheet_id = find_or_create_spreadsheet(drive_service, sheets_service, folder_id, location_obj,
+                                                overwrite=overwrite, year=year)
+    if spreadsheet_id:
+        remember_response(spreadsheet_key, spreadsheet_id, DRIVE_ID_CACHE_TTL)
+    return spreadsheet_id
+
+def forget_spreadsheet_id(folder_name, location_obj, year=None):
+    """試算表或資料夾已不存在 (404) 時清除暫存的 id，下次重新查詢或建立。"""
+    forget_response(_spreadsheet_cache_key(folder_name, spreadsheet_file_name(location_obj, year)))
+    forget_response(_folder_cache_key(folder_name))
+
 def ensure_sheet_with_header_exists(sheets_service, spreadsheet_id, sheet_name, header_row):
     spreadsheet = sheets_service.spreadsheets().get(spreadsheetId=spreadsheet_id).execute()
     sheet_exists = any(sheet["properties"]["title"] == sheet_name for sheet in spreadsheet.get("sheets", []))
@@ -175,6 +219,54 @@ def bulk_write_data(sheets_service, spreadsheet_id, sheet_name, data_rows):
         valueInputOption="USER_ENTERED", body=body
     ).execute()
 
+def get_sheet_titles(sheets_service, spreadsheet_id):
+    spreadsheet = sheets_service.spreadsheets().get(spreadsheetId=spreadsheet_id, fields="sheets.properties.title").execute()
+    return {sheet["properties"]["title"] for sheet in spreadsheet.get("sheets", [])}
+
+def cached_sheet_titles(sheets_service, spreadsheet_id):
+    """試算表中的工作表名稱，暫存於 Redis；工作表在雲端被刪除時需呼叫 forget_sheet_titles。"""
+    titles = recall_response(_sheet_titles_cache_key(spreadsheet_id))
+    if titles is None:
+        titles = get_sheet_titles(sheets_service, spreadsheet_id)
+        remember_sheet_titles(spreadsheet_id, titles)
+    return set(titles)
+
+def remember_sheet_titles(spreadsheet_id, titles):
+    remember_response(_sheet_titles_cache_key(spreadsheet_id), sorted(titles), DRIVE_ID_CACHE_TTL)
+
+def forget_sheet_titles(spreadsheet_id):
+    forget_response(_sheet_titles_cache_key(spreadsheet_id))
+
+def add_sheets(sheets_service, spreadsheet_id, sheet_names):
+    if not sheet_names:
+        return
+    requests = [{"addSheet": {"properties": {"title": name}}} for name in sheet_names]
+    sheets_service.spreadsheets().batchUpdate(spreadsheetId=spreadsheet_id, body={"requests": requests}).execute()
+
+def clear_sheets(sheets_service, spreadsheet_id, sheet_names):
+    if not sheet_names:
+        return
+    sheets_service.spreadsheets().values().batchClear(
+        spreadsheetId=spreadsheet_id, body={"ranges": [f"'{name}'" for name in sheet_names]}
+    ).execute()
+
+# 單次 values.batchUpdate 寫入的列數上限，避免請求內容過大
+MAX_ROWS_PER_REQUEST = 5000
+
+def batch_write_values(sheets_service, spreadsheet_id, value_ranges):
+    """以 values.batchUpdate 一次寫入多個範圍 ([{'range': ..., 'values': [...]}])，資料量大時分成多次請求。"""
+    batch, batch_rows = [], 0
+    for value_range in value_ranges:
+        if batch and batch_rows + len(value_range['values']) > MAX_ROWS_PER_REQUEST:
+            sheets_service.spreadsheets().values().batchUpdate(
+                spreadsheetId=spreadsheet_id, body={"valueInputOption": "USER_ENTERED", "data": batch}).execute()
+            batch, batch_rows = [], 0
+        batch.append(value_range)
+        batch_rows += len(value_range['values'])
+    if batch:
+        sheets_service.spreadsheets().values().batchUpdate(
+            spreadsheetId=spreadsheet_id, body={"valueInputOption": "USER_ENTERED", "data": batch}).execute()
+
 def write_transaction_to_sheet_task(location_id, transaction_data, header_row):
     app = create_app()
     with app.app_context():
@@ -188,9 +280,7 @@ def write_transaction_to_sheet_task(location_id, transaction_data, header_row):
             drive_service, sheets_service = get_services(app)
             if not drive_service: return
             folder_name = SystemSetting.get('drive_folder_name', 'Cashier_System_Reports')
-            folder_id = find_or_create_folder(drive_service, folder_name)
-            if not folder_id: return
-            spreadsheet_id = find_or_create_spreadsheet(drive_service, sheets_service, folder_id, location)
+            spreadsheet_id = get_spreadsheet_id(drive_service, sheets_service, folder_name, location)
             if not spreadsheet_id: return
             month_sheet_name = datetime.now().strftime("%Y年%m月")
             ensure_sheet_with_header_exists(sheets_service, spreadsheet_id, month_sheet_name, header_row)
@@ -201,7 +291,46 @@ def write_transaction_to_sheet_task(location_id, transaction_data, header_row):
         except Exception as e:
             current_app.logger.error(f"!!! [背景任務] 寫入交易紀錄時發生未預期的嚴重錯誤: {e}", exc_info=True)
 
-def write_report_to_sheet_task(location_id, report_data, header_row):
+def _sync_group(drive_service, sheets_service, folder_name, locations, year, include_transactions, overwrite):
+    from app import db
+    from .sheet_sync_service import sync_spreadsheet
+    spreadsheet_id = get_spreadsheet_id(drive_service, sheets_service, folder_name, locations[0],
+                                        overwrite=overwrite, year=year)
+    if not spreadsheet_id:
+        return None
+    try:
+        return sync_spreadsheet(sheets_service, spreadsheet_id, locations, year, include_transactions=include_transactions)
+    except HttpError as e:
+        if e.resp.status != 404:
+            raise
+        db.session.rollback()
+        current_app.logger.warning(f"找不到暫存的試算表 (ID: {spreadsheet_id})，將重新查詢。")
+        forget_spreadsheet_id(folder_name, locations[0], year)
+    spreadsheet_id = get_spreadsheet_id(drive_service, sheets_service, folder_name, locations[0], year=year)
+    if not spreadsheet_id:
+        return None
+    return sync_spreadsheet(sheets_service, spreadsheet_id, locations, year, include_transactions=include_transactions)
+
+def sync_to_spreadsheets(drive_service, sheets_service, folder_name, locations, include_transactions=True, overwrite=False, year=None):
+    """將據點在 year 年度 (預設為本年度) 的資料同步到該年度的試算表，寫入同一個試算表的據點合併為一次同步。
+
+    回傳 {檔名: 寫入的資料列數}，找不到也無法建立試算表時為 None。暫存的試算表 id 已失效
+    (檔案被刪除，API 回應 404) 時清除暫存，重新查詢或建立後再同步一次。
+    """
+    year = year or datetime.now().year
+    groups = {}
+    for location in locations:
+        groups.setdefault(spreadsheet_file_name(location, year), []).append(location)
+    return {
+        file_name: _sync_group(drive_service, sheets_service, folder_name, group, year, include_transactions, overwrite)
+        for file_name, group in groups.items()
+    }
+
+def write_report_to_sheet_task(location_id, report_data=None, header_row=None):
+    """營業日歸檔後的背景任務：將該據點尚未同步的每日摘要與每月數據增量寫入試算表。
+
+    已由 flush_sheet_sync_task 取代；report_data 與 header_row 保留給已排入佇列的舊任務使用，資料一律由資料庫讀取。
+    """
     app = create_app()
     with app.app_context():
         from app.models import SystemSetting, Location
@@ -214,129 +343,88 @@ def write_report_to_sheet_task(location_id, report_data, header_row):
             drive_service, sheets_service = get_services(app)
             if not drive_service: return
             folder_name = SystemSetting.get('drive_folder_name', 'Cashier_System_Reports')
-            folder_id = find_or_create_folder(drive_service, folder_name)
-            if not folder_id: return
-            spreadsheet_id = find_or_create_spreadsheet(drive_service, sheets_service, folder_id, location)
-            if not spreadsheet_id: return
-            summary_sheet_name = "每日摘要"
-            ensure_sheet_with_header_exists(sheets_service, spreadsheet_id, summary_sheet_name, header_row)
-            append_data(sheets_service, spreadsheet_id, summary_sheet_name, report_data)
-            update_monthly_summary(sheets_service, spreadsheet_id, location_id)
+            sync_to_spreadsheets(drive_service, sheets_service, folder_name, [location], include_transactions=False)
         except HttpError as e:
+            db.session.rollback()
             error_details = e.content.decode('utf-8')
             current_app.logger.error(f"!!! [背景任務] Google API HTTP 錯誤: {e.resp.status} {e.resp.reason}, 詳細資訊: {error_details}")
         except Exception as e:
+            db.session.rollback()
             current_app.logger.error(f"!!! [背景任務] 寫入每日摘要時發生未預期的嚴重錯誤: {e}", exc_info=True)
 
-def update_monthly_summary(sheets_service, spreadsheet_id, location_id):
-    from app.models import BusinessDay
-    from app import db
-    now = datetime.now()
-    year, month = now.year, now.month
-    monthly_stats = db.session.query(
-        func.sum(BusinessDay.total_sales).label('total_sales'),
-        func.sum(BusinessDay.cash_diff).label('cash_diff'),
-        func.sum(BusinessDay.total_transactions).label('total_transactions'),
-        func.sum(BusinessDay.total_items).label('total_items')
-    ).filter(
-        BusinessDay.location_id == location_id,
-        extract('year', BusinessDay.date) == year,
-        extract('month', BusinessDay.date) == month,
-        BusinessDay.status == 'CLOSED'
-    ).first()
-    if not monthly_stats.total_sales:
-        return
-    sheet_name = "每月數據"
-    header = ["月份", "總銷售額", "總帳差", "總交易筆數", "總銷售件數"]
-    ensure_sheet_with_header_exists(sheets_service, spreadsheet_id, sheet_name, header)
-    result = sheets_service.spreadsheets().values().get(spreadsheetId=spreadsheet_id, range=sheet_name).execute()
-    values = result.get('values', [])
-    month_str = f"{year}-{month:02d}"
-    update_row_index = -1
-    for i, row in enumerate(values):
-        if row and row[0] == month_str:
-            update_row_index = i + 1
-            break
-    row_data = [
-        month_str,
-        monthly_stats.total_sales or 0,
-        monthly_stats.cash_diff or 0,
-        monthly_stats.total_transactions or 0,
-        monthly_stats.total_items or 0
-    ]
-    if update_row_index != -1:
-        range_to_update = f"'{sheet_name}'!A{update_row_index}"
-        body = {'values': [row_data]}
-        sheets_service.spreadsheets().values().update(
-            spreadsheetId=spreadsheet_id, range=range_to_update,
-            valueInputOption="USER_ENTERED", body=body
-        ).execute()
-        current_app.logger.info(f"成功更新 '{sheet_name}' 工作表中 '{month_str}' 的數據。")
-    else:
-        append_data(sheets_service, spreadsheet_id, sheet_name, row_data)
-        current_app.logger.info(f"成功在 '{sheet_name}' 工作表中新增 '{month_str}' 的數據。")
+def flush_sheet_sync_task():
+    """合併寫入的背景任務：於第一次請求 SHEET_SYNC_DELAY 秒後執行，將這段時間內收集到的據點依試算表一次寫入。
+
+    同一段時間內多次歸檔 (同一據點或不同據點) 只會排入一個任務，每個試算表只需要一次 values.batchUpdate；
+    寫入失敗時將據點放回待同步清單，SHEET_SYNC_RETRY_DELAY 秒後重試。
+    """
+    app = create_app()
+    with app.app_context():
+        from app.models import SystemSetting, Location
+        from app import db
+        from .sheet_sync_service import take_pending_sheet_syncs, retry_sheet_syncs
+        pending = take_pending_sheet_syncs()
+        if not pending:
+            return
+        drive_service, sheets_service = get_services(app)
+        if not drive_service:
+            current_app.logger.warning(f"[背景任務] 無法獲取 Google 服務，略過 {len(pending)} 筆據點年度的同步。")
+            return
+        folder_name = SystemSetting.get('drive_folder_name', 'Cashier_System_Reports')
+        years = {}
+        for location_id, year in pending:
+            years.setdefault(year, []).append(location_id)
+        for year, location_ids in sorted(years.items()):
+            try:
+                locations = Location.query.filter(Location.id.in_(location_ids)).order_by(Location.id).all()
+                written = sync_to_spreadsheets(drive_service, sheets_service, folder_name, locations,
+                                               include_transactions=False, year=year)
+                current_app.logger.info(f"[背景任務] 已同步 {len(locations)} 個據點 {year} 年度的每日摘要: {written}")
+                continue
+            except HttpError as e:
+                db.session.rollback()
+                error_details = e.content.decode('utf-8')
+                current_app.logger.error(f"!!! [背景任務] Google API HTTP 錯誤: {e.resp.status} {e.resp.reason}, 詳細資訊: {error_details}")
+            except Exception as e:
+                db.session.rollback()
+                current_app.logger.error(f"!!! [背景任務] 寫入每日摘要時發生未預期的嚴重錯誤: {e}", exc_info=True)
+            # 同步可重複執行，已寫入的試算表重試時不會重複寫入
+            retry_sheet_syncs((location_id, year) for location_id in location_ids)
+
+def sync_backup_task(overwrite=False):
+    """將所有據點的每日摘要、每月數據與交易紀錄增量同步到 Google Sheets。
 
-def rebuild_backup_task(overwrite=False):
+    每個有營業資料的年度寫入各自的試算表，依同步進度只寫入新增與修改過的資料；overwrite 時刪除並重建試算表，再完整寫入一次。
+    """
     app = create_app()
     with app.app_context():
-        from app.models import Location, BusinessDay, Transaction, SystemSetting
+        from app.models import Location, SystemSetting
         from app import db
-        current_app.logger.info(f"--- 開始執行完整備份任務 (Overwrite={overwrite}) ---")
+        from .sheet_sync_service import synced_years
+        current_app.logger.info(f"--- 開始執行雲端同步任務 (Overwrite={overwrite}) ---")
         try:
             drive_service, sheets_service = get_services(app)
             if not drive_service or not sheets_service:
-                current_app.logger.error("!!! 無法獲取 Google 服務，備份任務中止。")
+                current_app.logger.error("!!! 無法獲取 Google 服務，同步任務中止。")
                 return
             folder_name = SystemSetting.get('drive_folder_name', 'Cashier_System_Reports')
-            folder_id = find_or_create_folder(drive_service, folder_name)
-            locations = Location.query.all()
-            for location in locations:
-                current_app.logger.info(f"正在處理據點: {location.name}")
-                spreadsheet_id = find_or_create_spreadsheet(drive_service, sheets_service, folder_id, location, overwrite=overwrite)
-                if not spreadsheet_id:
-                    current_app.logger.warning(f"無法為據點 {location.name} 建立或找到試算表，跳過此據點。")
-                    continue
-                
-                daily_reports = BusinessDay.query.filter_by(location_id=location.id, status='CLOSED').order_by(BusinessDay.date).all()
-                if daily_reports:
-                    header = ["日期", "據點", "開店準備金", "本日銷售總額", "帳面總額", "盤點現金合計", "帳差", "交易筆數", "銷售件數"]
-                    ensure_sheet_with_header_exists(sheets_service, spreadsheet_id, "每日摘要", header)
-                    data_rows = [header] + [[day.date.strftime("%Y-%m-%d"), location.name, day.opening_cash, day.total_sales, day.expected_cash, day.closing_cash, day.cash_diff, day.total_transactions, day.total_items] for day in daily_reports]
-                    bulk_write_data(sheets_service, spreadsheet_id, "每日摘要", data_rows)
-                    current_app.logger.info(f"已為 {location.name} 寫入 {len(data_rows) - 1} 筆每日摘要。")
-
-                monthly_stats = db.session.query(
-                    extract('year', BusinessDay.date).label('year'),
-                    extract('month', BusinessDay.date).label('month'),
-                    func.sum(BusinessDay.total_sales).label('total_sales'),
-                    func.sum(BusinessDay.cash_diff).label('cash_diff'),
-                    func.sum(BusinessDay.total_transactions).label('total_transactions'),
-                    func.sum(BusinessDay.total_items).label('total_items')
-                ).filter_by(location_id=location.id, status='CLOSED').group_by('year', 'month').order_by('year', 'month').all()
-                if monthly_stats:
-                    header = ["月份", "總銷售額", "總帳差", "總交易筆數", "總銷售件數"]
-                    ensure_sheet_with_header_exists(sheets_service, spreadsheet_id, "每月數據", header)
-                    data_rows = [header] + [[f"{stats.year}-{stats.month:02d}", stats.total_sales or 0, stats.cash_diff or 0, stats.total_transactions or 0, stats.total_items or 0] for stats in monthly_stats]
-                    bulk_write_data(sheets_service, spreadsheet_id, "每月數據", data_rows)
-                    current_app.logger.info(f"已為 {location.name} 寫入 {len(data_rows) - 1} 筆每月數據。")
-
-                all_transactions = Transaction.query.join(BusinessDay).filter(BusinessDay.location_id == location.id).order_by(Transaction.timestamp).all()
-                transactions_by_month = defaultdict(list)
-                for trans in all_transactions:
-                    month_key = trans.timestamp.strftime("%Y年%m月")
-                    transactions_by_month[month_key].append(trans)
-                for month_key, transactions in transactions_by_month.items():
-                    header = ["時間戳", "金額", "品項數"]
-                    ensure_sheet_with_header_exists(sheets_service, spreadsheet_id, month_key, header)
-                    data_rows = [header] + [[trans.timestamp.strftime("%Y-%m-%d %H:%M:%S"), trans.amount, trans.item_count] for trans in transactions]
-                    bulk_write_data(sheets_service, spreadsheet_id, month_key, data_rows)
-                    current_app.logger.info(f"已為 {location.name} 的 {month_key} 寫入 {len(data_rows) - 1} 筆交易紀錄。")
-            current_app.logger.info("--- 完整備份任務執行完畢 ---")
+            locations = Location.query.order_by(Location.id).all()
+            for year in synced_years(location.id for location in locations):
+                written = sync_to_spreadsheets(drive_service, sheets_service, folder_name, locations,
+                                               overwrite=overwrite, year=year)
+                for file_name, count in written.items():
+                    if count is None:
+                        current_app.logger.warning(f"無法建立或找到試算表 {file_name}，跳過此檔案。")
+                        continue
+                    current_app.logger.info(f"已為 {file_name} 同步 {count} 筆資料。")
+            current_app.logger.info("--- 雲端同步任務執行完畢 ---")
         except HttpError as e:
+            db.session.rollback()
             error_details = e.content.decode('utf-8')
-            current_app.logger.error(f"!!! [完整備份任務] Google API HTTP 錯誤: {e.resp.status} {e.resp.reason}, 詳細資訊: {error_details}")
+            current_app.logger.error(f"!!! [雲端同步任務] Google API HTTP 錯誤: {e.resp.status} {e.resp.reason}, 詳細資訊: {error_details}")
         except Exception as e:
-            current_app.logger.error(f"!!! [完整備份任務] 發生未預期的嚴重錯誤: {e}", exc_info=True)
+            db.session.rollback()
+            current_app.logger.error(f"!!! [雲端同步任務] 發生未預期的嚴重錯誤: {e}", exc_info=True)
 
 def get_drive_user_info(app):
     with app.app_context():
@@ -0,0 +1,130 @@
+# app/services/hourly_totals_service.py
+from collections import defaultdict
+from datetime import timezone
+from zoneinfo import ZoneInfo
+
+from flask import current_app
+from sqlalchemy import func, delete
+
+from .category_totals_service import increment_rows
+
+WEEKDAY_NAMES = ['星期一', '星期二', '星期三', '星期四', '星期五', '星期六', '星期日']
+
+_KEY_COLUMNS = ('location_id', 'business_date', 'hour')
+_VALUE_COLUMNS = ('transaction_count', 'total_sales')
+# 單次 IN 查詢的營業日數量上限，避免超過資料庫的參數個數限制
+_CHUNK_SIZE = 500
+
+
+def local_hour(timestamp):
+    """將資料庫中的 UTC 交易時間換算為報表時區的小時 (0-23)。"""
+    tz = ZoneInfo(current_app.config['REPORT_TIMEZONE'])
+    return timestamp.replace(tzinfo=timezone.utc).astimezone(tz).hour
+
+
+def _summarize(entries):
+    """將 (據點, 營業日期, 交易時間, 金額) 依 (據點, 營業日期, 當地小時) 彙總為資料列。"""
+    totals = defaultdict(lambda: [0, 0.0])
+    for location_id, business_date, timestamp, amount in entries:
+        entry = totals[(location_id, business_date, local_hour(timestamp))]
+        entry[0] += 1
+        entry[1] += amount or 0
+    return [
+        {'location_id': location_id, 'business_date': business_date, 'hour': hour,
+         'weekday': business_date.weekday(), 'transaction_count': count, 'total_sales': sales}
+        for (location_id, business_date, hour), (count, sales) in sorted(totals.items())
+    ]
+
+
+def add_hourly_totals(location_id, business_date, transactions):
+    """將新結帳的交易累加到每小時彙總 (不 commit，與交易寫入同一個資料庫交易)。"""
+    from ..models import TransactionHourlyTotal
+
+    rows = _summarize((location_id, business_date, t.timestamp, t.amount) for t in transactions)
+    increment_rows(TransactionHourlyTotal.__table__, _KEY_COLUMNS, _VALUE_COLUMNS, rows)
+
+
+def rebuild_hourly_totals(business_day_ids):
+    """依交易紀錄重新計算指定營業日的每小時彙總 (不 commit)，用於修改既有交易後與補建歷史資料。
+
+    彙總以 (據點, 營業日期) 為單位，因此會重建這些營業日所涉及的據點與日期組合。
+    """
+    from .. import db
+    from ..models import TransactionHourlyTotal, Transaction, BusinessDay
+
+    ids = sorted({i for i in business_day_ids if i is not None})
+    table = TransactionHourlyTotal.__table__
+    db.session.flush()
+    for start in range(0, len(ids), _CHUNK_SIZE):
+        pairs = db.session.query(BusinessDay.location_id, BusinessDay.date).filter(
+            BusinessDay.id.in_(ids[start:start + _CHUNK_SIZE])
+        ).distinct().all()
+        if not pairs:
+            continue
+        location_ids = sorted({location_id for location_id, _ in pairs})
+        dates = sorted({day for _, day in pairs})
+        # 刪除與重算都涵蓋同一組 (據點 × 日期)，結果與逐一處理各組合相同
+        db.session.execute(delete(table).where(
+            table.c.location_id.in_(location_ids), table.c.business_date.in_(dates)
+        ))
+        entries = db.session.query(
+            BusinessDay.location_id, BusinessDay.date, Transaction.timestamp, Transaction.amount
+        ).join(Transaction.business_day).filter(
+            BusinessDay.location_id.in_(location_ids), BusinessDay.date.in_(dates)
+        ).yield_per(1000)
+        rows = _summarize(entries)
+        if rows:
+            db.session.execute(table.insert(), rows)
+
+
+def backfill_hourly_totals(batch_size=_CHUNK_SIZE, progress=None):
+    """依歷史交易重建所有營業日的每小時彙總，每批營業日 commit 一次；回傳處理的營業日數。"""
+    from .. import db
+    from ..models import BusinessDay
+
+    ids = [row[0] for row in db.session.query(BusinessDay.id).order_by(BusinessDay.date, BusinessDay.id).all()]
+    for start in range(0, len(ids), batch_size):
+        rebuild_hourly_totals(ids[start:start + batch_size])
+        db.session.commit()
+        if progress:
+            progress(min(start + batch_size, len(ids)), len(ids))
+    return len(ids)
+
+
+def _filtered(query, start_date, end_date, location_id):
+    from ..models import TransactionHourlyTotal
+    query = query.filter(TransactionHourlyTotal.business_date.between(start_date, end_date))
+    if location_id != 'all':
+        query = query.filter(TransactionHourlyTotal.location_id == location_id)
+    return query
+
+
+def peak_hours(start_date, end_date, location_id='all'):
+    """各小時 (當地時間) 的交易筆數與銷售總額，依小時排序。"""
+    from .. import db
+    from ..models import TransactionHourlyTotal
+
+    query = db.session.query(
+        TransactionHourlyTotal.hour.label('hour'),
+        func.sum(TransactionHourlyTotal.transaction_count).label('transactions'),
+        func.sum(TransactionHourlyTotal.total_sales).label('total_sales')
+    )
+    return _filtered(query, start_date, end_date, location_id).group_by(
+        TransactionHourlyTotal.hour
+    ).order_by(TransactionHourlyTotal.hour).all()
+
+
+def weekday_hours(start_date, end_date, location_id='all'):
+    """星期 × 小時 (當地時間) 的交易筆數與銷售總額，依星期、小時排序。"""
+    from .. import db
+    from ..models import TransactionHourlyTotal
+
+    query = db.session.query(
+        TransactionHourlyTotal.weekday.label('weekday'),
+        TransactionHourlyTotal.hour.label('hour'),
+        func.sum(TransactionHourlyTotal.transaction_count).label('transactions'),
+        func.sum(TransactionHourlyTotal.total_sales).label('total_sales')
+    )
+    return _filtered(query, start_date, end_date, location_id).group_by(
+        TransactionHourlyTotal.weekday, TransactionHourlyTotal.hour
+    ).order_by(TransactionHourlyTotal.weekday, TransactionHourlyTotal.hour).all()
@@ -0,0 +1,50 @@
+# app/services/income_service.py
+from collections import namedtuple
+
+from sqlalchemy import func, case
+
+# 「其他收入」類別中名稱為捐款者另列，其餘合計為「其他」
+DONATION_CATEGORY_NAME = '捐款'
+
+IncomeBreakdown = namedtuple('IncomeBreakdown', ['donation_total', 'other_total'])
+
+# 單次 IN 查詢的營業日數量上限，避免超過資料庫的參數個數限制
+_CHUNK_SIZE = 500
+
+
+def other_income_breakdown(business_day_ids):
+    """以單一 GROUP BY 查詢計算多個營業日的其他收入，回傳 {business_day_id: IncomeBreakdown}。
+
+    沒有其他收入的營業日也會出現在結果中，其值為 (0, 0)。
+    """
+    from .. import db
+    from ..models import Transaction, TransactionItem, Category
+
+    ids = sorted({i for i in business_day_ids if i is not None})
+    breakdown = {i: IncomeBreakdown(0, 0) for i in ids}
+    is_donation = Category.name == DONATION_CATEGORY_NAME
+    for start in range(0, len(ids), _CHUNK_SIZE):
+        rows = db.session.query(
+            Transaction.business_day_id,
+            func.sum(case((is_donation, TransactionItem.price), else_=0)),
+            func.sum(case((is_donation, 0), else_=TransactionItem.price))
+        ).join(TransactionItem.transaction).join(TransactionItem.category).filter(
+            Transaction.business_day_id.in_(ids[start:start + _CHUNK_SIZE]),
+            Category.category_type == 'other_income'
+        ).group_by(Transaction.business_day_id).all()
+        for business_day_id, donation_total, other_total in rows:
+            breakdown[business_day_id] = IncomeBreakdown(donation_total or 0, other_total or 0)
+    return breakdown
+
+
+def other_income_for_day(business_day_id):
+    """單一營業日的其他收入 (捐款, 其他)。"""
+    return other_income_breakdown([business_day_id])[business_day_id]
+
+
+def attach_other_income(business_days):
+    """為一組 BusinessDay 物件設定 donation_total 與 other_total 屬性，供報表樣板使用。"""
+    breakdown = other_income_breakdown(bd.id for bd in business_days)
+    for bd in business_days:
+        bd.donation_total, bd.other_total = breakdown[bd.id]
+    return business_days
@@ -0,0 +1,91 @@
+# app/services/monthly_totals_service.py
+from collections import defaultdict
+from datetime import date
+
+from sqlalchemy import and_, or_, delete
+
+# 單次查詢重算的月份數量上限，避免條件過長
+_CHUNK_SIZE = 24
+
+
+def _month_range(year, month):
+    start = date(year, month, 1)
+    end = date(year + 1, 1, 1) if month == 12 else date(year, month + 1, 1)
+    return start, end
+
+
+def _rebuild_location_months(location_id, months):
+    from .. import db
+    from ..models import BusinessDay, MonthlyLocationTotal
+
+    table = MonthlyLocationTotal.__table__
+    db.session.execute(delete(table).where(table.c.location_id == location_id, or_(*[
+        and_(table.c.year == year, table.c.month == month) for year, month in months
+    ])))
+    days = db.session.query(
+        BusinessDay.date, BusinessDay.total_sales, BusinessDay.cash_diff,
+        BusinessDay.total_transactions, BusinessDay.total_items
+    ).filter(BusinessDay.location_id == location_id, BusinessDay.status == 'CLOSED', or_(*[
+        (BusinessDay.date >= start) & (BusinessDay.date < end)
+        for start, end in (_month_range(year, month) for year, month in months)
+    ]))
+    totals = defaultdict(lambda: [0, 0.0, 0.0, 0, 0])
+    for day, *values in days:
+        entry = totals[(day.year, day.month)]
+        entry[0] += 1
+        for i, value in enumerate(values, start=1):
+            entry[i] += value or 0
+    rows = [
+        {'location_id': location_id, 'year': year, 'month': month, 'day_count': count, 'total_sales': sales,
+         'cash_diff': cash_diff, 'total_transactions': transactions, 'total_items': items}
+        for (year, month), (count, sales, cash_diff, transactions, items) in sorted(totals.items())
+    ]
+    if rows:
+        db.session.execute(table.insert(), rows)
+
+
+def rebuild_monthly_totals(days):
+    """依營業日資料重算 (據點 id, 日期) 所在月份的彙總 (不 commit)，用於歸檔與修改報表後。"""
+    from .. import db
+
+    months = defaultdict(set)
+    for location_id, day in days:
+        months[int(location_id)].add((day.year, day.month))
+    db.session.flush()
+    for location_id, location_months in sorted(months.items()):
+        location_months = sorted(location_months)
+        for start in range(0, len(location_months), _CHUNK_SIZE):
+            _rebuild_location_months(location_id, location_months[start:start + _CHUNK_SIZE])
+
+
+def backfill_monthly_totals(batch_size=_CHUNK_SIZE, progress=None):
+    """依歷史營業日重建所有據點的每月彙總，每批月份 commit 一次；回傳處理的 (據點, 月份) 數。"""
+    from .. import db
+    from ..models import BusinessDay
+
+    months = sorted({
+        (location_id, day.year, day.month)
+        for location_id, day in db.session.query(BusinessDay.location_id, BusinessDay.date).filter(
+            BusinessDay.status == 'CLOSED').distinct()
+    })
+    for start in range(0, len(months), batch_size):
+        rebuild_monthly_totals(
+            (location_id, date(year, month, 1)) for location_id, year, month in months[start:start + batch_size])
+        db.session.commit()
+        if progress:
+            progress(min(start + batch_size, len(months)), len(months))
+    return len(months)
+
+
+def monthly_totals(location_id, months=None):
+    """據點的每月彙總，依月份排序；months 為 (年, 月) 的集合，未指定時回傳所有月份。"""
+    from ..models import MonthlyLocationTotal
+
+    query = MonthlyLocationTotal.query.filter(MonthlyLocationTotal.location_id == location_id)
+    if months is not None:
+        if not months:
+            return []
+        query = query.filter(or_(*[
+            and_(MonthlyLocationTotal.year == year, MonthlyLocationTotal.month == month) for year, month in months
+        ]))
+    return query.order_by(MonthlyLocationTotal.year, MonthlyLocationTotal.month).all()
@@ -0,0 +1,115 @@
+# app/services/parquet_export_service.py
+import os
+from datetime import date, timedelta, timezone
+
+# 每次自資料庫讀取並寫成一個 row group 的品項數
+ROW_GROUP_SIZE = 50000
+
+# (欄位名稱, pyarrow 型別名稱)；型別於匯出時才轉換，避免未使用時就載入 pyarrow
+_COLUMNS = [
+    ('transaction_item_id', 'int64'),
+    ('transaction_id', 'int64'),
+    ('timestamp', 'timestamp'),
+    ('business_date', 'date32'),
+    ('location_id', 'int64'),
+    ('location_name', 'string'),
+    ('category_id', 'int64'),
+    ('category_name', 'string'),
+    ('category_type', 'string'),
+    ('price', 'float64'),
+    ('transaction_amount', 'float64'),
+    ('cash_received', 'float64'),
+    ('change_given', 'float64'),
+]
+
+
+def _schema():
+    import pyarrow as pa
+    types = {
+        'int64': pa.int64(), 'timestamp': pa.timestamp('us', tz='UTC'), 'date32': pa.date32(),
+        'string': pa.string(), 'float64': pa.float64(),
+    }
+    return pa.schema([(name, types[type_name]) for name, type_name in _COLUMNS])
+
+
+def _line_item_query(start_date, end_date, location_id='all'):
+    """交易品項與其交易、營業日、據點、類別的欄位查詢，只取匯出所需的欄位。"""
+    from .. import db
+    from ..models import TransactionItem, Transaction, BusinessDay, Location, Category
+
+    query = db.session.query(
+        TransactionItem.id, Transaction.id, Transaction.timestamp, BusinessDay.date,
+        Location.id, Location.name, Category.id, Category.name, Category.category_type,
+        TransactionItem.price, Transaction.amount, Transaction.cash_received, Transaction.change_given
+    ).select_from(TransactionItem).join(TransactionItem.transaction).join(Transaction.business_day).join(
+        BusinessDay.location
+    ).outerjoin(TransactionItem.category).filter(BusinessDay.date.between(start_date, end_date))
+    if location_id != 'all':
+        query = query.filter(BusinessDay.location_id == location_id)
+    return query.order_by(Transaction.timestamp, Transaction.id, TransactionItem.id)
+
+
+def _record_batches(query, schema, row_group_size):
+    """逐批讀取查詢結果並轉為 pyarrow RecordBatch，記憶體中最多只保留一批資料。"""
+    import pyarrow as pa
+
+    columns = [[] for _ in _COLUMNS]
+    for row in query.yield_per(row_group_size):
+        for values, value in zip(columns, row):
+            values.append(value)
+        if len(columns[0]) >= row_group_size:
+            yield pa.RecordBatch.from_arrays(_to_arrays(columns, schema), schema=schema)
+            columns = [[] for _ in _COLUMNS]
+    if columns[0]:
+        yield pa.RecordBatch.from_arrays(_to_arrays(columns, schema), schema=schema)
+
+
+def _to_arrays(columns, schema):
+    import pyarrow as pa
+
+    timestamp_index = [name for name, _ in _COLUMNS].index('timestamp')
+    # 資料庫中的交易時間為不含時區的 UTC
+    columns[timestamp_index] = [t.replace(tzinfo=timezone.utc) if t else None for t in columns[timestamp_index]]
+    return [pa.array(values, type=field.type) for values, field in zip(columns, schema)]
+
+
+def write_line_items(sink, start_date, end_date, location_id='all', row_group_size=ROW_GROUP_SIZE):
+    """將日期區間內的交易品項寫成一個 Parquet 檔 (sink 可為路徑或檔案物件)，每批資料寫成一個 row group；回傳列數。"""
+    import pyarrow.parquet as pq
+
+    schema = _schema()
+    rows = 0
+    with pq.ParquetWriter(sink, schema, compression='zstd') as writer:
+        for batch in _record_batches(_line_item_query(start_date, end_date, location_id), schema, row_group_size):
+            writer.write_batch(batch, row_group_size=row_group_size)
+            rows += batch.num_rows
+    return rows
+
+
+def _month_ranges(start_date, end_date):
+    """將日期區間切成逐月的 (月份第一天, 區間開始, 區間結束)。"""
+    month_start = date(start_date.year, start_date.month, 1)
+    while month_start <= end_date:
+        next_month = (month_start + timedelta(days=32)).replace(day=1)
+        yield month_start, max(month_start, start_date), min(next_month - timedelta(days=1), end_date)
+        month_start = next_month
+
+
+def write_monthly_partitions(output_dir, start_date, end_date, location_id='all', row_group_size=ROW_GROUP_SIZE):
+    """依月份分區寫出交易品項，路徑為 output_dir/month=YYYY-MM/line_items.parquet；回傳 [(路徑, 列數)]。
+
+    沒有資料的月份不會產生檔案。
+    """
+    written = []
+    for month_start, range_start, range_end in _month_ranges(start_date, end_date):
+        partition_dir = os.path.join(output_dir, f"month={month_start.strftime('%Y-%m')}")
+        path = os.path.join(partition_dir, 'line_items.parquet')
+        os.makedirs(partition_dir, exist_ok=True)
+        rows = write_line_items(path, range_start, range_end, location_id, row_group_size)
+        if rows:
+            written.append((path, rows))
+        else:
+            os.remove(path)
+            if not os.listdir(partition_dir):
+                os.rmdir(partition_dir)
+    return written
@@ -0,0 +1,98 @@
+# app/services/pdf_renderer.py
+import atexit
+import multiprocessing
+import re
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+_pool = {'executor': None, 'size': 0}
+_lock = threading.Lock()
+
+# 轉檔行程內常駐的 WeasyPrint 字型設定與預先解析的外部樣式表
+_worker = {}
+
+# 列印樣板中以 <link> 引用的外部樣式表 (如 Bootstrap CDN)
+_EXTERNAL_STYLESHEET = re.compile(r'<link\b[^>]*\bhref="(https?://[^"]+)"[^>]*>', re.IGNORECASE)
+
+
+def _init_worker():
+    """轉檔行程啟動時只載入一次 WeasyPrint，並建立之後每份文件共用的字型設定與樣式表快取。"""
+    from weasyprint.text.fonts import FontConfiguration
+
+    _worker['font_config'] = FontConfiguration()
+    _worker['stylesheets'] = {}
+
+
+def _stylesheet(url):
+    """外部樣式表只下載並解析一次，之後的文件直接重用同一個 CSS 物件；下載失敗時回傳 None，下次再試。"""
+    from weasyprint import CSS
+    from weasyprint.urls import URLFetchingError
+
+    if url not in _worker['stylesheets']:
+        try:
+            _worker['stylesheets'][url] = CSS(url=url, font_config=_worker['font_config'])
+        except URLFetchingError:
+            # 與 WeasyPrint 處理 <link> 的方式相同，樣式表無法下載時不套用而不是讓整份文件失敗
+            return None
+    return _worker['stylesheets'][url]
+
+
+def _render(html):
+    from weasyprint import HTML
+
+    if not _worker:
+        _init_worker()
+    stylesheets = []
+
+    def use_parsed(match):
+        if 'stylesheet' not in match.group(0).lower():
+            return match.group(0)
+        sheet = _stylesheet(match.group(1))
+        if sheet is not None:
+            stylesheets.append(sheet)
+        return ''
+
+    # 外部樣式表改以預先解析的 CSS 物件套用 (優先順序低於樣板自己的樣式)，不必每份文件重新解析
+    html = _EXTERNAL_STYLESHEET.sub(use_parsed, html)
+    return HTML(string=html).write_pdf(stylesheets=stylesheets, font_config=_worker['font_config'])
+
+
+def _shutdown():
+    with _lock:
+        executor, _pool['executor'] = _pool['executor'], None
+    if executor:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+atexit.register(_shutdown)
+
+
+def _executor(workers):
+    with _lock:
+        if _pool['executor'] is None or _pool['size'] != workers:
+            if _pool['executor'] is not None:
+                _pool['executor'].shutdown(wait=False)
+            # 以 spawn 啟動，子行程不會繼承父行程的資料庫與 Redis 連線
+            _pool['executor'] = ProcessPoolExecutor(
+                max_workers=workers, mp_context=multiprocessing.get_context('spawn'), initializer=_init_worker)
+            _pool['size'] = workers
+        return _pool['executor']
+
+
+def render_pdfs(htmls, workers):
+    """將多份 HTML 轉為 PDF (bytes list，順序同 htmls)，由常駐的轉檔行程池平行處理。
+
+    workers 為 0 時在目前的行程中依序轉檔，同樣會重用已載入的字型設定與解析過的樣式表。
+    """
+    htmls = list(htmls)
+    if not htmls:
+        return []
+    if workers <= 0:
+        return [_render(html) for html in htmls]
+    try:
+        return list(_executor(workers).map(_render, htmls))
+    except BrokenProcessPool:
+        # 子行程異常結束 (如記憶體不足被終止) 時重建行程池再試一次
+        _shutdown()
+        return list(_executor(workers).map(_render, htmls))
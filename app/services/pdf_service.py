@@ -0,0 +1,196 @@
+# app/services/pdf_service.py
+import hashlib
+import os
+import tempfile
+from datetime import date
+
+from flask import current_app, render_template
+from redis.exceptions import RedisError
+
+from .pdf_renderer import render_pdfs
+from .report_cache_service import report_day_version
+from .settlement_service import get_settlement, settlement_version, FINANCE_ITEMS, SALES_ITEMS
+
+# 預先產生的 PDF 存放於 instance/ 之下的這個目錄
+PDF_CACHE_DIR = 'pdf_cache'
+# 列印模板或轉檔方式變更時調整，讓已產生的 PDF 失效
+PDF_LAYOUT_VERSION = 1
+
+
+def daily_report_html(business_day, signatures=None):
+    """營業日報表的列印用 HTML；signatures 未提供時使用歸檔時儲存的簽名。"""
+    from .income_service import other_income_for_day
+
+    if signatures is None:
+        signatures = {
+            'operator': business_day.signature_operator,
+            'reviewer': business_day.signature_reviewer,
+            'cashier': business_day.signature_cashier,
+        }
+    closing_cash = business_day.closing_cash or 0
+    opening_cash = business_day.opening_cash or 0
+    total_sales = business_day.total_sales or 0
+
+    # 從交易紀錄中計算其他收入並計入 expected_total
+    other_income_total = sum(other_income_for_day(business_day.id))
+
+    expected_total = opening_cash + total_sales + other_income_total
+    difference = closing_cash - expected_total
+    return render_template(
+        "cashier/report_print.html", day=business_day, other_income_total=other_income_total,
+        expected_total=expected_total, difference=difference, signatures=signatures)
+
+
+def settlement_html(report_date):
+    """總結算報表的列印用 HTML；該日尚未結算時回傳 None。"""
+    settlement = get_settlement(report_date)
+    if not settlement.is_settled:
+        return None
+    return render_template(
+        'report/settlement_print.html', report_date=report_date, reports=settlement.reports,
+        active_locations_ordered=settlement.active_locations_ordered, grand_total=settlement.grand_total,
+        remarks_data=settlement.remarks_data, finance_items=FINANCE_ITEMS, sales_items=SALES_ITEMS
+    )
+
+
+def _render_workers():
+    """轉檔行程池大小；在 RQ 背景任務中回傳 0，直接於目前的行程轉檔。
+
+    RQ 每個任務都在新 fork 的 work-horse 中執行，行程池無法跨任務常駐，
+    若在任務中建立行程池，每個任務都要重新 spawn 子行程並載入 WeasyPrint。
+    """
+    from rq import get_current_job
+
+    if get_current_job() is not None:
+        return 0
+    return current_app.config['PDF_RENDER_WORKERS']
+
+
+def render_pdf(html):
+    return render_pdfs([html], _render_workers())[0]
+
+
+def _pdf_path(kind, name, version):
+    directory = os.path.join(current_app.instance_path, PDF_CACHE_DIR, kind)
+    return os.path.join(directory, f"{name}_v{PDF_LAYOUT_VERSION}.{version}.pdf")
+
+
+def _store_pdf(path, name, pdf):
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    # 先寫入暫存檔再改名，讀取端不會拿到寫到一半的檔案
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    with os.fdopen(fd, 'wb') as f:
+        f.write(pdf)
+    os.replace(tmp_path, path)
+
+    for filename in os.listdir(directory):
+        if filename.startswith(f"{name}_") and filename.endswith('.pdf') and filename != os.path.basename(path):
+            try:
+                os.remove(os.path.join(directory, filename))
+            except OSError:
+                pass
+
+
+def _cached_pdfs(documents):
+    """documents 為 [(種類, 名稱, 資料版本, 產生 HTML 的函式)]，回傳對應的 PDF 路徑 (HTML 為 None 時為 None)。
+
+    檔名包含資料版本，檔案已存在時直接使用，不需查詢報表資料或產生 HTML；資料異動後版本改變，
+    會產生新的檔案並刪除同一份報表的舊版本。Redis 無法連線 (版本為 None) 時改以 HTML 內容的雜湊值為版本。
+    缺少的檔案一次交給轉檔行程池平行產生。
+    """
+    paths, missing = [], []
+    for kind, name, version, build_html in documents:
+        html = None
+        if version is None:
+            html = build_html()
+            if html is None:
+                paths.append(None)
+                continue
+            version = hashlib.sha256(html.encode('utf-8')).hexdigest()[:16]
+        path = _pdf_path(kind, name, version)
+        if not os.path.exists(path):
+            if html is None:
+                html = build_html()
+            if html is None:
+                path = None
+            else:
+                missing.append((path, name, html))
+        paths.append(path)
+    pdfs = render_pdfs([html for _, _, html in missing], _render_workers())
+    for (path, name, _), pdf in zip(missing, pdfs):
+        _store_pdf(path, name, pdf)
+    return paths
+
+
+def _daily_report_document(business_day):
+    version = report_day_version(business_day.location_id, business_day.date)
+    return ('daily_report', str(business_day.id), version, lambda: daily_report_html(business_day))
+
+
+def _settlement_document(report_date):
+    return ('settlement', report_date.isoformat(), settlement_version(report_date), lambda: settlement_html(report_date))
+
+
+def daily_report_pdf(business_day):
+    """已歸檔營業日的 PDF 報表路徑，尚未產生或資料已變動時先產生。"""
+    return _cached_pdfs([_daily_report_document(business_day)])[0]
+
+
+def settlement_pdf(report_date):
+    """總結算 PDF 報表路徑；該日尚未結算時回傳 None。"""
+    return _cached_pdfs([_settlement_document(report_date)])[0]
+
+
+def prerender_pdfs(business_days, settlement_dates):
+    """一次產生多個已歸檔營業日與多個日期的總結算 PDF，回傳產生或沿用的檔案數。"""
+    documents = [_daily_report_document(business_day) for business_day in business_days]
+    documents.extend(_settlement_document(day) for day in sorted(set(settlement_dates)))
+    return sum(1 for path in _cached_pdfs(documents) if path is not None)
+
+
+def refresh_pdfs_task(days, settlement_dates=()):
+    """RQ 背景任務：重新產生指定 (據點 id, 日期) 的營業日報表與相關日期的總結算 PDF。"""
+    from .. import create_app
+    app = create_app()
+    # 模板中的 url_for 需要請求情境
+    with app.test_request_context():
+        from ..models import BusinessDay
+        dates = {date.fromisoformat(d) for d in settlement_dates}
+        business_days = []
+        for location_id, day in days:
+            day = date.fromisoformat(day)
+            dates.add(day)
+            business_day = BusinessDay.query.filter_by(location_id=location_id, date=day, status='CLOSED').first()
+            if business_day:
+                business_days.append(business_day)
+        prerender_pdfs(business_days, dates)
+
+
+def enqueue_pdf_refresh(days=(), settlement_dates=()):
+    """營業日歸檔、結算或資料異動並 commit 後呼叫，在背景預先產生 PDF；Redis 無法連線時略過。"""
+    days = sorted({(int(location_id), day.isoformat()) for location_id, day in days})
+    settlement_dates = sorted({day.isoformat() for day in settlement_dates})
+    if not days and not settlement_dates:
+        return
+    try:
+        current_app.task_queue.enqueue(
+            'app.services.pdf_service.refresh_pdfs_task',
+            args=([list(d) for d in days], settlement_dates),
+            job_timeout='10m'
+        )
+    except RedisError as e:
+        current_app.logger.warning(f"排入 PDF 產生任務失敗: {e}")
+
+
+def prerender_range(start_date, end_date):
+    """預先產生日期區間內所有已歸檔營業日與總結算的 PDF (需在請求情境中呼叫)。"""
+    from .. import db
+    from ..models import BusinessDay, DailySettlement
+
+    business_days = BusinessDay.query.filter(
+        BusinessDay.date.between(start_date, end_date), BusinessDay.status == 'CLOSED'
+    ).order_by(BusinessDay.date, BusinessDay.location_id).all()
+    settlement_dates = [row[0] for row in db.session.query(DailySettlement.date).filter(
+        DailySettlement.date.between(start_date, end_date)).all()]
+    return prerender_pdfs(business_days, settlement_dates)
@@ -0,0 +1,53 @@
+# app/services/reference_data_service.py
+import threading
+from collections import namedtuple
+
+from .business_day_service import LocationRef
+from .cache_service import get_version, bump_version
+
+# locations 為依 id 排序的 LocationRef；categories 為可直接序列化為 JSON 的 dict，依 id 排序
+ReferenceData = namedtuple('ReferenceData', ['version', 'locations', 'categories'])
+
+_NAMESPACE = 'reference_data'
+_state = {'data': None}
+_lock = threading.Lock()
+
+
+def _load(version):
+    from .. import db
+    from ..models import Location, Category
+
+    locations = tuple(LocationRef(*row) for row in db.session.query(
+        Location.id, Location.name, Location.slug).order_by(Location.id).all())
+    categories = tuple(
+        {'id': id_, 'name': name, 'category_type': category_type, 'location_id': location_id}
+        for id_, name, category_type, location_id in db.session.query(
+            Category.id, Category.name, Category.category_type, Category.location_id).order_by(Category.id).all()
+    )
+    return ReferenceData(version, locations, categories)
+
+
+def get_reference_data():
+    """報表表單使用的據點與類別清單，依版本號快取於行程內；Redis 無法連線時每次都查詢資料庫。"""
+    version = get_version(_NAMESPACE)
+    if version is None:
+        return _load(None)
+    data = _state['data']
+    if data is not None and data.version == version:
+        return data
+    data = _load(version)
+    with _lock:
+        _state['data'] = data
+    return data
+
+
+def location_choices():
+    """據點下拉選單的選項，第一個為「所有據點」。"""
+    return [('all', '所有據點')] + [(str(loc.id), loc.name) for loc in get_reference_data().locations]
+
+
+def invalidate_reference_data():
+    """據點或類別資料異動並 commit 後呼叫，讓所有行程重新載入據點與類別清單。"""
+    with _lock:
+        _state['data'] = None
+    bump_version(_NAMESPACE)
@@ -0,0 +1,123 @@
+# app/services/report_cache_service.py
+from .cache_service import get_versions, bump_version, remember_response, recall_response
+
+# 報表結果在 Redis 中的保存時間；資料異動時靠版本號失效，這裡只是回收不再使用的舊版本
+REPORT_CACHE_TTL = 7 * 24 * 60 * 60
+
+# 據點、類別等影響所有報表顯示內容的資料異動時使用的全域版本
+_GLOBAL_NAMESPACE = 'report_data'
+
+
+def _month_namespace(location_id, year, month):
+    return f"report_data:{location_id}:{year}-{month:02d}"
+
+
+def _month_namespaces(location_id, start_date, end_date):
+    """日期區間涵蓋的每個月份的版本命名空間。"""
+    year, month = start_date.year, start_date.month
+    while (year, month) <= (end_date.year, end_date.month):
+        yield _month_namespace(location_id, year, month)
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+
+
+def day_namespaces(day):
+    """影響某一天所有據點資料的版本命名空間 (全域版本與該月份所有據點的版本)。"""
+    return [_GLOBAL_NAMESPACE, _month_namespace('all', day.year, day.month)]
+
+
+def report_day_version(location_id, day):
+    """據點某一天報表內容的資料版本字串 (營業日資料異動或據點、類別變更時改變)；Redis 無法連線時回傳 None。"""
+    versions = get_versions([_GLOBAL_NAMESPACE, _month_namespace(location_id, day.year, day.month)])
+    if versions is None:
+        return None
+    return '.'.join(str(v) for v in versions)
+
+
+def _all_days_closed(start_date, end_date, location_id):
+    """區間內的營業日是否都已歸檔；仍在營業或待確認的營業日會持續變動，不能快取。"""
+    from .. import db
+    from ..models import BusinessDay
+
+    query = db.session.query(BusinessDay.id).filter(
+        BusinessDay.date.between(start_date, end_date), BusinessDay.status != 'CLOSED'
+    )
+    if location_id != 'all':
+        query = query.filter(BusinessDay.location_id == location_id)
+    return not db.session.query(query.exists()).scalar()
+
+
+def _report_cache_key(report_type, location_id, periods, key_parts):
+    """報表結果的快取鍵；區間內仍有未歸檔的營業日或 Redis 無法連線時回傳 None。"""
+    if not all(_all_days_closed(start, end, location_id) for start, end in periods):
+        return None
+
+    namespaces = [_GLOBAL_NAMESPACE]
+    for start, end in periods:
+        namespaces.extend(_month_namespaces(location_id, start, end))
+    versions = get_versions(namespaces)
+    if versions is None:
+        return None
+
+    return ':'.join([
+        'report', report_type, str(location_id),
+        ','.join(f"{start.isoformat()}~{end.isoformat()}" for start, end in periods),
+        *[str(part) for part in key_parts],
+        '.'.join(str(v) for v in versions),
+    ])
+
+
+def recall_report(report_type, location_id, periods, *key_parts):
+    """只查詢快取中的報表結果，不會計算；沒有快取時回傳 None。"""
+    key = _report_cache_key(report_type, location_id, periods, key_parts)
+    return recall_response(key) if key else None
+
+
+def cached_report(report_type, location_id, periods, compute, *key_parts):
+    """取得報表結果，periods 為報表涵蓋的 [(開始日期, 結束日期)]。
+
+    區間內的營業日都已歸檔時，結果以 (報表類型, 據點, 區間, 資料版本) 為鍵快取於 Redis；
+    否則或 Redis 無法連線時直接呼叫 compute()。compute 的回傳值必須可序列化為 JSON。
+    """
+    key = _report_cache_key(report_type, location_id, periods, key_parts)
+    if key is None:
+        return compute()
+    cached = recall_response(key)
+    if cached is not None:
+        return cached
+    result = compute()
+    remember_response(key, result, REPORT_CACHE_TTL)
+    return result
+
+
+def _calendar_namespace(year, month):
+    return f"calendar_status:{year}-{month:02d}"
+
+
+def calendar_version(year, month):
+    """報表月曆 (營業與結算狀態) 的資料版本字串；Redis 無法連線時回傳 None。"""
+    versions = get_versions([_GLOBAL_NAMESPACE, _calendar_namespace(year, month)])
+    if versions is None:
+        return None
+    return '.'.join(str(v) for v in versions)
+
+
+def invalidate_calendar_days(days):
+    """營業日開帳、日結或總結算並 commit 後呼叫，days 為日期清單；讓這些月份的月曆狀態失效。"""
+    for year, month in sorted({(day.year, day.month) for day in days}):
+        bump_version(_calendar_namespace(year, month))
+
+
+def invalidate_report_days(days):
+    """營業日資料異動並 commit 後呼叫，days 為 [(據點 id, 日期)]；只讓涵蓋這些日期的報表快取與月曆狀態失效。"""
+    namespaces = set()
+    for location_id, day in days:
+        namespaces.add(_month_namespace(location_id, day.year, day.month))
+        namespaces.add(_month_namespace('all', day.year, day.month))
+        namespaces.add(_calendar_namespace(day.year, day.month))
+    for namespace in sorted(namespaces):
+        bump_version(namespace)
+
+
+def invalidate_all_reports():
+    """據點或類別資料異動並 commit 後呼叫，讓所有報表快取失效。"""
+    bump_version(_GLOBAL_NAMESPACE)
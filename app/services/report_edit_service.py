@@ -0,0 +1,160 @@
+# app/services/report_edit_service.py
+import json
+
+from sqlalchemy import func, select, update
+
+# 單次 IN 查詢的資料列數量上限，避免超過資料庫的參數個數限制
+_CHUNK_SIZE = 500
+
+
+def _to_id(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _load_rows(model, columns, ids):
+    """以分批的 IN 查詢讀取指定 id 的欄位，回傳 {id: dict}，供修改後整批寫回。"""
+    from .. import db
+
+    ids = sorted({i for i in ids if i is not None})
+    rows = {}
+    for start in range(0, len(ids), _CHUNK_SIZE):
+        result = db.session.execute(
+            select(model.id, *columns).where(model.id.in_(ids[start:start + _CHUNK_SIZE])))
+        rows.update({row.id: dict(row._mapping) for row in result})
+    return rows
+
+
+def _bulk_update(model, rows, fields):
+    """以主鍵批次更新 (ORM bulk UPDATE) rows 中的 fields 欄位。"""
+    from .. import db
+
+    mappings = [dict({'id': row['id']}, **{field: row[field] for field in fields}) for row in rows]
+    if mappings:
+        db.session.execute(update(model), mappings)
+
+
+def _apply_cash_fields(day):
+    day['expected_cash'] = (day['opening_cash'] or 0) + (day['total_sales'] or 0)
+    day['cash_diff'] = (day['closing_cash'] or 0) - (day['expected_cash'] or 0)
+
+
+def _load_business_days(rows):
+    from ..models import BusinessDay
+
+    return _load_rows(BusinessDay, [
+        BusinessDay.location_id, BusinessDay.date, BusinessDay.opening_cash,
+        BusinessDay.total_sales, BusinessDay.closing_cash, BusinessDay.cash_breakdown
+    ], (_to_id(row.get('id')) for row in rows))
+
+
+def update_opening_cash(rows):
+    """每日摘要表的修改：更新開店現金並重算帳面與帳差 (不 commit)，回傳異動的 (據點 id, 日期)。"""
+    from ..models import BusinessDay
+
+    days = _load_business_days(rows)
+    changed = {}
+    for row_data in rows:
+        day = days.get(_to_id(row_data.get('id')))
+        if day is None:
+            continue
+        day['opening_cash'] = float(row_data.get('opening_cash', day['opening_cash']))
+        _apply_cash_fields(day)
+        changed[day['id']] = day
+    _bulk_update(BusinessDay, changed.values(), ('opening_cash', 'expected_cash', 'cash_diff'))
+    return {(day['location_id'], day['date']) for day in changed.values()}
+
+
+def update_cash_breakdowns(rows):
+    """現金盤點表的修改：依各面額張數重算實有現金、帳面與帳差 (不 commit)，回傳異動的 (據點 id, 日期)。"""
+    from ..models import BusinessDay
+
+    days = _load_business_days(rows)
+    changed = {}
+    for row_data in rows:
+        day = days.get(_to_id(row_data.get('id')))
+        if day is None:
+            continue
+        cash_breakdown_raw = row_data.get('cash_breakdown')
+        if isinstance(cash_breakdown_raw, dict):
+            cash_breakdown_dict = {key: int(value) for key, value in cash_breakdown_raw.items()}
+            day['cash_breakdown'] = json.dumps(cash_breakdown_dict)
+            day['closing_cash'] = float(sum(int(denom) * count for denom, count in cash_breakdown_dict.items()))
+        _apply_cash_fields(day)
+        changed[day['id']] = day
+    _bulk_update(BusinessDay, changed.values(), ('cash_breakdown', 'closing_cash', 'expected_cash', 'cash_diff'))
+    return {(day['location_id'], day['date']) for day in changed.values()}
+
+
+def _recompute_transaction_amounts(transaction_ids):
+    """以品項金額的 SQL 加總重算交易金額與找零 (不 commit)。"""
+    from .. import db
+    from ..models import Transaction, TransactionItem
+
+    amount = select(func.coalesce(func.sum(TransactionItem.price), 0)).where(
+        TransactionItem.transaction_id == Transaction.id).scalar_subquery()
+    ids = sorted(transaction_ids)
+    for start in range(0, len(ids), _CHUNK_SIZE):
+        db.session.execute(
+            update(Transaction).where(Transaction.id.in_(ids[start:start + _CHUNK_SIZE])).values(
+                amount=amount, change_given=func.coalesce(Transaction.cash_received, 0) - amount
+            ).execution_options(synchronize_session=False))
+
+
+def recompute_day_totals(business_day_ids):
+    """以交易金額的 SQL 加總重算營業日的銷售總額、帳面與帳差，每個營業日只計算一次 (不 commit)。"""
+    from .. import db
+    from ..models import BusinessDay, Transaction
+
+    total_sales = select(func.coalesce(func.sum(func.coalesce(Transaction.amount, 0)), 0)).where(
+        Transaction.business_day_id == BusinessDay.id).scalar_subquery()
+    expected_cash = func.coalesce(BusinessDay.opening_cash, 0) + total_sales
+    ids = sorted(business_day_ids)
+    for start in range(0, len(ids), _CHUNK_SIZE):
+        db.session.execute(
+            update(BusinessDay).where(BusinessDay.id.in_(ids[start:start + _CHUNK_SIZE])).values(
+                total_sales=total_sales, expected_cash=expected_cash,
+                cash_diff=func.coalesce(BusinessDay.closing_cash, 0) - expected_cash
+            ).execution_options(synchronize_session=False))
+
+
+def update_transactions(rows):
+    """交易明細表的修改：更新收款金額與品項的金額、類別，再重算受影響的交易與營業日 (不 commit)。
+
+    每個資料表只以 IN 查詢讀取一次並批次寫回，回傳 (異動的營業日 id, 異動的 (據點 id, 日期))。
+    """
+    from ..models import BusinessDay, Transaction, TransactionItem
+
+    transactions = _load_rows(Transaction, [Transaction.business_day_id, Transaction.cash_received],
+                              (_to_id(row.get('id')) for row in rows))
+    rows = [row for row in rows if _to_id(row.get('id')) in transactions]
+    items = _load_rows(TransactionItem, [TransactionItem.transaction_id, TransactionItem.price, TransactionItem.category_id],
+                       (_to_id(item.get('id')) for row in rows for item in row.get('items', [])))
+
+    changed_transactions, changed_items = {}, {}
+    for transaction_data in rows:
+        transaction = transactions[_to_id(transaction_data.get('id'))]
+        transaction['cash_received'] = float(transaction_data.get('cash_received', transaction['cash_received']))
+        changed_transactions[transaction['id']] = transaction
+        for item_data in transaction_data.get('items', []):
+            item = items.get(_to_id(item_data.get('id')))
+            if item:
+                item['price'] = float(item_data.get('price', item['price']))
+                item['category_id'] = item_data.get('category_id', item['category_id'])
+                changed_items[item['id']] = item
+
+    _bulk_update(Transaction, changed_transactions.values(), ('cash_received',))
+    _bulk_update(TransactionItem, changed_items.values(), ('price', 'category_id'))
+
+    # 品項所屬的交易 (通常就是送出的交易) 都需要重算金額
+    transaction_ids = set(changed_transactions) | {item['transaction_id'] for item in changed_items.values()}
+    owners = _load_rows(Transaction, [Transaction.business_day_id], transaction_ids - set(transactions))
+    business_day_ids = {t['business_day_id'] for t in list(transactions.values()) + list(owners.values())
+                        if t['id'] in transaction_ids and t['business_day_id'] is not None}
+
+    _recompute_transaction_amounts(transaction_ids)
+    recompute_day_totals(business_day_ids)
+    days = _load_rows(BusinessDay, [BusinessDay.location_id, BusinessDay.date], business_day_ids)
+    return business_day_ids, {(day['location_id'], day['date']) for day in days.values()}
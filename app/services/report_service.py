@@ -0,0 +1,227 @@
+# app/services/report_service.py
+from datetime import date
+
+from flask import current_app
+from rq.exceptions import NoSuchJobError
+from rq.job import Job, JobStatus
+from sqlalchemy import func, select, or_
+
+from .analytics_service import load_columns, numeric, series_by_location, column_chart, compare_periods
+from .report_cache_service import cached_report, recall_report
+
+# 可以快取結果、且資料量大時改由背景任務產生的報表類型。
+# daily_cash_summary、daily_cash_check 是逐營業日編輯的表單，必須顯示資料庫中的即時內容；
+# combined_summary_final 讀取總結算資料，總結算異動不會更新報表快取版本，且只有兩個區間查詢，不列入。
+BACKGROUND_REPORT_TYPES = ('daily_summary', 'product_mix', 'sales_trend', 'periodic_performance', 'peak_hours')
+# 背景任務完成後結果保留的時間，期間內可以重新開啟同一份報表
+REPORT_JOB_RESULT_TTL = 24 * 60 * 60
+
+_TASK_NAME = 'app.services.report_service.run_report_task'
+
+
+_DAILY_SUMMARY_FIELDS = ('opening_cash', 'total_sales', 'expected_cash', 'closing_cash', 'cash_diff',
+                         'total_transactions', 'total_items')
+
+
+def _daily_summary(start_date, end_date, location_id):
+    """各營業日的現金與銷售摘要，圖表為每日 × 據點的銷售數列。"""
+    from ..models import BusinessDay, Location
+
+    stmt = select(
+        BusinessDay.id, BusinessDay.date, Location.name.label('location_name'),
+        *[getattr(BusinessDay, field) for field in _DAILY_SUMMARY_FIELDS]
+    ).join(Location, BusinessDay.location_id == Location.id).where(BusinessDay.date.between(start_date, end_date))
+    if location_id != 'all':
+        stmt = stmt.where(BusinessDay.location_id == location_id)
+    columns = load_columns(stmt.order_by(BusinessDay.date.desc(), BusinessDay.location_id))
+
+    rows = [
+        dict({'id': id_, 'date': day.isoformat(), 'location': {'name': location_name}}, **dict(zip(_DAILY_SUMMARY_FIELDS, values)))
+        for id_, day, location_name, *values in zip(
+            columns['id'], columns['date'], columns['location_name'], *[columns[field] for field in _DAILY_SUMMARY_FIELDS])
+    ]
+    chart_data = series_by_location(columns['date'], columns['location_name'], columns['total_sales'])
+    return {'rows': rows, 'chart_data': chart_data}
+
+
+def product_mix_query(start_date, end_date, location_id):
+    """各商品類別的銷售件數 (金額大於 0 的品項數) 與銷售總額 (金額大於 0 的品項合計)，讀取營業日類別彙總。
+
+    依品項金額合計 (含折扣) 由高到低排序，與直接加總 TransactionItem.price 的排序相同；
+    報表頁面與 CSV 匯出共用這個查詢。
+    """
+    from ..models import BusinessDay, BusinessDayCategoryTotal, Category
+
+    stmt = select(
+        Category.name.label('category_name'),
+        func.sum(BusinessDayCategoryTotal.item_count).label('items_sold'),
+        func.sum(BusinessDayCategoryTotal.gross).label('total_sales')
+    ).join(BusinessDayCategoryTotal.business_day).join(BusinessDayCategoryTotal.category).where(
+        BusinessDay.date.between(start_date, end_date), Category.category_type == 'product'
+    )
+    if location_id != 'all':
+        stmt = stmt.where(BusinessDay.location_id == location_id)
+    # discount 以正數儲存，gross - discount 即為該類別所有品項金額的合計 sum(price)
+    return stmt.group_by(Category.name).order_by(
+        func.sum(BusinessDayCategoryTotal.gross - BusinessDayCategoryTotal.discount).desc(), Category.name)
+
+
+def _product_mix(start_date, end_date, location_id):
+    """各商品類別的銷售件數與銷售額。"""
+    columns = load_columns(product_mix_query(start_date, end_date, location_id))
+
+    rows = [{'category_name': name, 'total_sales': sales, 'items_sold': items}
+            for name, sales, items in zip(columns['category_name'], columns['total_sales'], columns['items_sold'])]
+    return {
+        'rows': rows,
+        'total_revenue': float(numeric(columns['total_sales']).sum()) if rows else 0,
+        'chart_data': column_chart(columns['category_name'], [('銷售總額', columns['total_sales'], {})])
+    }
+
+
+def _sales_trend(start_date, end_date, location_id):
+    """每日銷售額與交易筆數趨勢。"""
+    from ..models import BusinessDay
+
+    stmt = select(
+        BusinessDay.date, func.sum(BusinessDay.total_sales).label('total_sales'),
+        func.sum(BusinessDay.total_transactions).label('total_transactions')
+    ).where(BusinessDay.date.between(start_date, end_date))
+    if location_id != 'all':
+        stmt = stmt.where(BusinessDay.location_id == location_id)
+    columns = load_columns(stmt.group_by(BusinessDay.date).order_by(BusinessDay.date))
+
+    labels = [day.isoformat() for day in columns['date']]
+    rows = [{'date': label, 'total_sales': sales, 'total_transactions': transactions}
+            for label, sales, transactions in zip(labels, columns['total_sales'], columns['total_transactions'])]
+    return {
+        'rows': rows,
+        'chart_data': column_chart(labels, [
+            ('總銷售額', columns['total_sales'], {'borderColor': 'rgb(75, 192, 192)', 'tension': 0.1, 'yAxisID': 'y'}),
+            ('總交易筆數', columns['total_transactions'], {'borderColor': 'rgb(255, 99, 132)', 'tension': 0.1, 'yAxisID': 'y1'})
+        ])
+    }
+
+
+def _periodic_performance(start_date_a, end_date_a, start_date_b, end_date_b, time_unit, location_id):
+    """兩個期間依年、季或月的銷售額比較；兩個期間的營業日以單一查詢讀取後分組。"""
+    from ..models import BusinessDay
+
+    stmt = select(BusinessDay.date, BusinessDay.total_sales, BusinessDay.total_transactions).where(or_(
+        BusinessDay.date.between(start_date_a, end_date_a), BusinessDay.date.between(start_date_b, end_date_b)
+    ))
+    if location_id != 'all':
+        stmt = stmt.where(BusinessDay.location_id == location_id)
+    columns = load_columns(stmt)
+
+    dates = columns['date']
+    mask_a = (dates >= start_date_a) & (dates <= end_date_a)
+    mask_b = (dates >= start_date_b) & (dates <= end_date_b)
+    results = compare_periods(dates, columns['total_sales'], columns['total_transactions'], mask_a.astype(bool), mask_b.astype(bool), time_unit)
+    return {
+        'rows': results,
+        'chart_data': column_chart([r['label'] for r in results], [
+            ('期間 A', [r['sales_a'] for r in results], {}),
+            ('期間 B', [r['sales_b'] for r in results], {})
+        ])
+    }
+
+
+def _peak_hours(start_date, end_date, location_id):
+    """各小時的交易筆數與銷售總額 (讀取每小時彙總)。"""
+    from .hourly_totals_service import peak_hours
+
+    rows = [{'hour': r.hour, 'transactions': r.transactions, 'total_sales': r.total_sales}
+            for r in peak_hours(start_date, end_date, location_id)]
+    return {
+        'rows': rows,
+        'chart_data': column_chart([f"{r['hour']:02d}:00 - {r['hour'] + 1:02d}:00" for r in rows], [
+            ('交易筆數', [r['transactions'] for r in rows], {}),
+            ('銷售總額', [r['total_sales'] for r in rows], {})
+        ])
+    }
+
+
+def build_report(report_type, location_id, periods, time_unit=None):
+    """計算報表結果 (可序列化為 JSON 的 dict，含 rows 與 chart_data)；periods 為 [(開始日期, 結束日期)]。"""
+    start_date, end_date = periods[0]
+    if report_type == 'daily_summary':
+        return _daily_summary(start_date, end_date, location_id)
+    if report_type == 'product_mix':
+        return _product_mix(start_date, end_date, location_id)
+    if report_type == 'sales_trend':
+        return _sales_trend(start_date, end_date, location_id)
+    if report_type == 'peak_hours':
+        return _peak_hours(start_date, end_date, location_id)
+    if report_type == 'periodic_performance':
+        (start_date_a, end_date_a), (start_date_b, end_date_b) = periods
+        return _periodic_performance(start_date_a, end_date_a, start_date_b, end_date_b, time_unit, location_id)
+    raise ValueError(f"不支援的報表類型: {report_type}")
+
+
+def _key_parts(time_unit):
+    return (time_unit,) if time_unit else ()
+
+
+def get_report(report_type, location_id, periods, time_unit=None):
+    """取得報表結果，已歸檔期間的結果會經由 Redis 快取。"""
+    return cached_report(report_type, location_id, periods,
+                         lambda: build_report(report_type, location_id, periods, time_unit),
+                         *_key_parts(time_unit))
+
+
+def recall_cached_report(report_type, location_id, periods, time_unit=None):
+    """只查詢快取中的報表結果，沒有時回傳 None。"""
+    return recall_report(report_type, location_id, periods, *_key_parts(time_unit))
+
+
+def range_days(periods):
+    return sum((end - start).days + 1 for start, end in periods)
+
+
+def _job_args(report_type, location_id, periods, time_unit):
+    return (report_type, str(location_id), [[start.isoformat(), end.isoformat()] for start, end in periods], time_unit)
+
+
+def run_report_task(report_type, location_id, periods, time_unit=None):
+    """RQ 背景任務：產生報表並回傳結果，結果由 RQ 保存於 Redis。"""
+    from .. import create_app
+    app = create_app()
+    with app.app_context():
+        periods = [(date.fromisoformat(start), date.fromisoformat(end)) for start, end in periods]
+        return get_report(report_type, location_id, periods, time_unit)
+
+
+def enqueue_report(report_type, location_id, periods, time_unit=None):
+    """將報表交由背景 worker 產生，回傳 RQ Job。"""
+    return current_app.task_queue.enqueue(
+        _TASK_NAME,
+        args=_job_args(report_type, location_id, periods, time_unit),
+        job_timeout='30m',
+        result_ttl=REPORT_JOB_RESULT_TTL,
+        failure_ttl=REPORT_JOB_RESULT_TTL
+    )
+
+
+def fetch_report_job(job_id, report_type=None, location_id=None, periods=None, time_unit=None):
+    """取得報表背景任務；不存在、不是報表任務或與指定的查詢條件不符時回傳 None。"""
+    try:
+        job = Job.fetch(job_id, connection=current_app.redis)
+    except NoSuchJobError:
+        return None
+    if job.func_name != _TASK_NAME:
+        return None
+    if report_type is not None and list(job.args) != list(_job_args(report_type, location_id, periods, time_unit)):
+        return None
+    return job
+
+
+def report_job_status(job):
+    """背景任務的狀態摘要，供頁面輪詢。"""
+    status = job.get_status()
+    return {
+        'status': status.value if isinstance(status, JobStatus) else status,
+        'ready': status == JobStatus.FINISHED,
+        'failed': status in (JobStatus.FAILED, JobStatus.STOPPED, JobStatus.CANCELED),
+        'position': job.get_position() if status == JobStatus.QUEUED else None,
+    }
@@ -0,0 +1,142 @@
+# app/services/settlement_service.py
+import json
+from collections import namedtuple
+
+from .cache_service import get_versions, bump_version, remember_response, recall_response
+from .report_cache_service import day_namespaces
+
+LOCATION_ORDER = ["本舖", "瘋衣舍", "特賣會 1", "特賣會 2", "其他"]
+
+# (編號, 名稱, grand_total 鍵值, 據點欄位)，總結算頁面與列印報表共用
+FINANCE_ITEMS = [
+    ('A', '應有現金', 'A', 'expected_cash_new'),
+    ('B', '開店現金', 'B', 'opening_cash'),
+    ('C', '手帳營收', 'C', 'total_sales'),
+    ('D', '其他現金', 'D', 'other_cash'),
+    ('E', '實有現金', 'E', 'closing_cash'),
+    ('F', '溢短收', 'F', 'cash_diff_new'),
+    ('H', '存款', 'H', 'deposit'),
+    ('I', '明日開店現金', 'I', 'next_day_opening_cash')
+]
+SALES_ITEMS = [('J', '結單數', 'J', 'total_transactions'), ('K', '品項數', 'K', 'total_items')]
+
+# 結算結果在 Redis 中的保存時間；資料異動時靠版本號失效
+SETTLEMENT_CACHE_TTL = 24 * 60 * 60
+
+_REPORT_FIELDS = ('opening_cash', 'total_sales', 'closing_cash', 'total_transactions', 'total_items')
+
+Settlement = namedtuple('Settlement', [
+    'report_date', 'reports', 'active_locations_ordered', 'grand_total', 'remarks_data',
+    'is_settled', 'all_closed', 'unclosed_locations'
+])
+
+
+def _settlement_namespace(report_date):
+    return f"settlement:{report_date.isoformat()}"
+
+
+def _compute_figures(report_date):
+    """以批次查詢計算已歸檔據點的數字與 A–K 總計，回傳可序列化為 JSON 的 dict。"""
+    from .. import db
+    from ..models import BusinessDay, Location, DailySettlement
+    from .income_service import other_income_breakdown
+
+    rows = db.session.query(
+        BusinessDay.id, Location.name, *[getattr(BusinessDay, field) for field in _REPORT_FIELDS]
+    ).join(Location, BusinessDay.location_id == Location.id).filter(
+        BusinessDay.date == report_date, BusinessDay.status == 'CLOSED'
+    ).all()
+    breakdown = other_income_breakdown(row[0] for row in rows)
+    daily_settlement = DailySettlement.query.filter_by(date=report_date).first()
+
+    reports = {}
+    grand_total = dict.fromkeys(['B', 'C', 'D', 'E', 'J', 'K'], 0)
+    for business_day_id, location_name, *values in rows:
+        report = dict(zip(_REPORT_FIELDS, values))
+        report['donation_total'], report['other_total'] = breakdown[business_day_id]
+        report['other_cash'] = (report['donation_total'] or 0) + (report['other_total'] or 0)
+        report['expected_cash_new'] = (report['opening_cash'] or 0) + (report['total_sales'] or 0) + report['other_cash']
+        report['cash_diff_new'] = (report['closing_cash'] or 0) - report['expected_cash_new']
+        reports[location_name] = report
+
+        grand_total['B'] += report['opening_cash'] or 0  # B: 開店現金
+        grand_total['C'] += report['total_sales'] or 0  # C: 手帳營收
+        grand_total['D'] += report['other_cash']  # D: 其他現金
+        grand_total['E'] += report['closing_cash'] or 0  # E: 實有現金
+        grand_total['J'] += report['total_transactions'] or 0
+        grand_total['K'] += report['total_items'] or 0
+
+    # A: 應有現金 = B + C + D
+    grand_total['A'] = grand_total['B'] + grand_total['C'] + grand_total['D']
+    # F: 溢短收 = E - A
+    grand_total['F'] = grand_total['E'] - grand_total['A']
+
+    if daily_settlement:
+        grand_total['H'] = daily_settlement.total_deposit
+        grand_total['I'] = daily_settlement.total_next_day_opening_cash
+    else:
+        grand_total['I'] = 0
+        # H: 存款 = E - I
+        grand_total['H'] = grand_total['E'] - grand_total['I']
+
+    return {
+        'reports': reports,
+        'grand_total': grand_total,
+        'is_settled': daily_settlement is not None,
+        'remarks_data': json.loads(daily_settlement.remarks) if daily_settlement and daily_settlement.remarks else {},
+    }
+
+
+def _settlement_figures(report_date):
+    """結算數字以 (日期, 資料版本) 為鍵暫存於 Redis，各據點同時開啟頁面或列印時只需計算一次。"""
+    version = settlement_version(report_date)
+    if version is None:
+        return _compute_figures(report_date)
+    key = f"settlement:{report_date.isoformat()}:{version}"
+    figures = recall_response(key)
+    if figures is None:
+        figures = _compute_figures(report_date)
+        remember_response(key, figures, SETTLEMENT_CACHE_TTL)
+    return figures
+
+
+def settlement_version(report_date):
+    """總結算內容的資料版本字串 (該日營業資料異動或儲存總結算時改變)；Redis 無法連線時回傳 None。"""
+    versions = get_versions(day_namespaces(report_date) + [_settlement_namespace(report_date)])
+    if versions is None:
+        return None
+    return '.'.join(str(v) for v in versions)
+
+
+def _unclosed_locations(report_date):
+    from .. import db
+    from ..models import BusinessDay, Location
+
+    opened = db.session.query(Location.name).join(BusinessDay).filter(
+        BusinessDay.date == report_date, BusinessDay.status != 'CLOSED').all()
+    return sorted({name for name, in opened})
+
+
+def get_settlement(report_date):
+    """指定日期的總結算資料：各據點的數字 (reports，以據點名稱為鍵) 與 A–K 總計 (grand_total)。
+
+    已開帳但尚未歸檔的據點每次都重新查詢，其餘數字經由 Redis 暫存。
+    """
+    figures = _settlement_figures(report_date)
+    reports = figures['reports']
+    unclosed_locations = _unclosed_locations(report_date)
+    return Settlement(
+        report_date=report_date,
+        reports=reports,
+        active_locations_ordered=[name for name in LOCATION_ORDER if name in reports],
+        grand_total=figures['grand_total'],
+        remarks_data=figures['remarks_data'],
+        is_settled=figures['is_settled'],
+        all_closed=not unclosed_locations,
+        unclosed_locations=unclosed_locations,
+    )
+
+
+def invalidate_settlement(report_date):
+    """總結算儲存並 commit 後呼叫，讓該日暫存的結算數字失效。"""
+    bump_version(_settlement_namespace(report_date))
@@ -0,0 +1,342 @@
+# app/services/sheet_sync_service.py
+from datetime import date, datetime, timedelta
+
+from flask import current_app
+from googleapiclient.errors import HttpError
+from redis.exceptions import RedisError
+from sqlalchemy import or_, insert, delete, extract
+
+from .monthly_totals_service import monthly_totals
+from .google_service import (
+    get_sheet_titles, cached_sheet_titles, remember_sheet_titles, forget_sheet_titles,
+    add_sheets, clear_sheets, batch_write_values, MAX_ROWS_PER_REQUEST
+)
+
+DAILY_SUMMARY_SHEET = "每日摘要"
+DAILY_SUMMARY_HEADER = ["日期", "據點", "開店準備金", "本日銷售總額", "帳面總額", "盤點現金合計", "帳差", "交易筆數", "銷售件數"]
+MONTHLY_SUMMARY_SHEET = "每月數據"
+MONTHLY_SUMMARY_HEADER = ["月份", "總銷售額", "總帳差", "總交易筆數", "總銷售件數"]
+TRANSACTION_HEADER = ["時間戳", "金額", "品項數"]
+
+# 歸檔後等待多久再寫入試算表 (秒)，收集這段時間內其他據點的歸檔一起寫入
+SHEET_SYNC_DELAY = 30
+# 寫入失敗 (如 API 配額用盡) 時，隔多久再重試 (秒)
+SHEET_SYNC_RETRY_DELAY = 5 * 60
+_PENDING_KEY = "sheet_sync:pending"
+_SCHEDULED_KEY = "sheet_sync:scheduled"
+# 任務到期後若未執行 (如 worker 異常結束)，排程標記過期後下一次歸檔會重新排入任務
+_SCHEDULED_TTL = 10 * 60
+
+# 單次 IN 查詢的資料數量上限，避免超過資料庫的參數個數限制
+_CHUNK_SIZE = 500
+
+
+def transaction_sheet_name(timestamp):
+    return timestamp.strftime("%Y年%m月")
+
+
+def _daily_row(day, location_name):
+    return [day.date.strftime("%Y-%m-%d"), location_name, day.opening_cash, day.total_sales, day.expected_cash,
+            day.closing_cash, day.cash_diff, day.total_transactions, day.total_items]
+
+
+def _year_range(year):
+    return date(year, 1, 1), date(year + 1, 1, 1)
+
+
+def _load_states(spreadsheet_id):
+    """試算表中所有據點、所有年度的同步進度，以 (據點 id, 年度, 工作表名稱) 為鍵。
+
+    檔名格式不含年份時，不同年度寫入同一個試算表，新的資料列接在所有年度已使用的列之後。
+    """
+    from ..models import SheetSyncState
+
+    states = SheetSyncState.query.filter_by(spreadsheet_id=spreadsheet_id).all()
+    return {(state.location_id, state.year, state.sheet_name): state for state in states}
+
+
+def _row_numbers(state):
+    from .. import db
+    from ..models import SheetSyncRow
+
+    if state is None:
+        return {}
+    return dict(db.session.query(SheetSyncRow.row_key, SheetSyncRow.row_number).filter_by(state_id=state.id).all())
+
+
+def _drop_states(states):
+    """刪除同步進度與其列號對照 (不 commit)。"""
+    from .. import db
+    from ..models import SheetSyncState, SheetSyncRow
+
+    ids = [state.id for state in states]
+    for start in range(0, len(ids), _CHUNK_SIZE):
+        chunk = ids[start:start + _CHUNK_SIZE]
+        db.session.execute(delete(SheetSyncRow).where(SheetSyncRow.state_id.in_(chunk)))
+        db.session.execute(delete(SheetSyncState).where(SheetSyncState.id.in_(chunk)))
+
+
+def _drop_other_spreadsheets(location_id, year, spreadsheet_id):
+    """據點同一年度改寫入新的試算表 (覆蓋重建或檔名格式變更) 後，舊試算表的同步進度已不再使用。
+
+    其他年度的進度保留，跨年度後仍可增量更新上一年度的試算表。
+    """
+    from ..models import SheetSyncState
+
+    _drop_states(SheetSyncState.query.filter(
+        SheetSyncState.location_id == location_id, SheetSyncState.year == year,
+        SheetSyncState.spreadsheet_id != spreadsheet_id).all())
+
+
+class _Tab:
+    """單一工作表這次同步要寫入的資料列；多個據點共用同一個試算表時，新的資料列依序接在所有據點已使用的列之後。"""
+
+    def __init__(self, name, header, states):
+        self.name = name
+        self.row_count = max((state.row_count for state in states), default=1)
+        self.writes = {} if states else {1: header}
+        self.is_new = not states
+
+    def value_ranges(self):
+        """將寫入的列依連續列號合併為 values.batchUpdate 的範圍。"""
+        ranges = []
+        for number in sorted(self.writes):
+            if ranges and ranges[-1][0] + len(ranges[-1][1]) == number and len(ranges[-1][1]) < MAX_ROWS_PER_REQUEST:
+                ranges[-1][1].append(self.writes[number])
+            else:
+                ranges.append((number, [self.writes[number]]))
+        return [{'range': f"'{self.name}'!A{number}", 'values': values} for number, values in ranges]
+
+
+class _SheetPlan:
+    """單一據點在單一工作表的同步：已同步過的資料覆寫原本的列，新的資料接在最後一列之後。"""
+
+    def __init__(self, tab, state):
+        self.tab = tab
+        self.name = tab.name
+        self.state = state
+        self.numbers = _row_numbers(state)
+        self.added = {}
+        self.last_synced_id = state.last_synced_id if state else None
+
+    def put(self, key, row, synced_id=None):
+        key = str(key)
+        number = self.numbers.get(key) or self.added.get(key)
+        if number is None:
+            self.tab.row_count += 1
+            number = self.added[key] = self.tab.row_count
+        self.tab.writes[number] = row
+        if synced_id is not None:
+            self.last_synced_id = max(self.last_synced_id or 0, synced_id)
+
+
+def _plan_daily_summary(location, year, plan):
+    """該年度已歸檔且尚未同步或同步後修改過的營業日；回傳這些營業日所在的 (年, 月)。"""
+    from .. import db
+    from ..models import BusinessDay
+
+    start, end = _year_range(year)
+    query = db.session.query(
+        BusinessDay.id, BusinessDay.date, BusinessDay.opening_cash, BusinessDay.total_sales, BusinessDay.expected_cash,
+        BusinessDay.closing_cash, BusinessDay.cash_diff, BusinessDay.total_transactions, BusinessDay.total_items
+    ).filter(BusinessDay.location_id == location.id, BusinessDay.status == 'CLOSED',
+             BusinessDay.date >= start, BusinessDay.date < end)
+    if plan.state:
+        query = query.filter(or_(BusinessDay.id > (plan.state.last_synced_id or 0),
+                                 BusinessDay.updated_at > plan.state.synced_at))
+    months = set()
+    for day in query.order_by(BusinessDay.date, BusinessDay.id).all():
+        plan.put(day.id, _daily_row(day, location.name), synced_id=day.id)
+        months.add((day.date.year, day.date.month))
+    return months
+
+
+def _plan_monthly_summary(location, year, plan, months):
+    """由每月彙總表寫入指定月份 (plan 為新工作表時為該年度所有月份) 的每月數據，以月份對應的列號直接覆寫。"""
+    if plan.state and not months:
+        return
+    if not plan.state:
+        months = [(year, month) for month in range(1, 13)]
+    for total in monthly_totals(location.id, months):
+        month_str = f"{total.year}-{total.month:02d}"
+        plan.put(month_str, [month_str, total.total_sales, total.cash_diff, total.total_transactions, total.total_items])
+
+
+def _plan_transactions(location, year, states, plan_for):
+    """該年度新增的交易附加到所屬月份的工作表；同步後修改過的營業日，其已同步的交易覆寫原本的列。"""
+    from .. import db
+    from ..models import BusinessDay, Transaction
+
+    synced = [state for (location_id, state_year, name), state in states.items()
+              if location_id == location.id and state_year == year
+              and name not in (DAILY_SUMMARY_SHEET, MONTHLY_SUMMARY_SHEET)]
+    high_water_mark = max((state.last_synced_id or 0 for state in synced), default=0)
+    since = min((state.synced_at for state in synced if state.synced_at), default=None)
+
+    start, end = _year_range(year)
+    columns = (Transaction.id, Transaction.timestamp, Transaction.amount, Transaction.item_count)
+    base = db.session.query(*columns).join(BusinessDay, Transaction.business_day_id == BusinessDay.id).filter(
+        BusinessDay.location_id == location.id, BusinessDay.date >= start, BusinessDay.date < end)
+    condition = Transaction.id > high_water_mark
+    if since is not None:
+        condition = or_(condition, BusinessDay.updated_at > since)
+    for transaction in base.filter(condition).order_by(Transaction.timestamp, Transaction.id).yield_per(1000):
+        plan = plan_for(location, transaction_sheet_name(transaction.timestamp), TRANSACTION_HEADER)
+        key = str(transaction.id)
+        if transaction.id <= high_water_mark and key not in plan.numbers:
+            # 已同步過但對照中沒有 (工作表已重建) 的交易不補寫，避免與既有資料重複
+            continue
+        plan.put(key, [transaction.timestamp.strftime("%Y-%m-%d %H:%M:%S"), transaction.amount, transaction.item_count],
+                 synced_id=transaction.id)
+
+
+def _save_plans(spreadsheet_id, year, plans, started):
+    """寫入成功後更新同步進度與列號對照 (不 commit)。"""
+    from .. import db
+    from ..models import SheetSyncState, SheetSyncRow
+
+    for (location_id, _), plan in plans.items():
+        state = plan.state
+        if state is None:
+            state = SheetSyncState(location_id=location_id, year=year, spreadsheet_id=spreadsheet_id,
+                                   sheet_name=plan.name)
+            db.session.add(state)
+        state.row_count = plan.tab.row_count
+        state.last_synced_id = plan.last_synced_id
+        state.synced_at = started
+        db.session.flush()
+        rows = [{'state_id': state.id, 'row_key': key, 'row_number': number} for key, number in plan.added.items()]
+        for start in range(0, len(rows), _CHUNK_SIZE):
+            db.session.execute(insert(SheetSyncRow), rows[start:start + _CHUNK_SIZE])
+
+
+def _sync(sheets_service, spreadsheet_id, locations, year, include_transactions, titles):
+    from .. import db
+
+    # 與營業日的 updated_at 相同，以不含時區的 UTC 時間比較
+    started = datetime.utcnow()
+    for location in locations:
+        _drop_other_spreadsheets(location.id, year, spreadsheet_id)
+    states = _load_states(spreadsheet_id)
+    # 工作表被刪除時，所有據點在該工作表的進度都要捨棄，重建後由第一列重新寫入
+    missing = [key for key in states if key[2] not in titles]
+    if missing:
+        _drop_states([states.pop(key) for key in missing])
+
+    tabs, plans = {}, {}
+
+    def plan_for(location, name, header):
+        if name not in tabs:
+            tabs[name] = _Tab(name, header, [state for (_, _, sheet_name), state in states.items() if sheet_name == name])
+        if (location.id, name) not in plans:
+            plans[(location.id, name)] = _SheetPlan(tabs[name], states.get((location.id, year, name)))
+        return plans[(location.id, name)]
+
+    for location in locations:
+        months = _plan_daily_summary(location, year, plan_for(location, DAILY_SUMMARY_SHEET, DAILY_SUMMARY_HEADER))
+        _plan_monthly_summary(location, year, plan_for(location, MONTHLY_SUMMARY_SHEET, MONTHLY_SUMMARY_HEADER), months)
+        if include_transactions:
+            _plan_transactions(location, year, states, plan_for)
+
+    pending = [tab for tab in tabs.values() if tab.writes]
+    if not pending:
+        db.session.commit()
+        return 0
+    new_sheets = [tab.name for tab in pending if tab.name not in titles]
+    add_sheets(sheets_service, spreadsheet_id, new_sheets)
+    if new_sheets:
+        remember_sheet_titles(spreadsheet_id, titles | set(new_sheets))
+    # 沒有同步進度但已存在的工作表 (舊版完整備份留下的) 從第一列重新寫入
+    clear_sheets(sheets_service, spreadsheet_id, [tab.name for tab in pending if tab.is_new and tab.name in titles])
+    batch_write_values(sheets_service, spreadsheet_id, [r for tab in pending for r in tab.value_ranges()])
+
+    _save_plans(spreadsheet_id, year, {key: plan for key, plan in plans.items() if plan.state or plan.added or plan.tab.is_new}, started)
+    db.session.commit()
+    return sum(len(tab.writes) - (1 if tab.is_new else 0) for tab in pending)
+
+
+def sync_spreadsheet(sheets_service, spreadsheet_id, locations, year=None, include_transactions=True):
+    """將寫入同一個試算表的據點在 year 年度 (預設為本年度) 的每日摘要、每月數據 (與各月份交易紀錄) 增量同步並 commit，
+    回傳寫入的資料列數。
+
+    只讀取尚未同步或同步後修改過的資料，以固定列號寫入，同一批資料重複同步的結果相同；
+    工作表被刪除時重新建立並完整寫入。所有據點的資料合併為一次 values.batchUpdate，工作表名稱使用暫存。
+    """
+    from .. import db
+
+    year = year or date.today().year
+    try:
+        return _sync(sheets_service, spreadsheet_id, locations, year, include_transactions,
+                     cached_sheet_titles(sheets_service, spreadsheet_id))
+    except HttpError as e:
+        if e.resp.status != 400:
+            raise
+        # 暫存的工作表名稱已過期 (工作表在雲端被刪除或新增)，範圍無效；重新讀取後再同步一次
+        db.session.rollback()
+        forget_sheet_titles(spreadsheet_id)
+    titles = get_sheet_titles(sheets_service, spreadsheet_id)
+    remember_sheet_titles(spreadsheet_id, titles)
+    return _sync(sheets_service, spreadsheet_id, locations, year, include_transactions, titles)
+
+
+def synced_years(location_ids):
+    """據點有已歸檔營業日的年度 (沒有時為本年度)，完整備份時每個年度寫入各自的試算表。"""
+    from .. import db
+    from ..models import BusinessDay
+
+    year = extract('year', BusinessDay.date)
+    years = db.session.query(year).filter(
+        BusinessDay.location_id.in_(list(location_ids)), BusinessDay.status == 'CLOSED').distinct().all()
+    return sorted(int(row[0]) for row in years) or [date.today().year]
+
+
+
+def _queue_sheet_syncs(members, delay):
+    if not members:
+        return
+    try:
+        current_app.redis.sadd(_PENDING_KEY, *members)
+        if not current_app.redis.set(_SCHEDULED_KEY, 1, nx=True, ex=delay + _SCHEDULED_TTL):
+            return
+        try:
+            current_app.task_queue.enqueue_in(
+                timedelta(seconds=delay), 'app.services.google_service.flush_sheet_sync_task', job_timeout='10m')
+        except RedisError:
+            current_app.redis.delete(_SCHEDULED_KEY)
+            raise
+    except RedisError as e:
+        current_app.logger.warning(f"排入雲端同步任務失敗: {e}")
+
+
+def request_sheet_sync(days, delay=SHEET_SYNC_DELAY):
+    """營業日歸檔或修改並 commit 後呼叫：記錄待同步的 (據點, 年度)，尚未排程時排入 delay 秒後執行的背景任務。
+
+    days 為 (據點 id, 營業日日期)；營業日寫入所屬年度的試算表，跨年度後修改上一年度的營業日仍會更新上一年度的檔案。
+    重複的請求 (同一據點多次歸檔或修改) 會合併，一起由 flush_sheet_sync_task 寫入；Redis 無法連線時略過。
+    延遲執行需要以 --with-scheduler 啟動 RQ worker。
+    """
+    _queue_sheet_syncs(sorted({f"{int(location_id)}:{day.year}" for location_id, day in days}), delay)
+
+
+def retry_sheet_syncs(pending):
+    """寫入失敗時將 take_pending_sheet_syncs 取出的 (據點 id, 年度) 放回待同步清單，SHEET_SYNC_RETRY_DELAY 秒後重試。"""
+    _queue_sheet_syncs(sorted({f"{location_id}:{year}" for location_id, year in pending}), SHEET_SYNC_RETRY_DELAY)
+
+
+def take_pending_sheet_syncs():
+    """取出並清除待同步的 (據點 id, 年度)。先清除排程標記，之後的請求會排入新的任務，不會遺漏。"""
+    try:
+        current_app.redis.delete(_SCHEDULED_KEY)
+        pipe = current_app.redis.pipeline()
+        pipe.smembers(_PENDING_KEY)
+        pipe.delete(_PENDING_KEY)
+        members, _ = pipe.execute()
+    except RedisError as e:
+        current_app.logger.warning(f"讀取待同步據點失敗: {e}")
+        return []
+    pending = set()
+    for member in members:
+        location_id, _, year = member.decode().partition(":")
+        # 舊版只記錄據點 id，視為本年度
+        pending.add((int(location_id), int(year) if year else date.today().year))
+    return sorted(pending)
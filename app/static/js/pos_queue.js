@@ -0,0 +1,197 @@
+// POS 離線交易佇列：結帳先寫入 IndexedDB，再由背景批次上傳至 /cashier/record_transactions_batch
+// 每筆交易的 client_id 同時是伺服器端的冪等鍵，因此重送不會重複入帳
+// 被伺服器拒絕的交易移至 rejected 存放區保留，供收銀員檢視、匯出後人工補登
+const PosQueue = (function () {
+    const DB_NAME = 'pos-offline';
+    const DB_VERSION = 2;
+    const STORE_NAME = 'transactions';
+    const REJECTED_STORE_NAME = 'rejected';
+    const BATCH_URL = '/cashier/record_transactions_batch';
+    const BATCH_SIZE = 50;
+    const FLUSH_INTERVAL_MS = 15000;
+
+    let dbPromise = null;
+    let flushing = null;
+    const listeners = [];
+
+    function openDb() {
+        if (!dbPromise) {
+            dbPromise = new Promise((resolve, reject) => {
+                const request = indexedDB.open(DB_NAME, DB_VERSION);
+                request.onupgradeneeded = () => {
+                    const db = request.result;
+                    [STORE_NAME, REJECTED_STORE_NAME].forEach(name => {
+                        if (db.objectStoreNames.contains(name)) return;
+                        const store = db.createObjectStore(name, { keyPath: 'client_id' });
+                        store.createIndex('location_slug', 'location_slug');
+                    });
+                };
+                request.onsuccess = () => resolve(request.result);
+                request.onerror = () => reject(request.error);
+            });
+        }
+        return dbPromise;
+    }
+
+    function withStore(mode, callback, storeName = STORE_NAME) {
+        return openDb().then(db => new Promise((resolve, reject) => {
+            const tx = db.transaction(storeName, mode);
+            const result = callback(tx.objectStore(storeName));
+            tx.oncomplete = () => resolve(result && 'result' in result ? result.result : undefined);
+            tx.onerror = () => reject(tx.error);
+            tx.onabort = () => reject(tx.error);
+        }));
+    }
+
+    function generateClientId() {
+        if (window.crypto && typeof window.crypto.randomUUID === 'function') {
+            return window.crypto.randomUUID();
+        }
+        return `${Date.now().toString(36)}-${Math.random().toString(36).slice(2, 12)}`;
+    }
+
+    function pending(locationSlug) {
+        return withStore('readonly', store => store.index('location_slug').getAll(locationSlug));
+    }
+
+    function remove(clientIds) {
+        return withStore('readwrite', store => {
+            clientIds.forEach(id => store.delete(id));
+        });
+    }
+
+    // 在同一個 IndexedDB 交易中將被拒絕的交易自佇列移到 rejected 存放區，並附上伺服器回傳的原因
+    function moveToRejected(records, rejections) {
+        return openDb().then(db => new Promise((resolve, reject) => {
+            const tx = db.transaction([STORE_NAME, REJECTED_STORE_NAME], 'readwrite');
+            const queueStore = tx.objectStore(STORE_NAME);
+            const rejectedStore = tx.objectStore(REJECTED_STORE_NAME);
+            const rejectedAt = new Date().toISOString();
+            rejections.forEach(rejection => {
+                const record = records.find(r => r.client_id === rejection.client_id);
+                if (!record) return;
+                rejectedStore.put(Object.assign({}, record, {
+                    error: rejection.error,
+                    status: rejection.status || 'rejected',
+                    business_date: rejection.business_date || null,
+                    rejected_at: rejectedAt,
+                }));
+                queueStore.delete(record.client_id);
+            });
+            tx.oncomplete = () => resolve();
+            tx.onerror = () => reject(tx.error);
+            tx.onabort = () => reject(tx.error);
+        }));
+    }
+
+    function rejected(locationSlug) {
+        return withStore('readonly', store => store.index('location_slug').getAll(locationSlug), REJECTED_STORE_NAME);
+    }
+
+    function clearRejected(clientIds) {
+        return withStore('readwrite', store => {
+            clientIds.forEach(id => store.delete(id));
+        }, REJECTED_STORE_NAME);
+    }
+
+    function csvCell(value) {
+        const text = value === undefined || value === null ? '' : String(value);
+        return /[",\n]/.test(text) ? `"${text.replace(/"/g, '""')}"` : text;
+    }
+
+    // 將被拒絕的交易匯出為 CSV 下載 (含品項明細)，回傳匯出的筆數
+    async function exportRejected(locationSlug) {
+        const rows = await rejected(locationSlug);
+        if (rows.length === 0) return 0;
+        const header = ['client_id', 'timestamp', 'business_date', 'amount', 'cash_received', 'change_given', 'items', 'status', 'error'];
+        const lines = rows.map(r => [
+            r.client_id,
+            r.timestamp,
+            r.business_date,
+            (r.items || []).reduce((sum, item) => sum + (Number(item.price) || 0), 0),
+            r.cash_received,
+            r.change_given,
+            JSON.stringify(r.items || []),
+            r.status,
+            r.error,
+        ].map(csvCell).join(','));
+        // 加上 BOM，Excel 開啟時才能正確辨識 UTF-8 中文
+        const blob = new Blob(['\ufeff' + [header.join(',')].concat(lines).join('\r\n')], { type: 'text/csv;charset=utf-8' });
+        const link = document.createElement('a');
+        link.href = URL.createObjectURL(blob);
+        link.download = `rejected_transactions_${locationSlug}_${new Date().toISOString().slice(0, 10)}.csv`;
+        document.body.appendChild(link);
+        link.click();
+        link.remove();
+        URL.revokeObjectURL(link.href);
+        return rows.length;
+    }
+
+    function notify(event) {
+        listeners.forEach(listener => listener(event));
+    }
+
+    // 將一筆結帳放入佇列，回傳其 client_id
+    function enqueue(locationSlug, payload) {
+        const record = Object.assign({}, payload, {
+            client_id: generateClientId(),
+            location_slug: locationSlug,
+            timestamp: new Date().toISOString()
+        });
+        return withStore('readwrite', store => { store.put(record); })
+            .then(() => {
+                notify({ type: 'queued', clientId: record.client_id });
+                return record.client_id;
+            });
+    }
+
+    async function flushLocation(locationSlug) {
+        let queued = await pending(locationSlug);
+        while (queued.length > 0) {
+            const batch = queued.slice(0, BATCH_SIZE);
+            const response = await fetch(BATCH_URL, {
+                method: 'POST', headers: { 'Content-Type': 'application/json' },
+                body: JSON.stringify({ location_slug: locationSlug, transactions: batch }),
+            });
+            if (!response.ok) throw new Error(`批次上傳失敗 (${response.status})`);
+
+            const result = await response.json();
+            if (!result.success) throw new Error(result.error || '批次上傳失敗');
+
+            // 被伺服器拒絕的交易無法透過重試成功，移到 rejected 存放區等待人工補登
+            await remove(result.accepted || []);
+            if ((result.rejected || []).length > 0) {
+                await moveToRejected(batch, result.rejected);
+                notify({ type: 'rejected', count: (await rejected(locationSlug)).length });
+            }
+            notify({ type: 'flushed', result: result });
+            queued = queued.slice(BATCH_SIZE);
+        }
+    }
+
+    // 上傳指定據點佇列中的所有交易；同時間只會有一個上傳流程
+    function flush(locationSlug) {
+        if (!flushing) {
+            flushing = flushLocation(locationSlug)
+                .catch(error => notify({ type: 'error', error: error }))
+                .finally(() => {
+                    flushing = null;
+                    return pending(locationSlug).then(rows => notify({ type: 'pending', count: rows.length }));
+                });
+        }
+        return flushing;
+    }
+
+    function onChange(listener) {
+        listeners.push(listener);
+    }
+
+    function start(locationSlug) {
+        window.addEventListener('online', () => flush(locationSlug));
+        setInterval(() => flush(locationSlug), FLUSH_INTERVAL_MS);
+        rejected(locationSlug).then(rows => notify({ type: 'rejected', count: rows.length }));
+        return flush(locationSlug);
+    }
+
+    return { enqueue, flush, pending, rejected, exportRejected, clearRejected, onChange, start, generateClientId };
+})();
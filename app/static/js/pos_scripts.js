@@ -653,6 +653,7 @@ document.addEventListener("DOMContentLoaded", function () {
     // SECTION 5: 伺服器通訊
     // =================================================================
     // 修正點：將 items 作為參數傳入，以避免非同步問題
+    // 結帳先寫入 IndexedDB 佇列即視為完成，再由 PosQueue 在背景批次上傳，網路不穩時不會卡住收銀
     async function sendTransactionToServer(items, paidAmount, changeReceived) {
         const expandedItems = [];
         items.forEach(item => {
@@ -660,29 +661,34 @@ document.addEventListener("DOMContentLoaded", function () {
                 expandedItems.push({ price: item.unitPrice, category_id: item.category_id });
             }
         });
-        
+        const payload = {
+            items: expandedItems,
+            cash_received: paidAmount,
+            change_given: changeReceived
+        };
+
+        try {
+            await PosQueue.enqueue(POS_LOCATION_SLUG, payload);
+        } catch (error) {
+            // 瀏覽器不支援 IndexedDB (例如部分無痕模式) 時，退回直接送出
+            return sendTransactionDirectly(Object.assign({ idempotency_key: PosQueue.generateClientId() }, payload));
+        }
+        PosQueue.flush(POS_LOCATION_SLUG);
+        return true;
+    }
+
+    async function sendTransactionDirectly(payload) {
         try {
             const response = await fetch("/cashier/record_transaction", {
                 method: "POST", headers: { "Content-Type": "application/json" },
-                body: JSON.stringify({ 
-                    location_slug: POS_LOCATION_SLUG, 
-                    items: expandedItems,
-                    cash_received: paidAmount,
-                    change_given: changeReceived
-                }),
+                body: JSON.stringify(Object.assign({ location_slug: POS_LOCATION_SLUG }, payload)),
             });
 
             if (!response.ok) throw new Error("網路回應不正確");
 
             const result = await response.json();
             if (result.success) {
-                updateDashboardTotals(
-                    result.total_sales,
-                    result.total_transactions,
-                    result.total_items,
-                    result.donation_total,
-                    result.other_total
-                );
+                applyServerTotals(result);
                 return true;
             } else {
                 updateDisplay(`傳送失敗: ${result.error}`);
@@ -694,6 +700,59 @@ document.addEventListener("DOMContentLoaded", function () {
             return false;
         }
     }
+
+    function applyServerTotals(result) {
+        updateDashboardTotals(
+            result.total_sales,
+            result.total_transactions,
+            result.total_items,
+            result.donation_total,
+            result.other_total
+        );
+    }
+
+    function updateSyncStatus(pendingCount) {
+        const badge = document.getElementById("sync-status");
+        if (!badge) return;
+        badge.innerText = `待上傳 ${pendingCount} 筆`;
+        badge.classList.toggle("d-none", pendingCount === 0);
+    }
+
+    function updateRejectedStatus(rejectedCount) {
+        const button = document.getElementById("rejected-status");
+        if (!button) return;
+        button.innerText = `無法入帳 ${rejectedCount} 筆`;
+        button.classList.toggle("d-none", rejectedCount === 0);
+    }
+
+    // 匯出被拒絕的離線交易供人工補登，確認已補登後才自瀏覽器中清除
+    async function exportRejectedTransactions() {
+        const rows = await PosQueue.rejected(POS_LOCATION_SLUG);
+        if (rows.length === 0) return;
+        await PosQueue.exportRejected(POS_LOCATION_SLUG);
+        if (confirm(`已匯出 ${rows.length} 筆無法入帳的交易。\n完成人工補登後，是否自此裝置清除這些紀錄？`)) {
+            await PosQueue.clearRejected(rows.map(r => r.client_id));
+            updateRejectedStatus(0);
+        }
+    }
+
+    PosQueue.onChange(event => {
+        if (event.type === 'flushed') {
+            // 沒有營業中的營業日時伺服器不會回傳累計數字
+            if (event.result.total_sales !== undefined) applyServerTotals(event.result);
+            const manualEntries = (event.result.rejected || []).filter(r => r.status === 'needs_manual_entry');
+            if (manualEntries.length > 0) {
+                const lines = manualEntries.map(r => `${r.business_date}  ${r.timestamp ? new Date(r.timestamp).toLocaleTimeString() : ""}  NT$ ${r.amount}`);
+                alert(`以下 ${manualEntries.length} 筆離線交易所屬的營業日已結束，無法自動入帳，請人工補登：\n\n${lines.join('\n')}\n\n可點選「無法入帳」匯出明細。`);
+            }
+        } else if (event.type === 'pending') {
+            updateSyncStatus(event.count);
+        } else if (event.type === 'rejected') {
+            updateRejectedStatus(event.count);
+        } else if (event.type === 'queued') {
+            PosQueue.pending(POS_LOCATION_SLUG).then(rows => updateSyncStatus(rows.length));
+        }
+    });
     
     // =================================================================
     // SECTION 6: 初始化與事件綁定
@@ -743,5 +802,11 @@ document.addEventListener("DOMContentLoaded", function () {
       });
     }
 
+    const rejectedStatusBtn = document.getElementById("rejected-status");
+    if (rejectedStatusBtn) {
+      rejectedStatusBtn.addEventListener('click', exportRejectedTransactions);
+    }
+
     resetCalculator();
+    PosQueue.start(POS_LOCATION_SLUG);
 });
\ No newline at end of file
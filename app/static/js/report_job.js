@@ -0,0 +1,40 @@
+// 大範圍報表：輪詢背景任務狀態，完成 (或失敗) 後載入帶有 job_id 的查詢網址顯示結果
+document.addEventListener('DOMContentLoaded', function () {
+    const jobElement = document.getElementById('report-job');
+    if (!jobElement) return;
+
+    const messageElement = document.getElementById('report-job-message');
+    const POLL_INTERVAL = 2000;
+
+    async function poll() {
+        try {
+            const response = await fetch(jobElement.dataset.statusUrl);
+            if (response.status === 404) {
+                messageElement.textContent = '找不到背景任務，可能已過期，請重新查詢。';
+                return;
+            }
+            if (response.status === 503) {
+                // 無法讀取任務狀態 (Redis 無法連線)，載入結果網址改由網頁直接產生報表
+                window.location.href = jobElement.dataset.resultUrl;
+                return;
+            }
+            if (!response.ok) throw new Error(`HTTP ${response.status}`);
+            const job = await response.json();
+
+            if (job.ready || job.failed) {
+                window.location.href = jobElement.dataset.resultUrl;
+                return;
+            }
+            if (job.status === 'started') {
+                messageElement.textContent = '產生中...';
+            } else if (job.position !== null && job.position !== undefined) {
+                messageElement.textContent = `排隊中，前面還有 ${job.position} 個任務...`;
+            }
+        } catch (error) {
+            console.error('查詢報表任務狀態失敗:', error);
+        }
+        setTimeout(poll, POLL_INTERVAL);
+    }
+
+    setTimeout(poll, POLL_INTERVAL);
+});
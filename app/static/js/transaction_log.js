@@ -0,0 +1,121 @@
+// 交易細節報表：捲動到表格底部時向 /report/api/transaction_log 以游標分頁載入交易
+// 產生的表格列結構與編輯功能 (report_scripts.js) 所需的 data-* 屬性一致
+document.addEventListener('DOMContentLoaded', function () {
+    const tbody = document.getElementById('transaction-log-body');
+    if (!tbody) return;
+
+    const container = tbody.closest('.table-responsive');
+    const statusElement = document.getElementById('transaction-log-status');
+    const categoriesElement = document.getElementById('all-categories-data');
+    const allCategories = categoriesElement ? JSON.parse(categoriesElement.textContent) : [];
+
+    let cursor = null;
+    let loading = false;
+    let finished = false;
+
+    function escapeHtml(value) {
+        return String(value ?? '').replace(/[&<>"']/g, ch => ({
+            '&': '&amp;', '<': '&lt;', '>': '&gt;', '"': '&quot;', "'": '&#39;'
+        }[ch]));
+    }
+
+    function formatAsCurrency(number) {
+        return `$${new Intl.NumberFormat('en-US').format(Math.round(number || 0))}`;
+    }
+
+    function typeBadge(item) {
+        if (item.category_type === 'other_income') return '<span class="badge bg-info">其他收入</span>';
+        if (item.price > 0) return '<span class="badge bg-success">商品</span>';
+        return '<span class="badge bg-danger">折扣</span>';
+    }
+
+    function categoryOptions(selectedId) {
+        return allCategories.map(category => `<option value="${category.id}" data-type="${escapeHtml(category.category_type)}"${category.id === selectedId ? ' selected' : ''}>${escapeHtml(category.name)}</option>`).join('');
+    }
+
+    function itemCells(item) {
+        return `
+            <td class="editable-cell" data-field="category" data-category-id="${item.category_id ?? ''}">
+                <span class="display-value">${escapeHtml(item.category_name ?? '手動輸入')}</span>
+                <select class="editable-select form-select">${categoryOptions(item.category_id)}</select>
+            </td>
+            <td>${typeBadge(item)}</td>
+            <td class="text-end editable-cell" data-item-id="${item.id}" data-field="item_price">
+                <span class="display-value currency-field">${formatAsCurrency(item.price)}</span>
+                <input type="number" class="text-end editable-input currency-field" value="${item.price}">
+            </td>`;
+    }
+
+    function transactionRows(transaction) {
+        const span = Math.max(transaction.items.length, 1);
+        const items = transaction.items.length > 0 ? transaction.items : [null];
+        return items.map((item, index) => {
+            const cells = item ? itemCells(item) : '<td></td><td></td><td></td>';
+            if (index > 0) return `<tr data-id="${transaction.id}">${cells}</tr>`;
+            return `
+                <tr data-id="${transaction.id}">
+                    <td rowspan="${span}">${escapeHtml(transaction.timestamp)}</td>
+                    <td rowspan="${span}">${escapeHtml(transaction.location_name)}</td>
+                    ${cells}
+                    <td rowspan="${span}" class="text-end editable-cell" data-field="cash_received">
+                        <span class="display-value currency-field">${formatAsCurrency(transaction.cash_received)}</span>
+                        <input type="number" class="text-end editable-input currency-field" value="${transaction.cash_received || 0}">
+                    </td>
+                    <td rowspan="${span}" class="text-end fw-bold" data-field="amount">${formatAsCurrency(transaction.amount)}</td>
+                    <td rowspan="${span}" class="text-end fw-bold" data-field="change_given">${formatAsCurrency(transaction.change_given)}</td>
+                </tr>`;
+        }).join('');
+    }
+
+    function setStatus(html) {
+        statusElement.innerHTML = html;
+    }
+
+    async function loadNextPage() {
+        // 編輯中暫停載入，避免新列缺少取消編輯時需要的原始資料
+        if (loading || finished || container.classList.contains('editing')) return;
+        loading = true;
+        let loaded = false;
+        try {
+            const url = new URL(tbody.dataset.apiUrl, window.location.origin);
+            if (cursor) {
+                url.searchParams.set('after_timestamp', cursor.after_timestamp);
+                url.searchParams.set('after_id', cursor.after_id);
+            }
+            const response = await fetch(url);
+            if (!response.ok) throw new Error(`HTTP ${response.status}`);
+            const page = await response.json();
+
+            tbody.insertAdjacentHTML('beforeend', page.transactions.map(transactionRows).join(''));
+            cursor = page.next_cursor;
+            finished = !cursor;
+            if (finished) {
+                setStatus(tbody.children.length === 0 ? '找不到任何交易紀錄。' : '已載入全部交易。');
+            } else {
+                setStatus('<button type="button" class="btn btn-sm btn-outline-secondary">載入更多</button>');
+            }
+            loaded = true;
+        } catch (error) {
+            console.error('載入交易明細失敗:', error);
+            setStatus('<button type="button" class="btn btn-sm btn-outline-danger">載入失敗，點此重試</button>');
+        } finally {
+            loading = false;
+        }
+        // 載入後狀態列仍在畫面內時 (資料不足一頁高) 繼續載入，觀察器不會再次觸發
+        if (loaded && !finished && statusElement.getBoundingClientRect().top < window.innerHeight) {
+            loadNextPage();
+        }
+    }
+
+    statusElement.addEventListener('click', event => {
+        if (event.target.tagName === 'BUTTON') loadNextPage();
+    });
+
+    // 狀態列進入畫面時自動載入下一頁
+    const observer = new IntersectionObserver(entries => {
+        if (entries.some(entry => entry.isIntersecting)) loadNextPage();
+    }, { rootMargin: '400px' });
+    observer.observe(statusElement);
+
+    loadNextPage();
+});
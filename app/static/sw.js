@@ -1,9 +1,71 @@
-// 一個最小化的 Service Worker，主要目的是宣告 App 的存在
+// POS 的 Service Worker：預先快取收銀頁面所需的靜態資源，讓場地網路不穩時仍能開啟 POS
+const SHELL_CACHE = 'pos-shell-v2';
+const PAGE_CACHE = 'pos-pages-v2';
+
+const SHELL_ASSETS = [
+  '/static/js/pos_queue.js',
+  '/static/js/pos_scripts.js',
+  '/static/manifest.json',
+  '/static/images/logo.png',
+  'https://cdn.jsdelivr.net/npm/bootstrap@5.3.3/dist/css/bootstrap.min.css',
+  'https://cdn.jsdelivr.net/npm/bootstrap@5.3.3/dist/js/bootstrap.bundle.min.js'
+];
+
 self.addEventListener('install', (event) => {
-  console.log('Service Worker installing.');
+  event.waitUntil(
+    caches.open(SHELL_CACHE)
+      .then((cache) => cache.addAll(SHELL_ASSETS))
+      .then(() => self.skipWaiting())
+  );
 });
 
+self.addEventListener('activate', (event) => {
+  event.waitUntil(
+    caches.keys()
+      .then((keys) => Promise.all(
+        keys.filter((key) => key !== SHELL_CACHE && key !== PAGE_CACHE).map((key) => caches.delete(key))
+      ))
+      .then(() => self.clients.claim())
+  );
+});
+
+// POS 頁面：網路優先，成功時更新快取；離線時改用最後一次成功載入的版本
+function networkFirstPage(request) {
+  return fetch(request)
+    .then((response) => {
+      if (response.ok) {
+        const copy = response.clone();
+        caches.open(PAGE_CACHE).then((cache) => cache.put(request, copy));
+      }
+      return response;
+    })
+    .catch(() => caches.match(request, { cacheName: PAGE_CACHE })
+      .then((cached) => cached || Response.error()));
+}
+
+// 靜態資源：快取優先，背景不再更新 (版本變更時請調整 SHELL_CACHE 名稱)
+function cacheFirstAsset(request) {
+  return caches.match(request, { cacheName: SHELL_CACHE })
+    .then((cached) => cached || fetch(request));
+}
+
 self.addEventListener('fetch', (event) => {
-  // 這個簡單的 fetch 監聽器是讓 iOS 觸發「安裝到主畫面」提示的關鍵之一
-  event.respondWith(fetch(event.request));
-});
\ No newline at end of file
+  const request = event.request;
+  // 交易寫入等非 GET 請求一律直接送往網路，由前端的 IndexedDB 佇列負責重試
+  if (request.method !== 'GET') {
+    return;
+  }
+
+  const url = new URL(request.url);
+  if (request.mode === 'navigate' && url.pathname.startsWith('/cashier/pos/')) {
+    event.respondWith(networkFirstPage(request));
+    return;
+  }
+  if (SHELL_ASSETS.includes(url.origin === self.location.origin ? url.pathname : request.url)) {
+    event.respondWith(cacheFirstAsset(request));
+    return;
+  }
+
+  // 這個 fetch 監聽器也是讓 iOS 觸發「安裝到主畫面」提示的關鍵之一
+  event.respondWith(fetch(request));
+});
@@ -22,8 +22,14 @@ flask db migrate -m "Initial migration"
 echo "套用資料庫遷移..."
 flask db upgrade
 
+echo "--> 重建報表彙總資料"
+flask report backfill-category-totals
+flask report backfill-hourly-totals
+flask report backfill-monthly-totals
+
 echo "--> 初始化後台角色與管理員帳號"
 flask auth init-roles
 flask auth create-user root password --role Admin
 
-echo "部署建置與初始化設定完成。"
\ No newline at end of file
+echo "部署建置與初始化設定完成。"
+echo "請以 'rq worker cashier-tasks --with-scheduler' 啟動背景任務 worker (雲端同步的延遲任務需要排程器)。"
\ No newline at end of file
@@ -68,7 +68,7 @@ echo "
 請手動完成以下步驟：
 - 啟用虛擬環境：'source .venv/bin/activate'
 - 啟動 Flask 伺服器：'flask run'
-- 在另一個終端機中，啟動 RQ worker：'rq worker cashier-tasks' 或 'rq worker cashier-tasks --url redis://localhost:6379/0'
+- 在另一個終端機中，啟動 RQ worker：'rq worker cashier-tasks --with-scheduler' 或 'rq worker cashier-tasks --with-scheduler --url redis://localhost:6379/0'
 - 將 Google API 憑證 (client_secret.json 和 token.json) 放置到 instance/ 資料夾中。
 =====================================================
 "
\ No newline at end of file
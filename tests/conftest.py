@@ -0,0 +1,111 @@
+# tests/conftest.py
+# 測試使用暫存的 SQLite 資料庫與 fakeredis，不需要實際的 Redis 與 Google 服務。
+from datetime import date, datetime
+
+import pytest
+
+fakeredis = pytest.importorskip("fakeredis")
+
+
+def _reset_process_caches():
+    """清除行程內的快取；每個測試使用新的資料庫與 Redis，版本號會從 0 重新開始。"""
+    from app.services import business_day_service, category_service, reference_data_service
+
+    business_day_service._state.update(version=None, entries={})
+    category_service._catalogs.clear()
+    reference_data_service._state['data'] = None
+
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    import rq
+    from app import create_app, db
+    from app.models import Role, User, Location, Category
+
+    monkeypatch.setenv('DATABASE_URL', f"sqlite:///{tmp_path / 'test.db'}")
+    app = create_app()
+    app.config.update(TESTING=True, WTF_CSRF_ENABLED=False, PDF_RENDER_WORKERS=0)
+    app.redis = fakeredis.FakeRedis()
+    app.task_queue = rq.Queue('cashier-tasks', connection=app.redis)
+    _reset_process_caches()
+
+    with app.app_context():
+        db.create_all()
+        role = Role(name='Admin')
+        user = User(username='admin')
+        user.set_password('password')
+        user.roles.append(role)
+        location = Location(name='本舖', slug='main')
+        db.session.add_all([role, user, location])
+        db.session.flush()
+        db.session.add_all([
+            Category(name='書', location_id=location.id, category_type='product'),
+            Category(name='衣', location_id=location.id, category_type='product'),
+            Category(name='折扣', location_id=location.id, category_type='discount_fixed'),
+            Category(name='捐款', location_id=location.id, category_type='other_income'),
+        ])
+        db.session.commit()
+
+    yield app
+
+    with app.app_context():
+        db.session.remove()
+        db.drop_all()
+    _reset_process_caches()
+
+
+@pytest.fixture
+def client(app):
+    """以管理員身分登入的測試用戶端。"""
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = '1'
+        session['_fresh'] = True
+    return client
+
+
+@pytest.fixture
+def categories(app):
+    """據點 main 的類別 id，以名稱為鍵。"""
+    from app.models import Category
+
+    with app.app_context():
+        return {category.name: category.id for category in Category.query.all()}
+
+
+@pytest.fixture
+def make_business_day(app):
+    """建立營業日並回傳其 id；status 預設為營業中。"""
+    from app import db
+    from app.models import BusinessDay
+
+    def make(day=None, status='OPEN', opening_cash=1000, **fields):
+        with app.app_context():
+            business_day = BusinessDay(date=day or date.today(), location_id=1, status=status,
+                                       opening_cash=opening_cash, **fields)
+            db.session.add(business_day)
+            db.session.commit()
+            return business_day.id
+    return make
+
+
+@pytest.fixture
+def make_transaction(app):
+    """在營業日中建立一筆交易與其品項 [(類別 id, 金額)]，並累加類別彙總；回傳交易 id。"""
+    from app import db
+    from app.models import Transaction, TransactionItem
+    from app.services.category_totals_service import add_item_totals
+
+    def make(business_day_id, items, timestamp=None, cash_received=None):
+        with app.app_context():
+            transaction = Transaction(
+                business_day_id=business_day_id, amount=sum(price for _, price in items), item_count=len(items),
+                cash_received=cash_received, timestamp=timestamp or datetime.utcnow())
+            db.session.add(transaction)
+            for category_id, price in items:
+                db.session.add(TransactionItem(transaction=transaction, category_id=category_id, price=price))
+            add_item_totals(business_day_id, [{'category_id': category_id, 'price': price} for category_id, price in items])
+            db.session.commit()
+            return transaction.id
+    return make
+
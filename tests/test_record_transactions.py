@@ -0,0 +1,156 @@
+# tests/test_record_transactions.py
+from datetime import date, datetime, timedelta, timezone
+
+from sqlalchemy import false
+
+
+def _items(categories, price=100):
+    return [{'price': price, 'category_id': str(categories['書'])}]
+
+
+def _transaction_count(app):
+    from app.models import Transaction
+
+    with app.app_context():
+        return Transaction.query.count()
+
+
+def _business_day(app, business_day_id):
+    from app import db
+    from app.models import BusinessDay
+
+    with app.app_context():
+        return db.session.get(BusinessDay, business_day_id)
+
+
+def test_duplicate_key_is_recorded_once(app, client, categories, make_business_day):
+    business_day_id = make_business_day()
+    payload = {'location_slug': 'main', 'items': _items(categories), 'idempotency_key': 'k1'}
+
+    first = client.post('/cashier/record_transaction', json=payload).get_json()
+    replay = client.post('/cashier/record_transaction', json=payload).get_json()
+
+    assert first['success'] and not first.get('duplicate')
+    assert replay['duplicate'] is True
+    assert replay['total_sales'] == first['total_sales'] == 100
+    assert _transaction_count(app) == 1
+    assert _business_day(app, business_day_id).total_transactions == 1
+
+
+def test_duplicate_key_is_recorded_once_without_response_cache(app, client, categories, make_business_day):
+    make_business_day()
+    payload = {'location_slug': 'main', 'items': _items(categories), 'idempotency_key': 'k1'}
+
+    client.post('/cashier/record_transaction', json=payload)
+    app.redis.flushall()
+    replay = client.post('/cashier/record_transaction', json=payload).get_json()
+
+    assert replay['duplicate'] is True
+    assert _transaction_count(app) == 1
+
+
+def test_idempotency_key_header(app, client, categories, make_business_day):
+    make_business_day()
+    payload = {'location_slug': 'main', 'items': _items(categories)}
+
+    client.post('/cashier/record_transaction', json=payload, headers={'Idempotency-Key': 'h1'})
+    replay = client.post('/cashier/record_transaction', json=payload, headers={'Idempotency-Key': 'h1'}).get_json()
+
+    assert replay['duplicate'] is True
+    assert _transaction_count(app) == 1
+
+
+def test_non_string_idempotency_key_is_rejected(app, client, categories, make_business_day):
+    make_business_day()
+    for key in (123, ['k1'], {'k': 1}, True):
+        response = client.post('/cashier/record_transaction',
+                               json={'location_slug': 'main', 'items': _items(categories), 'idempotency_key': key})
+        assert response.status_code == 400
+    assert _transaction_count(app) == 0
+
+
+def test_batch_skips_keys_already_recorded(app, client, categories, make_business_day):
+    business_day_id = make_business_day()
+    client.post('/cashier/record_transaction',
+                json={'location_slug': 'main', 'items': _items(categories), 'idempotency_key': 'k1'})
+
+    response = client.post('/cashier/record_transactions_batch', json={'location_slug': 'main', 'transactions': [
+        {'client_id': 'k1', 'items': _items(categories)},
+        {'client_id': 'k2', 'items': _items(categories)},
+        {'client_id': 'k2', 'items': _items(categories)},
+    ]})
+    data = response.get_json()
+
+    assert response.status_code == 200
+    assert data['accepted'] == ['k1', 'k2', 'k2']
+    assert data['rejected'] == []
+    assert _transaction_count(app) == 2
+    assert _business_day(app, business_day_id).total_sales == 200
+
+
+def test_batch_rejects_invalid_entries_without_failing_the_batch(app, client, categories, make_business_day):
+    make_business_day()
+    response = client.post('/cashier/record_transactions_batch', json={'location_slug': 'main', 'transactions': [
+        'not a transaction',
+        {'client_id': 5, 'items': _items(categories)},
+        {'client_id': 'x' * 65, 'items': _items(categories)},
+        {'client_id': 'empty', 'items': []},
+        {'client_id': 'bad-price', 'items': [{'price': 'abc', 'category_id': categories['書']}]},
+        {'client_id': 'bad-category', 'items': [{'price': 10, 'category_id': 9999}]},
+        {'client_id': 'ok', 'items': _items(categories)},
+    ]})
+    data = response.get_json()
+
+    assert response.status_code == 200
+    assert data['accepted'] == ['ok']
+    assert [entry['client_id'] for entry in data['rejected']] == [None, 5, 'x' * 65, 'empty', 'bad-price', 'bad-category']
+    assert _transaction_count(app) == 1
+
+
+def test_batch_rejects_transactions_for_a_closed_day(app, client, categories, make_business_day):
+    yesterday = date.today() - timedelta(days=1)
+    make_business_day(day=yesterday, status='CLOSED')
+    make_business_day()
+    timestamp = datetime.combine(yesterday, datetime.min.time().replace(hour=12)).astimezone(timezone.utc)
+
+    response = client.post('/cashier/record_transactions_batch', json={'location_slug': 'main', 'transactions': [
+        {'client_id': 'late', 'items': _items(categories), 'timestamp': timestamp.isoformat()},
+        {'client_id': 'today', 'items': _items(categories)},
+    ]})
+    data = response.get_json()
+
+    assert data['accepted'] == ['today']
+    assert len(data['rejected']) == 1
+    rejected = data['rejected'][0]
+    assert rejected['client_id'] == 'late'
+    assert rejected['status'] == 'needs_manual_entry'
+    assert rejected['business_date'] == yesterday.isoformat()
+    assert rejected['amount'] == 100
+    assert _transaction_count(app) == 1
+
+
+def test_batch_returns_409_when_a_key_is_written_concurrently(app, client, categories, make_business_day, monkeypatch):
+    from app import db
+    from app.models import Transaction
+
+    business_day_id = make_business_day()
+    original_query = db.session.query
+
+    def query_missing_concurrent_write(*entities, **kwargs):
+        # 模擬另一個請求在讀取已寫入的 client_id 之後才寫入同一筆交易
+        if entities == (Transaction.idempotency_key,):
+            db.session.add(Transaction(business_day_id=business_day_id, amount=100, item_count=1,
+                                       idempotency_key='k1'))
+            db.session.flush()
+            db.session.commit()
+            return original_query(*entities, **kwargs).filter(false())
+        return original_query(*entities, **kwargs)
+
+    monkeypatch.setattr(db.session, 'query', query_missing_concurrent_write)
+    response = client.post('/cashier/record_transactions_batch', json={
+        'location_slug': 'main', 'transactions': [{'client_id': 'k1', 'items': _items(categories)}]})
+    monkeypatch.undo()
+
+    assert response.status_code == 409
+    assert _transaction_count(app) == 1
+    assert _business_day(app, business_day_id).total_transactions in (None, 0)
@@ -0,0 +1,69 @@
+# tests/test_report_cache.py
+from datetime import date, timedelta
+
+import pytest
+
+DAY = date.today() - timedelta(days=1)
+
+
+@pytest.fixture
+def closed_day(make_business_day, make_transaction, categories):
+    business_day_id = make_business_day(day=DAY, status='CLOSED', total_sales=100)
+    make_transaction(business_day_id, [(categories['書'], 100)])
+    return business_day_id
+
+
+def _opening_cash(app):
+    from app.services.report_service import get_report
+
+    with app.app_context():
+        rows = get_report('daily_summary', 'all', [(DAY, DAY)])['rows']
+        return rows[0]['opening_cash']
+
+
+def _set_opening_cash_without_invalidation(app, business_day_id, value):
+    from app import db
+    from app.models import BusinessDay
+
+    with app.app_context():
+        db.session.get(BusinessDay, business_day_id).opening_cash = value
+        db.session.commit()
+
+
+def test_closed_period_is_served_from_cache(app, closed_day):
+    assert _opening_cash(app) == 1000
+    _set_opening_cash_without_invalidation(app, closed_day, 1)
+
+    assert _opening_cash(app) == 1000
+
+
+def test_saving_report_data_invalidates_cached_reports(app, client, closed_day):
+    assert _opening_cash(app) == 1000
+
+    response = client.post('/report/save_daily_summary_data', json=[{'id': closed_day, 'opening_cash': 500}])
+
+    assert response.get_json()['success']
+    assert _opening_cash(app) == 500
+
+
+def test_deleting_a_category_invalidates_cached_reports(app, client, categories, closed_day):
+    from app import db
+    from app.models import Category
+
+    assert _opening_cash(app) == 1000
+    _set_opening_cash_without_invalidation(app, closed_day, 1)
+
+    response = client.post(f"/admin/categories/{categories['捐款']}/delete")
+
+    assert response.status_code == 302
+    with app.app_context():
+        assert db.session.get(Category, categories['捐款']) is None
+    assert _opening_cash(app) == 1
+
+
+def test_open_days_are_not_cached(app, make_business_day):
+    business_day_id = make_business_day(day=DAY)
+    assert _opening_cash(app) == 1000
+    _set_opening_cash_without_invalidation(app, business_day_id, 1)
+
+    assert _opening_cash(app) == 1
@@ -0,0 +1,83 @@
+# tests/test_report_edits.py
+import json
+from datetime import date, timedelta
+
+DAY = date.today() - timedelta(days=1)
+
+
+def _load(app, model, id_):
+    from app import db
+
+    with app.app_context():
+        return db.session.get(model, id_)
+
+
+def _item_ids(app, transaction_id):
+    from app.models import TransactionItem
+
+    with app.app_context():
+        return [item.id for item in TransactionItem.query.filter_by(transaction_id=transaction_id).order_by(TransactionItem.id)]
+
+
+def test_transaction_edits_recompute_transactions_and_days(app, client, categories, make_business_day, make_transaction):
+    from app.models import BusinessDay, BusinessDayCategoryTotal, Transaction
+
+    business_day_id = make_business_day(day=DAY, status='CLOSED', closing_cash=1500, total_sales=300)
+    first = make_transaction(business_day_id, [(categories['書'], 100), (categories['衣'], 50)], cash_received=200)
+    second = make_transaction(business_day_id, [(categories['書'], 150)], cash_received=150)
+    book, clothes = _item_ids(app, first)
+
+    response = client.post('/report/save_transaction_log_data', json=[
+        {'id': first, 'cash_received': 500, 'items': [
+            {'id': book, 'price': 300, 'category_id': categories['書']},
+            {'id': clothes, 'price': 80, 'category_id': categories['書']},
+        ]},
+    ])
+
+    assert response.get_json()['success']
+    transaction = _load(app, Transaction, first)
+    assert transaction.amount == 380
+    assert transaction.cash_received == 500
+    assert transaction.change_given == 120
+    assert _load(app, Transaction, second).amount == 150
+
+    business_day = _load(app, BusinessDay, business_day_id)
+    assert business_day.total_sales == 530
+    assert business_day.expected_cash == 1530
+    assert business_day.cash_diff == -30
+
+    with app.app_context():
+        totals = {total.category_id: (total.item_count, total.gross)
+                  for total in BusinessDayCategoryTotal.query.filter_by(business_day_id=business_day_id)}
+    assert totals == {categories['書']: (3, 530)}
+
+
+def test_opening_cash_edits_recompute_expected_cash(app, client, make_business_day):
+    from app.models import BusinessDay
+
+    first = make_business_day(day=DAY, status='CLOSED', closing_cash=1500, total_sales=300)
+    second = make_business_day(day=DAY - timedelta(days=1), status='CLOSED', closing_cash=900, total_sales=0)
+
+    response = client.post('/report/save_daily_summary_data', json=[
+        {'id': first, 'opening_cash': 1100}, {'id': second, 'opening_cash': 1000}, {'id': 9999, 'opening_cash': 1}])
+
+    assert response.get_json()['success']
+    first_day, second_day = _load(app, BusinessDay, first), _load(app, BusinessDay, second)
+    assert (first_day.opening_cash, first_day.expected_cash, first_day.cash_diff) == (1100, 1400, 100)
+    assert (second_day.opening_cash, second_day.expected_cash, second_day.cash_diff) == (1000, 1000, -100)
+
+
+def test_cash_breakdown_edits_recompute_closing_cash(app, client, make_business_day):
+    from app.models import BusinessDay
+
+    business_day_id = make_business_day(day=DAY, status='CLOSED', closing_cash=0, total_sales=300)
+
+    response = client.post('/report/save_cash_check_data', json=[
+        {'id': business_day_id, 'cash_breakdown': {'1000': 1, '100': 2, '5': 1}}])
+
+    assert response.get_json()['success']
+    business_day = _load(app, BusinessDay, business_day_id)
+    assert json.loads(business_day.cash_breakdown) == {'1000': 1, '100': 2, '5': 1}
+    assert business_day.closing_cash == 1205
+    assert business_day.expected_cash == 1300
+    assert business_day.cash_diff == -95
@@ -0,0 +1,41 @@
+# tests/test_transaction_log_api.py
+from datetime import date, datetime
+
+
+def _fetch_all(client, limit, **params):
+    pages, cursor = [], {}
+    while True:
+        response = client.get('/report/api/transaction_log', query_string=dict(
+            params, limit=limit, **cursor))
+        assert response.status_code == 200
+        data = response.get_json()
+        pages.append([transaction['id'] for transaction in data['transactions']])
+        if data['next_cursor'] is None:
+            return pages
+        cursor = data['next_cursor']
+
+
+def test_pages_cover_transactions_with_equal_timestamps_once(client, categories, make_business_day, make_transaction):
+    business_day_id = make_business_day(status='CLOSED')
+    same_time = datetime.combine(date.today(), datetime.min.time().replace(hour=10))
+    later = same_time.replace(hour=11)
+    ids = [make_transaction(business_day_id, [(categories['書'], 100)], timestamp=same_time) for _ in range(5)]
+    ids.append(make_transaction(business_day_id, [(categories['衣'], 50)], timestamp=later))
+
+    pages = _fetch_all(client, 2, start_date=date.today().isoformat())
+
+    assert pages == [ids[0:2], ids[2:4], ids[4:6]]
+
+
+def test_last_page_has_no_cursor(client, categories, make_business_day, make_transaction):
+    business_day_id = make_business_day(status='CLOSED')
+    ids = [make_transaction(business_day_id, [(categories['書'], 100)]) for _ in range(2)]
+
+    assert _fetch_all(client, 2, start_date=date.today().isoformat()) == [ids]
+
+
+def test_invalid_cursor_is_rejected(client):
+    response = client.get('/report/api/transaction_log', query_string={
+        'start_date': date.today().isoformat(), 'after_timestamp': 'not-a-time', 'after_id': 1})
+
+    assert response.status_code == 400